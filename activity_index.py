@@ -0,0 +1,204 @@
+"""
+Activity Index
+SQLite index (data/activity.db) over the JSON-lines activity log, for queries
+like "who deleted what last week" across millions of events. The log files
+stay the source of truth: the index remembers how far into which file (by
+inode, so rotation doesn't lose its place) it has read and catches up from
+there, which also backfills it from the existing segments the first time.
+Rows are keyed in log order, so a row id is also the pagination cursor.
+"""
+
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+import file_lock
+
+BATCH_ROWS = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    ts INTEGER NOT NULL,
+    timestamp TEXT, action TEXT, filename TEXT, ip TEXT, user TEXT
+);
+CREATE INDEX IF NOT EXISTS events_ts ON events(ts);
+CREATE INDEX IF NOT EXISTS events_action ON events(action);
+CREATE INDEX IF NOT EXISTS events_ip ON events(ip);
+CREATE TABLE IF NOT EXISTS position (id INTEGER PRIMARY KEY CHECK (id = 0), ino INTEGER, offset INTEGER);
+"""
+
+# Substring search on filenames; needs SQLite 3.34+ built with FTS5, otherwise LIKE scans
+NAME_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS event_names USING fts5(filename, content='events', content_rowid='id', tokenize='trigram');
+CREATE TRIGGER IF NOT EXISTS events_name_insert AFTER INSERT ON events BEGIN
+    INSERT INTO event_names (rowid, filename) VALUES (new.id, new.filename);
+END;
+"""
+SKEW = 60  # seconds entries from different workers can be out of order in the log
+# Entries logged before "ts" was recorded only have local time, which repeats an hour when DST ends
+LEGACY_SKEW = 3600 + SKEW
+INT_MIN, INT_MAX = -2 ** 63, 2 ** 63 - 1  # SQLite INTEGER range
+
+def clamp(value):
+    return max(INT_MIN, min(INT_MAX, value))
+
+def parse_time(value):
+    """Epoch seconds from a number or a local "YYYY-MM-DD[ HH:MM[:SS]]" string"""
+    try:
+        return clamp(int(float(value)))
+    except ValueError:
+        return int(datetime.fromisoformat(value.strip().replace("T", " ")).timestamp())
+
+def _row(entry):
+    stamp = entry.get("timestamp", "")
+    ts = entry.get("ts")
+    try:
+        ts = clamp(int(ts if isinstance(ts, (int, float)) else datetime.fromisoformat(stamp).timestamp()))
+    except (TypeError, ValueError, OverflowError):
+        ts = 0
+    return (ts, stamp, entry.get("action"), entry.get("filename"), entry.get("ip"), entry.get("user"))
+
+class ActivityIndex:
+    def __init__(self, db_file, log_file, segments):
+        """
+        Args:
+            db_file: SQLite database path
+            log_file: The live JSON-lines log
+            segments: Callable returning the rotated segments, oldest first
+        """
+        self.db_file = db_file
+        self.log_file = log_file
+        self.segments = segments
+        self.local = threading.local()
+        self.names = True
+
+    def _conn(self):
+        # sqlite3 connections can't be shared between threads: one per thread, opened on first use
+        conn = getattr(self.local, "conn", None)
+        if conn is None or self.local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
+            conn = sqlite3.connect(self.db_file, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            try:
+                conn.executescript(NAME_SCHEMA)
+            except sqlite3.OperationalError:
+                self.names = False
+            self.local.conn, self.local.pid = conn, os.getpid()
+        return conn
+
+    def _open_unread(self, ino, offset):
+        """Open files holding entries past (ino, offset), oldest first, as [(file, start_offset)]"""
+        # Under the log lock so a rotation can't slip between listing and opening
+        with file_lock.locked(self.log_file):
+            try:
+                live = open(self.log_file, "rb")
+            except OSError:
+                return []
+            live_ino = os.fstat(live.fileno()).st_ino
+            if live_ino == ino:
+                return [(live, offset)]
+            opened = []
+            for path in self.segments():
+                try:
+                    f = open(path, "rb")
+                except OSError:
+                    continue
+                if os.fstat(f.fileno()).st_ino == ino:
+                    for older, _ in opened: older.close()
+                    opened = [(f, offset)]  # where we left off; newer segments follow
+                elif ino is None or opened:
+                    opened.append((f, 0))
+                else:
+                    f.close()
+            if ino is not None and not opened:
+                print("Activity index: log segment went missing, resuming from the live file")
+            return opened + [(live, 0)]
+
+    def catch_up(self):
+        """Index everything appended to the log since the last call. Returns rows added."""
+        conn = self._conn()
+        added = 0
+        with file_lock.locked(self.db_file):
+            row = conn.execute("SELECT ino, offset FROM position WHERE id = 0").fetchall()
+            ino, offset = row[0] if row else (None, 0)
+            files = self._open_unread(ino, offset)
+            try:
+                for f, start in files:
+                    st = os.fstat(f.fileno())
+                    if start > st.st_size:
+                        start = 0  # not the file we were reading after all
+                    f.seek(start)
+                    rows, pos = [], start
+                    for line in f:
+                        if not line.endswith(b"\n"):
+                            break  # still being written
+                        pos += len(line)
+                        try:
+                            rows.append(_row(json.loads(line)))
+                        except ValueError:
+                            pass
+                        if len(rows) >= BATCH_ROWS:
+                            added += self._store(conn, rows, f, pos)
+                            rows = []
+                    if rows or (st.st_ino, pos) != (ino, offset):
+                        added += self._store(conn, rows, f, pos)
+            finally:
+                for f, _ in files:
+                    f.close()
+        return added
+
+    def _store(self, conn, rows, f, pos):
+        with conn:
+            conn.executemany("INSERT INTO events (ts, timestamp, action, filename, ip, user) VALUES (?, ?, ?, ?, ?, ?)", rows)
+            conn.execute("INSERT OR REPLACE INTO position (id, ino, offset) VALUES (0, ?, ?)", (os.fstat(f.fileno()).st_ino, pos))
+        return len(rows)
+
+    def query(self, since=None, until=None, action=None, ip=None, filename=None, cursor=None, limit=100):
+        """
+        Matching events, newest first.
+        Args:
+            since / until: Epoch seconds, inclusive / exclusive
+            action, ip: Exact match
+            filename: Case-insensitive substring
+            cursor: `next_cursor` of the previous page
+        Returns:
+            dict: {"entries": [...], "next_cursor": int or None}
+        """
+        conn = self._conn()
+        # Out-of-range numbers would make sqlite3 raise OverflowError
+        since, until, cursor = (clamp(v) if v is not None else None for v in (since, until, cursor))
+        where, args = [], []
+        if since is not None or until is not None:
+            # Rows are in log order and ts lags log order by at most the skew, so every match lies after
+            # the last row well before `since` and before the first row well past `until`. Both are
+            # found on the ts index; the scan then runs over ids, which also keeps ORDER BY id cheap
+            lo = (conn.execute("SELECT id FROM events WHERE ts < ? ORDER BY ts DESC, id DESC LIMIT 1",
+                               (clamp(since - LEGACY_SKEW),)).fetchone() if since is not None else None)
+            hi = (conn.execute("SELECT id FROM events WHERE ts >= ? ORDER BY ts, id LIMIT 1",
+                               (clamp(until + LEGACY_SKEW),)).fetchone() if until is not None else None)
+            where.append("e.id > ? AND e.id < ?")
+            args += [lo[0] if lo else INT_MIN, hi[0] if hi else INT_MAX]
+        for clause, value in (("e.ts >= ?", since), ("e.ts < ?", until), ("e.action = ?", action),
+                              ("e.ip = ?", ip), ("e.id < ?", cursor)):
+            if value is not None:
+                where.append(clause)
+                args.append(value)
+        sql = "SELECT e.id, e.timestamp, e.action, e.filename, e.ip, e.user FROM events e"
+        if filename and self.names and len(filename) >= 3:
+            # Walk the trigram index newest first and stop after a page
+            sql = sql.replace("FROM events e", "FROM event_names n JOIN events e ON e.id = n.rowid")
+            where.insert(0, "event_names MATCH ?")
+            args.insert(0, '"' + filename.replace('"', '""') + '"')
+        elif filename:
+            where.append("e.filename LIKE ? ESCAPE '\\'")
+            args.append("%" + filename.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        rows = conn.execute(sql + " ORDER BY e.id DESC LIMIT ?", args + [limit + 1]).fetchall()
+        entries = [{"timestamp": r[1], "action": r[2], "filename": r[3], "ip": r[4], "user": r[5]} for r in rows[:limit]]
+        return {"entries": entries, "next_cursor": rows[limit - 1][0] if len(rows) > limit else None}
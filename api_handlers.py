@@ -1,93 +1,246 @@
 import os
 import json
+import base64
 import time
 import shutil
-import platform
-import zipfile
-import cgi
-import psutil
+import threading
+import uuid
 from urllib.parse import parse_qs
+import activity_index
 import audit_logger
+import byte_ranges
+import event_stream
+import file_transfer
+import fs_events
+import http_cache
+import listing_cache
+import multipart_stream
+import resumable_upload
+import thumbnails
+import zip_stream
 
-def handle_list(handler, parsed, UPLOAD_ROOT, ADMIN_KEY, HIDDEN_FOLDERS, safe_join):
+def send_body(handler, body, content_type=None, status=200):
+    """Send a complete response with Content-Length so HTTP/1.1 connections stay reusable"""
+    handler.send_response(status)
+    if content_type:
+        handler.send_header("Content-Type", content_type)
+    handler.send_header("Content-Length", str(len(body)))
+    handler.end_headers()
+    handler.wfile.write(body)
+
+def send_json(handler, obj, status=200):
+    send_body(handler, json.dumps(obj).encode(), "application/json", status)
+
+def handle_list(handler, parsed, UPLOAD_ROOT, ADMIN_KEY, HIDDEN_FOLDERS, safe_join, cache, on_view=None, comments=None):
     query = parse_qs(parsed.query)
     rel_path = query.get("path", [""])[0]
     is_admin = (query.get("show_hidden", [""])[0] == ADMIN_KEY)
     abs_path = safe_join(UPLOAD_ROOT, rel_path)
-    if not (os.path.exists(abs_path) and os.path.isdir(abs_path)):
+    try:
+        record = cache.get(abs_path)
+    except (FileNotFoundError, NotADirectoryError):
         handler.send_error(404)
         return
-
-    items = []
-    try:
-        with os.scandir(abs_path) as it:
-            for entry in it:
-                if not is_admin and entry.name in HIDDEN_FOLDERS:
-                    continue
-                try:
-                    s_size = entry.stat().st_size if entry.is_file() else 0
-                except OSError:
-                    s_size = 0
-                items.append({
-                    "name": entry.name,
-                    "is_dir": entry.is_dir(),
-                    "size": s_size
-                })
     except OSError:
         handler.send_error(500, "Unable to scan directory")
         return
+    if on_view: on_view(abs_path)
+    # Comment counts for the whole folder in one lookup, kept out of the cached listing
+    counts = comments.counts(rel_path) if comments else {}
+    if not is_admin:
+        counts = {name: n for name, n in counts.items() if name not in HIDDEN_FOLDERS}
+    counts_json = json.dumps(counts).encode()
+
+    sort = query.get("sort", ["name"])[0]
+    descending = query.get("order", ["asc"])[0] == "desc"
+    limit = query.get("limit", [""])[0]
+    cursor = query.get("cursor", [""])[0]
+    if sort not in listing_cache.SORT_KEYS or (limit and (not limit.isdigit() or int(limit) == 0)):
+        handler.send_error(400, "Invalid sort or limit")
+        return
 
-    items.sort(key=lambda x: (not x["is_dir"], x["name"].lower()))
-    data = json.dumps({"path": rel_path, "items": items}).encode()
+    if sort == "name" and not descending and not limit and not cursor:
+        # Plain listing: the whole body is cached pre-serialized
+        key = (rel_path, is_admin)
+        data = record["json"].get(key)
+        if data is None:
+            items = record["items"] if is_admin else [i for i in record["items"] if i["name"] not in HIDDEN_FOLDERS]
+            data = json.dumps({"path": rel_path, "items": items}).encode()
+            record["json"][key] = data
+        send_body(handler, data[:-1] + b', "comments": ' + counts_json + b"}", "application/json")
+        return
+
+    items, keys = listing_cache.sorted_view(record, sort, descending)
+    start = 0
+    if cursor:
+        try:
+            c_sort, c_desc, group, inner = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+            valid = c_sort == sort and c_desc == descending  # a cursor only makes sense in its own order
+            if valid:
+                start = listing_cache.page_after(keys, (group, tuple(inner)), descending)
+        except Exception:
+            valid = False
+        if not valid:
+            handler.send_error(400, "Invalid cursor")
+            return
+    limit = int(limit) if limit else len(items)
+
+    # Stream the page item by item instead of building one big JSON string
     handler.send_response(200)
     handler.send_header("Content-Type", "application/json")
-    handler.end_headers()
-    handler.wfile.write(data)
+    out = file_transfer.start_streaming(handler) or handler.wfile
+    out.write(f'{{"path": {json.dumps(rel_path)}, "items": ['.encode())
+    sent, pos, last = 0, start, None
+    while pos < len(items) and sent < limit:
+        item = items[pos]
+        pos += 1
+        if not is_admin and item["name"] in HIDDEN_FOLDERS:
+            continue
+        out.write((", " if sent else "").encode() + json.dumps(item).encode())
+        sent += 1
+        last = keys[pos - 1]
+    next_cursor = None
+    if last is not None and pos < len(items):
+        next_cursor = base64.urlsafe_b64encode(json.dumps([sort, descending, last[0], last[1]]).encode()).decode().rstrip("=")
+    total = len(items)
+    if not is_admin:
+        if "names" not in record: record["names"] = {i["name"] for i in record["items"]}
+        total -= sum(1 for name in set(HIDDEN_FOLDERS) if name in record["names"])
+    out.write(f'], "next_cursor": {json.dumps(next_cursor)}, "total": {total}, "comments": '.encode() + counts_json + b"}")
+    if out is not handler.wfile: out.close()
+
+def handle_all_folders(handler, parsed, UPLOAD_ROOT, HIDDEN_FOLDERS, tree):
+    query = parse_qs(parsed.query)
+    root = query.get("root", [None])[0]
+    depth = query.get("depth", [None])[0]
+    if tree.ready and root is None and depth is None:
+        send_body(handler, tree.all_json(), "application/json")
+        return
+    if tree.ready:
+        # Lazy expansion: one subtree, a few levels deep, with has_children flags
+        if depth is not None and not depth.isdigit():
+            handler.send_error(400, "Invalid depth")
+            return
+        folders = tree.subtree(root or "", int(depth) if depth is not None else None)
+        if folders is None:
+            handler.send_error(404)
+            return
+        send_json(handler, folders)
+        return
 
-def handle_all_folders(handler, UPLOAD_ROOT, HIDDEN_FOLDERS):
     folders = []
     for root, dirs, files in os.walk(UPLOAD_ROOT):
         dirs[:] = [d for d in dirs if d not in HIDDEN_FOLDERS]
         rel_dir = os.path.relpath(root, UPLOAD_ROOT)
         folders.append("" if rel_dir == "." else rel_dir.replace("\\", "/"))
     folders.sort()
-    handler.send_response(200)
-    handler.send_header("Content-Type", "application/json")
-    handler.end_headers()
-    handler.wfile.write(json.dumps(folders).encode())
+    send_json(handler, folders)
 
-def handle_search(handler, parsed, UPLOAD_ROOT, HIDDEN_FOLDERS):
-    q = parse_qs(parsed.query).get("q", [""])[0].lower()
+def handle_search(handler, parsed, UPLOAD_ROOT, HIDDEN_FOLDERS, index):
+    query = parse_qs(parsed.query)
+    q = query.get("q", [""])[0].lower()
+    mode = query.get("mode", ["substring"])[0]
+    exts = {e.strip().lstrip(".").lower() for e in query.get("ext", [""])[0].split(",") if e.strip()}
+    kind = query.get("type", [""])[0] or None
+    try:
+        limit = max(1, min(int(query.get("limit", ["500"])[0]), 5000))
+    except ValueError:
+        handler.send_error(400, "Invalid limit")
+        return
+
+    if index.ready:
+        send_json(handler, index.search(q, mode, exts, kind, limit))
+        return
+
+    # Index still building after a cold start: fall back to walking the tree
     results = []
     for root, dirs, files in os.walk(UPLOAD_ROOT):
         dirs[:] = [d for d in dirs if d not in HIDDEN_FOLDERS]
         for name in dirs + files:
-            if q in name.lower():
-                rel_dir = os.path.relpath(root, UPLOAD_ROOT)
-                results.append({"name": name, "path": "" if rel_dir == "." else rel_dir, "is_dir": os.path.isdir(os.path.join(root, name))})
-    handler.send_response(200)
-    handler.send_header("Content-Type", "application/json")
-    handler.end_headers()
-    handler.wfile.write(json.dumps(results).encode())
+            low = name.lower()
+            is_dir = name in dirs
+            if (low.startswith(q) if mode == "prefix" else q in low):
+                if kind and (kind == "dir") != is_dir: continue
+                if exts and (is_dir or os.path.splitext(low)[1][1:] not in exts): continue
+                rel_dir = os.path.relpath(root, UPLOAD_ROOT).replace("\\", "/")
+                results.append({"name": name, "path": "" if rel_dir == "." else rel_dir, "is_dir": is_dir})
+                if len(results) >= limit: break
+        if len(results) >= limit: break
+    send_json(handler, results)
 
-def handle_sysinfo(handler, UPLOAD_ROOT):
-    total, used, free = shutil.disk_usage(UPLOAD_ROOT)
-    cpu_usage = psutil.cpu_percent(interval=None)
-    ram = psutil.virtual_memory()
-    
-    info = {
-        "disk": {"total": total, "used": used, "free": free, "percent": round((used / total) * 100, 1)},
-        "cpu": cpu_usage,
-        "ram": ram.percent,
-        "os": platform.system(),
-        "time": time.strftime("%Y-%m-%d %H:%M:%S")
-    }
+def handle_thumb(handler, parsed, UPLOAD_ROOT, safe_join, thumbs):
+    query = parse_qs(parsed.query)
+    abs_path = safe_join(UPLOAD_ROOT, query.get("path", [""])[0])
+    size = query.get("size", ["medium"])[0]
+    if size not in thumbnails.SIZES:
+        handler.send_error(400, f"size must be one of {', '.join(thumbnails.SIZES)}")
+        return
+    try:
+        st = os.stat(abs_path)
+    except OSError:
+        handler.send_error(404)
+        return
+    if not thumbnails.supported(abs_path):
+        handler.send_error(415, "No thumbnail for this file type")
+        return
+
+    fmt = query.get("format", [""])[0]
+    negotiated = fmt not in ("webp", "jpeg")
+    if negotiated:
+        fmt = "webp" if "image/webp" in handler.headers.get("Accept", "") and thumbnails.webp_available() else "jpeg"
+    etag = http_cache.make_etag(st, f"-{size}-{fmt}")
+    # Versioned URLs (?v=<mtime>) never change content, so the browser can keep them for good
+    versioned = query.get("v", [""])[0] == str(int(st.st_mtime))
+    cache_control = "private, max-age=31536000, immutable" if versioned else "no-cache"
+    vary = "Accept" if negotiated else None
+    if http_cache.is_not_modified(handler.headers, etag, st.st_mtime):
+        http_cache.send_not_modified(handler, etag, st.st_mtime, cache_control, vary)
+        return
+
+    try:
+        path = thumbs.get(abs_path, st, thumbnails.SIZES[size], fmt)
+    except TimeoutError:
+        handler.send_response(503)
+        handler.send_header("Retry-After", "2")
+        handler.send_header("Content-Length", "0")
+        handler.end_headers()
+        return
+    if path is None:
+        handler.send_error(415, "Can't generate a thumbnail for this file")
+        return
+    with open(path, "rb") as f:
+        body = f.read()
     handler.send_response(200)
-    handler.send_header("Content-Type", "application/json")
+    handler.send_header("Content-Type", f"image/{fmt}")
+    handler.send_header("Content-Length", str(len(body)))
+    http_cache.send_validators(handler, etag, st.st_mtime, cache_control, vary)
     handler.end_headers()
-    handler.wfile.write(json.dumps(info).encode())
+    handler.wfile.write(body)
 
-def handle_zip(handler, parsed, UPLOAD_ROOT, safe_join):
+def handle_media_info(handler, parsed, UPLOAD_ROOT, safe_join, queue):
+    """Dimensions / orientation / duration of the media files in a folder, as far as they've been probed"""
+    abs_path = safe_join(UPLOAD_ROOT, parse_qs(parsed.query).get("path", [""])[0])
+    if not os.path.isdir(abs_path):
+        handler.send_error(404)
+        return
+    send_json(handler, queue.folder_info(abs_path))
+
+def handle_sysinfo(handler, sampler):
+    snapshot = sampler.latest()
+    if snapshot is None:
+        handler.send_error(503, "No system sample yet")
+        return
+    send_json(handler, snapshot)
+
+def handle_sysinfo_history(handler, parsed, sampler):
+    try:
+        since = float(parse_qs(parsed.query).get("since", ["0"])[0])
+    except ValueError:
+        handler.send_error(400, "Invalid since")
+        return
+    send_json(handler, sampler.history(since))
+
+def handle_zip(handler, parsed, UPLOAD_ROOT, safe_join, level=6, pool=None, cache=None, exclude=()):
     items_to_zip = []
     filename = "archive.zip"
 
@@ -109,24 +262,79 @@ def handle_zip(handler, parsed, UPLOAD_ROOT, safe_join):
         handler.send_error(400, "No items to zip")
         return
 
-    handler.send_response(200)
+    entries = zip_stream.collect([(safe_join(UPLOAD_ROOT, item.get("path", ""), item.get("name", "")),
+                                   safe_join(UPLOAD_ROOT, item.get("path", ""))) for item in items_to_zip], exclude)
+    etag = zip_stream.manifest_etag(entries, level, pool is not None)
+    if http_cache.etag_matches(handler.headers.get("If-None-Match"), etag):
+        handler.send_response(304)
+        handler.send_header("ETag", etag)
+        handler.end_headers()
+        return
+
+    cached = None
+    if cache and cache.lookup(etag):
+        try:
+            cached = open(cache.path_for(etag), "rb")
+        except OSError:
+            pass  # evicted in the meantime
+    # Cached and all-stored archives have a known size: send Content-Length and honour a single Range to resume
+    size = os.fstat(cached.fileno()).st_size if cached else zip_stream.stored_size(entries, level)
+    ranges = byte_ranges.parse_range_header(handler.headers.get("Range"), size) if size is not None else None
+    if ranges is not None and (len(ranges) > 1 or not byte_ranges.if_range_allows(handler.headers, etag, 0)):
+        ranges = None
+    if ranges == []:
+        if cached: cached.close()
+        handler.send_response(416)
+        handler.send_header("Content-Range", f"bytes */{size}")
+        handler.send_header("Content-Length", "0")
+        handler.end_headers()
+        return
+
+    handler.send_response(206 if ranges else 200)
     handler.send_header("Content-Type", "application/zip")
     handler.send_header("Content-Disposition", f'attachment; filename="{filename}"')
-    handler.end_headers()
-
-    with zipfile.ZipFile(handler.wfile, 'w', zipfile.ZIP_DEFLATED) as zf:
-        for item in items_to_zip:
-            abs_path = safe_join(UPLOAD_ROOT, item.get("path", ""), item.get("name", ""))
-            if not os.path.exists(abs_path): continue
+    handler.send_header("ETag", etag)
+    chunked = None
+    out = handler.wfile
+    if size is None:
+        chunked = file_transfer.start_streaming(handler)
+        out = chunked or handler.wfile
+    else:
+        start, end = ranges[0] if ranges else (0, size - 1)
+        if ranges: handler.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        handler.send_header("Content-Length", str(end - start + 1))
+        handler.send_header("Accept-Ranges", "bytes")
+        handler.end_headers()
+        if cached:
+            try:
+                with cached:
+                    file_transfer.send_file_range(handler, cached, start, end - start + 1)
+            except (BrokenPipeError, ConnectionResetError):
+                handler.close_connection = True
+            return
+        if ranges: out = zip_stream.RangeWriter(handler.wfile, start, end)
 
-            if os.path.isfile(abs_path):
-                zf.write(abs_path, item.get("name"))
-            else:
-                for root, _, files in os.walk(abs_path):
-                    for file in files:
-                        full = os.path.join(root, file)
-                        arcname = os.path.relpath(full, os.path.join(UPLOAD_ROOT, item.get("path", "")))
-                        zf.write(full, arcname)
+    # Whole archives are recorded into the cache as they stream out
+    tee = cache.writer(etag, out) if cache and not ranges else None
+    zs = zip_stream.ZipStream(tee or out, level)
+    try:
+        zs.add_files(entries, pool)
+        written = zs.close()
+        if tee: tee.commit()
+        if size is not None and written != size:
+            # A file changed size mid-download, so the promised Content-Length is wrong
+            handler.close_connection = True
+    except zip_stream.RangeWriter.Done:
+        pass
+    except OSError:
+        handler.close_connection = True
+        return
+    finally:
+        if tee: tee.discard()
+    if tee and tee.client_gone:
+        handler.close_connection = True
+        return
+    if chunked: chunked.close()
 
 def handle_save_json(handler, UPLOAD_ROOT, safe_join):
     data = json.loads(handler.rfile.read(int(handler.headers.get("Content-Length", 0))))
@@ -134,68 +342,189 @@ def handle_save_json(handler, UPLOAD_ROOT, safe_join):
     with open(target, "w", encoding="utf-8") as f:
         if data.get("raw", False): f.write(data.get("content"))
         else: json.dump(data.get("content"), f, indent=4)
-    handler.send_response(200)
-    handler.end_headers()
-    handler.wfile.write(b'{"status":"ok"}')
+    fs_events.publish(fs_events.MODIFIED, target, False)
+    send_body(handler, b'{"status":"ok"}')
 
-def handle_batch_delete(handler, UPLOAD_ROOT, RECYCLE_BIN, safe_join):
+def handle_batch_delete(handler, UPLOAD_ROOT, RECYCLE_BIN, safe_join, meta):
     data = json.loads(handler.rfile.read(int(handler.headers.get("Content-Length", 0))))
     for item in data.get("items", []):
         target = safe_join(UPLOAD_ROOT, item["path"], item["name"])
         dest = os.path.join(RECYCLE_BIN, time.strftime("%Y%m%d_%H%M%S_") + item["name"])
-        if os.path.exists(target): shutil.move(target, dest)
+        if os.path.exists(target):
+            shutil.move(target, dest)
+            meta.move(target, dest)
+            fs_events.publish_move(target, dest)
     audit_logger.log_activity("Batch Delete", f"{len(data.get('items', []))} items", handler.client_address[0])
-    handler.send_response(200)
-    handler.end_headers()
-    handler.wfile.write(b"OK")
+    send_body(handler, b"OK")
 
-def handle_upload(handler, parsed, UPLOAD_ROOT, safe_join):
+def handle_upload(handler, parsed, UPLOAD_ROOT, safe_join, MAX_UPLOAD_FILE=0, MAX_UPLOAD_REQUEST=0):
     target_dir = safe_join(UPLOAD_ROOT, parse_qs(parsed.query).get("path", [""])[0])
-    os.makedirs(target_dir, exist_ok=True)
-    form = cgi.FieldStorage(fp=handler.rfile, headers=handler.headers, environ={"REQUEST_METHOD": "POST","CONTENT_TYPE": handler.headers["Content-Type"]})
-    files = form["file"] if isinstance(form["file"], list) else [form["file"]]
+    length = handler.headers.get("Content-Length")
+    # Whatever happens below, an unread body means this connection can't be reused
+    if not length or not length.isdigit():
+        handler.close_connection = True
+        handler.send_error(411, "Content-Length required")
+        return
+    length = int(length)
+    if MAX_UPLOAD_REQUEST and length > MAX_UPLOAD_REQUEST:
+        handler.close_connection = True
+        handler.send_error(413, f"Upload exceeds {MAX_UPLOAD_REQUEST // (1024 * 1024)} MB")
+        return
+    try:
+        boundary = multipart_stream.parse_boundary(handler.headers.get("Content-Type"))
+    except multipart_stream.MultipartError as e:
+        handler.close_connection = True
+        handler.send_error(400, str(e))
+        return
+    if not os.path.isdir(target_dir):
+        os.makedirs(target_dir, exist_ok=True)
+        fs_events.publish(fs_events.CREATED, target_dir, True)
+    if shutil.disk_usage(target_dir).free < length:
+        handler.close_connection = True
+        handler.send_error(507, "Not enough free disk space")
+        return
+
+    # Parts are written under a hidden staging folder and renamed into place when complete
+    staging = os.path.join(UPLOAD_ROOT, ".uploads")
+    os.makedirs(staging, exist_ok=True)
     saved = []
-    for item in files:
-        if not item.filename: continue
-        dest = os.path.join(target_dir, os.path.basename(item.filename))
-        if os.path.exists(dest):
-            name, ext = os.path.splitext(dest)
-            dest = f"{name}_{time.strftime('%Y%m%d_%H%M%S')}{ext}"
-        with open(dest, "wb") as f:
-            while chunk := item.file.read(8192): f.write(chunk)
-        saved.append(os.path.basename(dest))
+    pending = {}  # temp path -> open file
+    started = time.time()
+
+    def on_file(name, filename, headers):
+        filename = os.path.basename(filename.replace("\\", "/"))
+        if name != "file" or not filename:
+            return lambda chunk: None
+        tmp = os.path.join(staging, f"{uuid.uuid4().hex}.part")
+        f = pending[tmp] = open(tmp, "wb", buffering=multipart_stream.BUFFER_SIZE)
+        written = 0
+
+        def sink(chunk):
+            nonlocal written
+            if chunk is None:
+                f.close()
+                dest = os.path.join(target_dir, filename)
+                if os.path.exists(dest):
+                    stem, ext = os.path.splitext(dest)
+                    dest = f"{stem}_{time.strftime('%Y%m%d_%H%M%S')}{ext}"
+                try:
+                    os.replace(tmp, dest)
+                except OSError:
+                    shutil.move(tmp, dest)  # target is on another filesystem
+                del pending[tmp]
+                fs_events.publish(fs_events.CREATED, dest, False)
+                saved.append(os.path.basename(dest))
+                return
+            written += len(chunk)
+            if MAX_UPLOAD_FILE and written > MAX_UPLOAD_FILE:
+                raise multipart_stream.UploadTooLarge(f"{filename} exceeds {MAX_UPLOAD_FILE // (1024 * 1024)} MB")
+            f.write(chunk)
+        return sink
+
+    try:
+        multipart_stream.MultipartParser(handler.rfile, length, boundary).parse(on_file)
+    except multipart_stream.MultipartError as e:
+        handler.close_connection = True
+        status = 413 if isinstance(e, multipart_stream.UploadTooLarge) else 400
+        handler.send_error(status, str(e))
+        return
+    finally:
+        for tmp, f in pending.items():
+            f.close()
+            try: os.remove(tmp)
+            except OSError: pass
+
+    elapsed = max(time.time() - started, 0.001)
+    mb_per_s = round(length / elapsed / (1024 * 1024), 2)
+    print(f"[{time.strftime('%H:%M:%S')}] Upload: {len(saved)} files, {length / (1024 * 1024):.1f} MB in {elapsed:.1f}s ({mb_per_s} MB/s)")
     audit_logger.log_activity("Upload", f"{len(saved)} files to {os.path.basename(target_dir) or 'Root'}", handler.client_address[0])
-    handler.send_response(200)
-    handler.send_header("Content-Type","application/json")
-    handler.end_headers()
-    handler.wfile.write(json.dumps({"status":"ok","saved":saved}).encode())
+    send_json(handler, {"status":"ok","saved":saved,"bytes":length,"seconds":round(elapsed, 3),"mb_per_s":mb_per_s})
+
+def handle_upload_session(handler, parsed, UPLOAD_ROOT, safe_join, sessions):
+    """GET: received ranges of a session (?id=). POST: create one from {path, name, size, sha256?}"""
+    try:
+        if handler.command == "GET":
+            send_json(handler, sessions.get(parse_qs(parsed.query).get("id", [""])[0]))
+            return
+        data = json.loads(handler.rfile.read(int(handler.headers.get("Content-Length",0))))
+        rel_path = data.get("path", "")
+        status = sessions.create(safe_join(UPLOAD_ROOT, rel_path), rel_path, data.get("name"), data.get("size"), data.get("sha256"))
+    except resumable_upload.UploadError as e:
+        handler.send_error(e.status, str(e))
+        return
+    send_json(handler, status)
+
+def handle_upload_chunk(handler, parsed, sessions):
+    query = parse_qs(parsed.query)
+    length = handler.headers.get("Content-Length")
+    offset = query.get("offset", [""])[0]
+    if not length or not length.isdigit() or not offset.isdigit():
+        handler.close_connection = True
+        handler.send_error(411 if not (length or "").isdigit() else 400, "Content-Length and offset required")
+        return
+    try:
+        status = sessions.write_chunk(query.get("id", [""])[0], int(offset), handler.rfile, int(length))
+    except resumable_upload.UploadError as e:
+        # The body may be partly unread
+        handler.close_connection = True
+        handler.send_error(e.status, str(e))
+        return
+    send_json(handler, status)
+
+def handle_upload_finalize(handler, sessions):
+    data = json.loads(handler.rfile.read(int(handler.headers.get("Content-Length",0))))
+    try:
+        started = time.time()
+        session, dest = sessions.finalize(data.get("id"), data.get("sha256"))
+    except resumable_upload.UploadError as e:
+        handler.send_error(e.status, str(e))
+        return
+    fs_events.publish(fs_events.CREATED, dest, False)
+    elapsed = max(time.time() - session["created"], 0.001)
+    mb_per_s = round(session["size"] / elapsed / (1024 * 1024), 2)
+    print(f"[{time.strftime('%H:%M:%S')}] Resumable upload: {os.path.basename(dest)}, {session['size'] / (1024 * 1024):.1f} MB in {elapsed:.1f}s ({mb_per_s} MB/s, finalize {time.time() - started:.2f}s)")
+    audit_logger.log_activity("Upload", f"{os.path.basename(dest)} to {os.path.basename(session['target']) or 'Root'}", handler.client_address[0])
+    send_json(handler, {"status":"ok","saved":[os.path.basename(dest)],"bytes":session["size"],"seconds":round(elapsed, 3),"mb_per_s":mb_per_s})
+
+def handle_upload_abort(handler, sessions):
+    data = json.loads(handler.rfile.read(int(handler.headers.get("Content-Length",0))))
+    try:
+        sessions.abort(data.get("id"))
+    except resumable_upload.UploadError as e:
+        handler.send_error(e.status, str(e))
+        return
+    send_body(handler, b"")
 
 def handle_mkdir(handler, UPLOAD_ROOT, safe_join):
     data = json.loads(handler.rfile.read(int(handler.headers.get("Content-Length",0))))
-    os.makedirs(safe_join(UPLOAD_ROOT, data.get("path",""), data.get("folder","")), exist_ok=False)
-    handler.send_response(200)
-    handler.end_headers()
+    target = safe_join(UPLOAD_ROOT, data.get("path",""), data.get("folder",""))
+    os.makedirs(target, exist_ok=False)
+    fs_events.publish(fs_events.CREATED, target, True)
+    send_body(handler, b"")
 
-def handle_delete(handler, UPLOAD_ROOT, RECYCLE_BIN, safe_join):
+def handle_delete(handler, UPLOAD_ROOT, RECYCLE_BIN, safe_join, meta):
     data = json.loads(handler.rfile.read(int(handler.headers.get("Content-Length",0))))
     target = safe_join(UPLOAD_ROOT, data.get("path",""), data.get("name",""))
     if os.path.exists(target):
-        shutil.move(target, os.path.join(RECYCLE_BIN, time.strftime("%Y%m%d_%H%M%S_") + data.get("name","")))
+        dest = os.path.join(RECYCLE_BIN, time.strftime("%Y%m%d_%H%M%S_") + data.get("name",""))
+        shutil.move(target, dest)
+        meta.move(target, dest)
+        fs_events.publish_move(target, dest)
         audit_logger.log_activity("Delete", data.get("name",""), handler.client_address[0])
-        handler.send_response(200)
-        handler.end_headers()
+        send_body(handler, b"")
     else: handler.send_error(404)
 
-def handle_rename(handler, UPLOAD_ROOT, safe_join):
+def handle_rename(handler, UPLOAD_ROOT, safe_join, meta):
     data = json.loads(handler.rfile.read(int(handler.headers.get("Content-Length",0))))
     old_path = safe_join(UPLOAD_ROOT, data.get("path", ""), data.get("old_name", ""))
     new_target = data.get("new_name", "")
     new_path = safe_join(UPLOAD_ROOT, new_target) if ("/" in new_target or new_target == "") else safe_join(UPLOAD_ROOT, data.get("path", ""), new_target)
     os.makedirs(os.path.dirname(new_path), exist_ok=True)
     os.rename(old_path, new_path)
+    meta.move(old_path, new_path)
+    fs_events.publish_move(old_path, new_path)
     audit_logger.log_activity("Rename", f"{data.get('old_name','')} -> {new_target}", handler.client_address[0])
-    handler.send_response(200)
-    handler.end_headers()
+    send_body(handler, b"")
 
 def handle_recycle_bin_list(handler, RECYCLE_BIN):
     items = []
@@ -209,12 +538,9 @@ def handle_recycle_bin_list(handler, RECYCLE_BIN):
                 "mtime": os.path.getmtime(full)
             })
     items.sort(key=lambda x: x["mtime"], reverse=True)
-    handler.send_response(200)
-    handler.send_header("Content-Type", "application/json")
-    handler.end_headers()
-    handler.wfile.write(json.dumps(items).encode())
+    send_json(handler, items)
 
-def handle_restore(handler, UPLOAD_ROOT, RECYCLE_BIN, safe_join):
+def handle_restore(handler, UPLOAD_ROOT, RECYCLE_BIN, safe_join, meta):
     data = json.loads(handler.rfile.read(int(handler.headers.get("Content-Length", 0))))
     name = data.get("name")
     target = os.path.join(RECYCLE_BIN, name)
@@ -223,91 +549,123 @@ def handle_restore(handler, UPLOAD_ROOT, RECYCLE_BIN, safe_join):
     dest = safe_join(UPLOAD_ROOT, original_name)
     if os.path.exists(target):
         shutil.move(target, dest)
+        meta.move(target, dest)
+        fs_events.publish_move(target, dest)
         audit_logger.log_activity("Restore", original_name, handler.client_address[0])
-        handler.send_response(200)
-        handler.end_headers()
-        handler.wfile.write(b"OK")
+        send_body(handler, b"OK")
     else: handler.send_error(404)
 
-def handle_purge(handler, RECYCLE_BIN):
+def handle_purge(handler, RECYCLE_BIN, meta):
     data = json.loads(handler.rfile.read(int(handler.headers.get("Content-Length", 0))))
     name = data.get("name")
     target = os.path.join(RECYCLE_BIN, name)
     if os.path.exists(target):
         if os.path.isdir(target): shutil.rmtree(target)
         else: os.remove(target)
+        meta.forget(target)
+        fs_events.publish(fs_events.DELETED, target)
+        send_body(handler, b"OK")
+    else: handler.send_error(404)
+
+def handle_events(handler, parsed, hub, ADMIN_KEY):
+    query = parse_qs(parsed.query, keep_blank_values=True)
+    topics = {t for t in query.get("topics", [",".join(event_stream.TOPICS)])[0].split(",") if t}
+    if not topics or not topics <= set(event_stream.TOPICS):
+        handler.send_error(400, f"topics must be some of {','.join(event_stream.TOPICS)}")
+        return
+    is_admin = (query.get("show_hidden", [""])[0] == ADMIN_KEY)
+    folder = query.get("path", [""])[0]
+    if not hub.visible(folder, is_admin):
+        handler.send_error(404)
+        return
+    client = hub.connect(topics, folder, is_admin)
+    if client is None:
+        # Past the cap clients fall back to polling
+        handler.send_response(503)
+        handler.send_header("Retry-After", "30")
+        handler.send_header("Content-Length", "0")
+        handler.end_headers()
+        return
+    try:
         handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Cache-Control", "no-cache")
+        handler.send_header("X-Accel-Buffering", "no")
+        handler.send_header("Connection", "close")
+        handler.close_connection = True
         handler.end_headers()
-        handler.wfile.write(b"OK")
-    else: handler.send_error(404)
+        handler.wfile.write(hub.hello(client))
+        handler.wfile.flush()
+        # From here the hub's writer thread owns the connection and this worker is free again
+        hub.attach(handler, client)
+    except (OSError, TimeoutError):
+        hub.disconnect(client)  # client went away
 
-def handle_activity_list(handler):
-    logs = audit_logger.get_recent_activity(50)
-    handler.send_response(200)
-    handler.send_header("Content-Type", "application/json")
-    handler.end_headers()
-    handler.wfile.write(json.dumps(logs).encode())
+def handle_server_stats(handler):
+    if hasattr(handler.server, "stats"):
+        stats = handler.server.stats()
+    else:
+        stats = {"mode": "threaded", "threads": threading.active_count()}
+    stats["pid"] = os.getpid()  # tells prefork workers apart
+    send_json(handler, stats)
 
-def handle_comments(handler, parsed):
-    DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
-    os.makedirs(DATA_DIR, exist_ok=True)
-    COMMENTS_FILE = os.path.join(DATA_DIR, "comments.json")
-    
+ACTIVITY_FILTERS = ("since", "until", "action", "ip", "filename", "cursor", "limit")
+
+def handle_activity_list(handler, parsed):
+    query = parse_qs(parsed.query)
+    if not any(k in query for k in ACTIVITY_FILTERS):
+        send_json(handler, audit_logger.get_recent_activity(50))
+        return
+
+    # Query mode: filters over the whole history, newest first, paged by next_cursor
+    filters = {k: query[k][0] for k in ("action", "ip", "filename") if query.get(k, [""])[0]}
+    try:
+        for k in ("since", "until"):
+            if query.get(k, [""])[0]:
+                filters[k] = activity_index.parse_time(query[k][0])
+        if query.get("cursor", [""])[0]:
+            filters["cursor"] = int(query["cursor"][0])
+        filters["limit"] = max(1, min(int(query.get("limit", ["100"])[0]), 1000))
+    except (ValueError, OverflowError):
+        handler.send_error(400, "Invalid since, until, cursor or limit")
+        return
+    send_json(handler, audit_logger.query_activity(**filters))
+
+def handle_comments(handler, parsed, store):
     if handler.command == "GET":
-        target = parse_qs(parsed.query).get("path", [""])[0]
-        comments = {}
-        if os.path.exists(COMMENTS_FILE):
-            try:
-                with open(COMMENTS_FILE, "r") as f:
-                    comments = json.load(f)
-            except: pass
-        
-        file_comments = comments.get(target, [])
-        handler.send_response(200)
-        handler.send_header("Content-Type", "application/json")
-        handler.end_headers()
-        handler.wfile.write(json.dumps(file_comments).encode())
-        
+        query = parse_qs(parsed.query)
+        if "dir" in query:
+            # Comment counts for a whole folder listing in one lookup
+            send_json(handler, store.counts(query["dir"][0]))
+            return
+        send_json(handler, store.get(query.get("path", [""])[0]))
+
     elif handler.command == "POST":
         length = int(handler.headers.get("Content-Length", 0))
-        data = json.loads(handler.rfile.read(length))
+        try:
+            data = json.loads(handler.rfile.read(length))
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            handler.send_error(400)
+            return
         target = data.get("path")
         text = data.get("text")
         author = data.get("author", "Admin")
-        
+
         if not target or not text:
              handler.send_error(400)
              return
 
-        comments = {}
-        if os.path.exists(COMMENTS_FILE):
-             with open(COMMENTS_FILE, "r") as f:
-                 try: comments = json.load(f)
-                 except: pass
-        
-        if target not in comments: comments[target] = []
-        comments[target].append({
-            "text": text,
-            "author": author,
-            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
-        })
-        
-        with open(COMMENTS_FILE, "w") as f:
-            json.dump(comments, f, indent=2)
-            
-        handler.send_response(200)
-        handler.end_headers()
-        handler.wfile.write(b"OK")
+        store.add(target, text, author)
+        send_body(handler, b"OK")
 
 # ===== Collaborative API Handlers =====
 
 def handle_collaborative_sessions(handler, collab_manager):
     """List all available collaborative sessions"""
     sessions = collab_manager.get_active_sessions()
-    handler.send_response(200)
-    handler.send_header("Content-Type", "application/json")
-    handler.end_headers()
-    handler.wfile.write(json.dumps(sessions).encode())
+    send_json(handler, sessions)
 
 def handle_collaborative_save(handler, collab_manager):
     """Manually save collaborative session"""
@@ -325,7 +683,4 @@ def handle_collaborative_save(handler, collab_manager):
         handler.send_error(400, "Invalid session type")
         return
     
-    handler.send_response(200)
-    handler.send_header("Content-Type", "application/json")
-    handler.end_headers()
-    handler.wfile.write(json.dumps(result).encode())
+    send_json(handler, result)
@@ -1,5 +1,6 @@
 let currentPath = "";
 let filesList = [];
+let commentCounts = {}; // name -> comment count for the current folder, from /api/list
 let sortBy = 'name_asc';
 let selectedItem = null;
 let adminKey = new URLSearchParams(window.location.search).get('show_hidden') || "";
@@ -140,21 +141,95 @@ function updateBatchToolbar() {
     bar.classList.toggle('active', selectedItems.size > 0);
 }
 
+// Recent samples for the sparklines, seeded from /api/sysinfo/history
+const SPARK_POINTS = 60;
+let sysHistory = { ts: [], cpu: [], ram: [] };
+
+function sparkline(values, max = 100) {
+    if (values.length < 2) return '';
+    const w = 48, h = 14;
+    const points = values.map((v, i) => `${(i * w / (values.length - 1)).toFixed(1)},${(h - Math.min(v, max) / max * h).toFixed(1)}`).join(' ');
+    return `<svg width="${w}" height="${h}" viewBox="0 0 ${w} ${h}" style="vertical-align:middle; opacity:0.7;"><polyline fill="none" stroke="currentColor" stroke-width="1.2" points="${points}"/></svg>`;
+}
+
+function renderSysInfo(data) {
+    if (!sysHistory.ts.length || data.ts > sysHistory.ts[sysHistory.ts.length - 1]) {
+        for (const key of ['ts', 'cpu', 'ram']) {
+            sysHistory[key].push(data[key]);
+            sysHistory[key] = sysHistory[key].slice(-SPARK_POINTS);
+        }
+    }
+    document.getElementById('sysInfo').innerHTML = `
+        <span><i data-lucide="monitor" style="width:14px; height:14px;"></i> ${data.os}</span>
+        <span><i data-lucide="cpu" style="width:14px; height:14px;"></i> CPU: ${data.cpu}% ${sparkline(sysHistory.cpu)}</span>
+        <span><i data-lucide="memory-stick" style="width:14px; height:14px;"></i> RAM: ${data.ram}% ${sparkline(sysHistory.ram)}</span>
+        <span><i data-lucide="hard-drive" style="width:14px; height:14px;"></i> Disk: ${data.disk.percent}%</span>
+    `;
+    lucide.createIcons();
+}
+
 async function fetchSysInfo() {
     try {
         const res = await fetch('/api/sysinfo');
+        renderSysInfo(await res.json());
+    } catch (e) { }
+}
+
+async function loadSysHistory() {
+    try {
+        const res = await fetch('/api/sysinfo/history');
         const data = await res.json();
-        document.getElementById('sysInfo').innerHTML = `
-            <span><i data-lucide="monitor" style="width:14px; height:14px;"></i> ${data.os}</span>
-            <span><i data-lucide="cpu" style="width:14px; height:14px;"></i> CPU: ${data.cpu}%</span>
-            <span><i data-lucide="memory-stick" style="width:14px; height:14px;"></i> RAM: ${data.ram}%</span>
-            <span><i data-lucide="hard-drive" style="width:14px; height:14px;"></i> Disk: ${data.disk.percent}%</span>
-        `;
-        lucide.createIcons();
+        for (const key of ['ts', 'cpu', 'ram']) sysHistory[key] = data[key].slice(-SPARK_POINTS);
     } catch (e) { }
+    fetchSysInfo();
+}
+let sysInfoTimer = setInterval(fetchSysInfo, 10000); // stopped while /api/events pushes snapshots
+loadSysHistory();
+
+// Live updates over /api/events (Server-Sent Events). Polling and refetch-after-action are the fallback.
+let eventSource = null;
+let eventsPath = null;
+let liveUpdates = false;
+let dirRefreshTimer = null;
+
+function connectEvents() {
+    if (!window.EventSource) return;
+    if (eventSource) eventSource.close();
+    eventsPath = currentPath;
+    let url = `/api/events?path=${encodeURIComponent(currentPath)}`;
+    if (adminKey) url += `&show_hidden=${adminKey}`;
+    eventSource = new EventSource(url);
+    eventSource.addEventListener('hello', () => {
+        liveUpdates = true;
+        clearInterval(sysInfoTimer);
+        sysInfoTimer = null;
+    });
+    eventSource.addEventListener('sysinfo', e => renderSysInfo(JSON.parse(e.data)));
+    eventSource.addEventListener('dir', scheduleDirRefresh);
+    eventSource.addEventListener('resync', scheduleDirRefresh);
+    eventSource.addEventListener('activity', e => prependActivity(JSON.parse(e.data)));
+    eventSource.onerror = () => {
+        liveUpdates = false;
+        if (eventSource.readyState !== EventSource.CLOSED) return; // the browser reconnects by itself
+        // Refused (e.g. too many streams): poll, and try again later
+        if (!sysInfoTimer) sysInfoTimer = setInterval(fetchSysInfo, 10000);
+        setTimeout(connectEvents, 30000);
+    };
+}
+
+function scheduleDirRefresh() {
+    // A bulk upload or delete sends many events: reload once they settle
+    clearTimeout(dirRefreshTimer);
+    dirRefreshTimer = setTimeout(() => {
+        const isGlobal = document.getElementById('globalSearch').checked && document.getElementById('searchInput').value;
+        if (!inRecycleBin && !isGlobal) fetchFiles(currentPath, true);
+    }, 300);
+}
+
+function refreshListing() {
+    // After our own change: the server's "dir" event reloads the folder, unless there is no live stream
+    if (!liveUpdates || inRecycleBin) fetchFiles(currentPath);
 }
-setInterval(fetchSysInfo, 10000);
-fetchSysInfo();
 
 function setFilter(button) {
     document.querySelectorAll(".filter-btn").forEach(b => b.classList.remove("active"));
@@ -222,7 +297,7 @@ async function moveFile(destFolderPath) {
         selectedItems.clear();
         updateBatchToolbar();
         closeSendToModal();
-        fetchFiles(currentPath);
+        refreshListing();
         return;
     }
 
@@ -246,7 +321,7 @@ async function moveFile(destFolderPath) {
     if (res.ok) {
         showToast(`Moved to ${destFolderPath || 'Home'}`);
         closeSendToModal();
-        fetchFiles(currentPath);
+        refreshListing();
     } else {
         showToast("Failed to move file. Check if a file with that name already exists in the destination.", "error");
     }
@@ -352,10 +427,12 @@ async function fetchFiles(path = "", fromHistory = false) {
     } else if (isGlobal && q) {
         url = `/api/search?q=${encodeURIComponent(q)}`;
     } else {
-        url = `/api/list?path=${encodeURIComponent(path)}`;
+        // A refresh of the open folder keeps as many items as were already loaded
+        const keep = path === currentPath && listPaged ? filesList.length : 0;
+        url = listUrl(path, Math.max(LIST_PAGE, keep));
     }
 
-    if (adminKey) url += (url.includes('?') ? '&' : '?') + `show_hidden=${adminKey}`;
+    if (adminKey && !url.includes('show_hidden=')) url += (url.includes('?') ? '&' : '?') + `show_hidden=${adminKey}`;
 
     const res = await fetch(url);
     const data = await res.json();
@@ -364,10 +441,17 @@ async function fetchFiles(path = "", fromHistory = false) {
     if (Array.isArray(data)) {
         // Global search results
         filesList = data;
+        commentCounts = {};
         currentPath = path; // Keep path same or handle as search view
+        listPaged = false;
+        listCursor = null;
     } else {
         currentPath = data.path;
         filesList = data.items;
+        commentCounts = data.comments || {};
+        listPaged = true;
+        listCursor = data.next_cursor || null;
+        if (eventsPath !== currentPath) connectEvents(); // follow the folder being viewed
     }
 
     // Add to browser history for mobile back button support
@@ -378,10 +462,44 @@ async function fetchFiles(path = "", fromHistory = false) {
     }
 
     updateBreadcrumbs();
-    applySortAndRender();
+    if (listPaged) renderFiles(); // already in sortBy order from the server
+    else applySortAndRender();
     updateStats();
 }
 
+// /api/list is fetched a page at a time, sorted by the server; later pages load while scrolling
+const LIST_PAGE = 200;
+let listPaged = false;
+let listCursor = null;
+let loadingMore = false;
+
+function listUrl(path, limit, cursor = null) {
+    const [sort, order] = sortBy.split('_');
+    let url = `/api/list?path=${encodeURIComponent(path)}&sort=${sort}&order=${order}&limit=${limit}`;
+    if (cursor) url += `&cursor=${cursor}`;
+    if (adminKey) url += `&show_hidden=${adminKey}`;
+    return url;
+}
+
+async function loadMoreFiles() {
+    if (!listPaged || !listCursor || loadingMore) return;
+    loadingMore = true;
+    const path = currentPath;
+    try {
+        const res = await fetch(listUrl(path, LIST_PAGE, listCursor));
+        if (!res.ok) return;
+        const data = await res.json();
+        if (path !== currentPath || !listPaged) return; // navigated away meanwhile
+        filesList = filesList.concat(data.items);
+        Object.assign(commentCounts, data.comments || {});
+        listCursor = data.next_cursor || null;
+        renderFiles(false);
+        updateStats();
+    } finally {
+        loadingMore = false;
+    }
+}
+
 function updateBreadcrumbs() {
     const container = document.getElementById('breadcrumb');
     container.innerHTML = `<span onclick="fetchFiles('')"><i data-lucide="home" style="width:14px; height:14px; vertical-align:text-bottom;"></i></span>`;
@@ -402,6 +520,7 @@ let observerTarget = null;
 function renderFiles(reset = true) {
     const container = document.getElementById('explorer');
     const isGrid = container.classList.contains('grid');
+    if (!document.getElementById('scroll-sentinel')) reset = true; // the empty state is showing
 
     // Store filtered list globally for pagination
     currentFilteredList = filesList.filter(item => {
@@ -409,7 +528,13 @@ function renderFiles(reset = true) {
         return activeFilter === 'all' || fileType === activeFilter || item.is_dir;
     });
 
+    if (currentFilteredList.length === 0 && !reset) {
+        loadMoreFiles(); // nothing loaded matches the filter yet
+        return;
+    }
+
     if (currentFilteredList.length === 0) {
+        loadMoreFiles();
         container.innerHTML = `
             <div class="empty-state">
                 <i data-lucide="folder-open"></i>
@@ -449,7 +574,10 @@ function renderNextBatch() {
     const sentinel = document.getElementById('scroll-sentinel');
 
     const nextBatch = currentFilteredList.slice(renderedCount, renderedCount + BATCH_SIZE);
-    if (nextBatch.length === 0) return;
+    if (nextBatch.length === 0) {
+        loadMoreFiles(); // scrolled past what is loaded
+        return;
+    }
 
     nextBatch.forEach((item, index) => {
         const globalIndex = renderedCount + index; // Track actual index
@@ -459,17 +587,20 @@ function renderNextBatch() {
         card.dataset.name = item.name.toLowerCase();
         const encodedUrl = getFullUrl(item.name);
         const isImg = /\.(jpg|jpeg|png|gif|webp|svg)$/i.test(item.name);
+        const previewUrl = hasThumbnail(item.name) ? getThumbUrl(item, isGrid ? 'medium' : 'small') : encodedUrl;
 
         const isSelected = selectedItems.has(JSON.stringify({ path: item.path || currentPath, name: item.name }));
+        const comments = item.path === undefined ? commentCounts[item.name] : 0;
+        const commentBadge = comments ? ` <span title="${comments} comment${comments > 1 ? 's' : ''}" style="opacity:0.6; font-size:0.75rem; white-space:nowrap;"><i data-lucide="message-circle" style="width:12px; height:12px; vertical-align:middle;"></i> ${comments}</span>` : '';
         card.innerHTML = `
             <input type="checkbox" class="select-checkbox" ${isSelected ? 'checked' : ''} onclick="event.stopPropagation()">
             ${isGrid ? `
-                <div class="preview-area">${isImg ? `<img src="${encodedUrl}" loading="lazy">` : `<i data-lucide="${item.is_dir ? 'folder' : 'file-text'}"></i>`}</div>
-                <div class="file-info"><div class="file-name">${item.name}</div></div>
+                <div class="preview-area">${isImg ? `<img src="${previewUrl}" loading="lazy" data-full="${encodedUrl}" onerror="thumbFallback(this)">` : `<i data-lucide="${item.is_dir ? 'folder' : 'file-text'}"></i>`}</div>
+                <div class="file-info"><div class="file-name">${item.name}${commentBadge}</div></div>
             ` : `
-                <div class="preview-area">${isImg ? `<img src="${encodedUrl}" loading="lazy">` : `<i data-lucide="${item.is_dir ? 'folder' : 'file-text'}"></i>`}</div>
+                <div class="preview-area">${isImg ? `<img src="${previewUrl}" loading="lazy" data-full="${encodedUrl}" onerror="thumbFallback(this)">` : `<i data-lucide="${item.is_dir ? 'folder' : 'file-text'}"></i>`}</div>
                 <div class="file-info">
-                    <div class="file-name">${item.name}</div>
+                    <div class="file-name">${item.name}${commentBadge}</div>
                     <div class="list-meta">${item.is_dir ? 'Folder' : formatSize(item.size)}</div>
                     <div class="list-meta">${item.is_dir ? '--' : item.name.split('.').pop().toUpperCase()}</div>
                 </div>
@@ -818,7 +949,7 @@ async function deleteBatch() {
         showToast(`Deleted ${selectedItems.size} items`);
         selectedItems.clear();
         updateBatchToolbar();
-        fetchFiles(currentPath);
+        refreshListing();
     }
 }
 
@@ -918,7 +1049,7 @@ function toggleDetails(show, item = null) {
 
     content.innerHTML = `
         <div style="width:100%; height:200px; background:#000; display:flex; align-items:center; justify-content:center; border-radius:12px; margin-bottom:1.5rem; overflow:hidden;">
-            ${isImg ? `<img src="${encodedUrl}" style="max-width:100%; max-height:100%; object-fit:contain;">` : `<i data-lucide="${item.is_dir ? 'folder' : 'file-text'}" style="width:80px; height:80px;"></i>`}
+            ${isImg ? `<img src="${hasThumbnail(item.name) ? getThumbUrl(item, 'large') : encodedUrl}" data-full="${encodedUrl}" onerror="thumbFallback(this)" style="max-width:100%; max-height:100%; object-fit:contain;">` : `<i data-lucide="${item.is_dir ? 'folder' : 'file-text'}" style="width:80px; height:80px;"></i>`}
         </div>
         <div style="display:grid; gap:15px;">
             <div><small style="color:var(--text-muted)">NAME</small><p style="word-break:break-all;">${item.name}</p></div>
@@ -954,33 +1085,159 @@ function uploadFiles(files) {
         `;
         list.prepend(item);
 
-        const xhr = new XMLHttpRequest();
-        const fd = new FormData();
-        fd.append('file', file);
-
-        xhr.upload.onprogress = (e) => {
-            if (e.lengthComputable) {
-                const p = Math.round((e.loaded / e.total) * 100);
-                item.querySelector('.up-percent').textContent = `${p}%`;
-                item.querySelector('.upload-item-progress').style.width = `${p}%`;
-            }
+        const setProgress = (p) => {
+            item.querySelector('.up-percent').textContent = `${p}%`;
+            item.querySelector('.upload-item-progress').style.width = `${p}%`;
         };
-
-        xhr.onload = () => {
+        const onDone = () => {
             item.style.borderColor = 'var(--primary)';
             setTimeout(() => {
                 // Keep it for a bit then maybe fade out or stay in list
                 item.querySelector('.up-percent').innerHTML = '<i data-lucide="check" style="width:12px; height:12px; color:#10b981"></i>';
                 lucide.createIcons();
             }, 1000);
-            fetchFiles(currentPath);
+            refreshListing();
         };
 
+        if (file.size > RESUMABLE_THRESHOLD) {
+            resumableUpload(file, currentPath, setProgress)
+                .then(onDone)
+                .catch(err => {
+                    item.style.borderColor = '#ef4444';
+                    item.querySelector('.up-percent').textContent = 'Failed';
+                    console.error('Upload failed:', err);
+                });
+            return;
+        }
+
+        const xhr = new XMLHttpRequest();
+        const fd = new FormData();
+        fd.append('file', file);
+
+        xhr.upload.onprogress = (e) => {
+            if (e.lengthComputable) setProgress(Math.round((e.loaded / e.total) * 100));
+        };
+
+        xhr.onload = onDone;
+
         xhr.open('POST', `/api/upload?path=${encodeURIComponent(currentPath)}`);
         xhr.send(fd);
     });
 }
 
+// --- Resumable Uploads ---
+// Files above the threshold go up in chunks over several connections. The session id is
+// remembered per file, so after a dropped connection or a reload only missing chunks are sent.
+const RESUMABLE_THRESHOLD = 8 * 1024 * 1024;
+const UPLOAD_PARALLEL = 4;
+const CHUNK_RETRIES = 5;
+
+function uploadSessionKey(file, path) {
+    return `upload:${path}|${file.name}|${file.size}|${file.lastModified}`;
+}
+
+async function openUploadSession(file, path) {
+    const key = uploadSessionKey(file, path);
+    const saved = localStorage.getItem(key);
+    if (saved) {
+        const res = await fetch(`/api/upload/session?id=${saved}`);
+        if (res.ok) return res.json();
+        localStorage.removeItem(key);
+    }
+    const res = await fetch('/api/upload/session', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ path, name: file.name, size: file.size })
+    });
+    if (!res.ok) throw new Error(`Could not start upload (${res.status})`);
+    const session = await res.json();
+    localStorage.setItem(key, session.id);
+    return session;
+}
+
+function putChunk(sessionId, file, start, end, onProgress, active) {
+    return new Promise((resolve, reject) => {
+        const xhr = new XMLHttpRequest();
+        const fail = (err) => { active.delete(xhr); reject(err); };
+        xhr.upload.onprogress = (e) => onProgress(e.loaded);
+        xhr.onload = () => {
+            if (xhr.status === 200) { active.delete(xhr); resolve(); return; }
+            const err = new Error(`Chunk failed (${xhr.status})`);
+            err.status = xhr.status;
+            fail(err);
+        };
+        xhr.onerror = () => fail(new Error('Network error'));
+        xhr.onabort = () => fail(new Error('Cancelled'));
+        xhr.open('PUT', `/api/upload/chunk?id=${sessionId}&offset=${start}`);
+        active.add(xhr);
+        xhr.send(file.slice(start, end));
+    });
+}
+
+async function resumableUpload(file, path, setProgress) {
+    const session = await openUploadSession(file, path);
+    const chunkSize = session.chunk_size;
+
+    // Work list: every chunk-sized piece of the gaps between received ranges
+    const pending = [];
+    let pos = 0;
+    for (const [start, end] of [...session.received, [file.size, file.size]]) {
+        for (let s = pos; s < start; s += chunkSize) pending.push([s, Math.min(s + chunkSize, start)]);
+        pos = Math.max(pos, end);
+    }
+
+    let confirmed = session.received_bytes;
+    const inFlight = {};
+    const report = () => {
+        const sending = Object.values(inFlight).reduce((a, b) => a + b, 0);
+        setProgress(file.size ? Math.min(99, Math.floor((confirmed + sending) / file.size * 100)) : 99);
+    };
+    report();
+
+    // Once one worker gives up the others stop too, instead of uploading into a failed transfer
+    const active = new Set();
+    let failed = null;
+    const worker = async () => {
+        while (pending.length && !failed) {
+            const [start, end] = pending.shift();
+            for (let attempt = 0; ; attempt++) {
+                try {
+                    await putChunk(session.id, file, start, end, (loaded) => { inFlight[start] = loaded; report(); }, active);
+                    break;
+                } catch (err) {
+                    if (failed) return;
+                    // Client errors (session gone, finished or aborted) won't get better on a retry
+                    if (attempt >= CHUNK_RETRIES || (err.status >= 400 && err.status < 500)) {
+                        failed = err;
+                        active.forEach(xhr => xhr.abort());
+                        return;
+                    }
+                    await new Promise(r => setTimeout(r, 1000 * 2 ** attempt));
+                    if (failed) return;
+                } finally {
+                    delete inFlight[start];
+                }
+            }
+            confirmed += end - start;
+            report();
+        }
+    };
+    await Promise.all(Array.from({ length: UPLOAD_PARALLEL }, worker));
+    if (failed) {
+        if (failed.status === 404) localStorage.removeItem(uploadSessionKey(file, path));
+        throw failed;
+    }
+
+    const res = await fetch('/api/upload/finalize', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ id: session.id })
+    });
+    if (res.status !== 409) localStorage.removeItem(uploadSessionKey(file, path));
+    if (!res.ok) throw new Error(`Finalize failed (${res.status})`);
+    setProgress(100);
+}
+
 function closeUploadDrawer() {
     document.getElementById('uploadDrawer').style.display = 'none';
     document.getElementById('uploadList').innerHTML = "";
@@ -1271,8 +1528,13 @@ function toggleView() {
     renderFiles();
 }
 function goBack() { if (!currentPath) return; const parts = currentPath.split("/"); parts.pop(); fetchFiles(parts.join("/")); }
-function changeSort(v) { sortBy = v; applySortAndRender(); }
+function changeSort(v) { sortBy = v; if (listPaged) fetchFiles(currentPath, true); else applySortAndRender(); }
 function formatSize(b) { if (!b) return '0 B'; let i = Math.floor(Math.log(b) / Math.log(1024)); return (b / Math.pow(1024, i)).toFixed(1) + ' ' + ['B', 'KB', 'MB', 'GB'][i]; }
+// Raster images are shown through /api/thumb; SVGs are small and scale, so they stay as-is.
+// The mtime in the URL lets the browser cache each thumbnail until the file changes.
+function hasThumbnail(name) { return /\.(jpg|jpeg|png|gif|webp)$/i.test(name); }
+function getThumbUrl(item, size) { return `/api/thumb?path=${encodeURIComponent(currentPath ? `${currentPath}/${item.name}` : item.name)}&size=${size}&v=${item.mtime || 0}`; }
+function thumbFallback(img) { img.onerror = null; img.src = img.dataset.full; }
 function getFullUrl(name) { return (currentPath ? `${currentPath}/${name}` : name).split('/').map(encodeURIComponent).join('/'); }
 function applySortAndRender() { filesList.sort((a, b) => { if (a.is_dir !== b.is_dir) return b.is_dir - a.is_dir; let c = sortBy.startsWith('name') ? a.name.localeCompare(b.name) : (a.size || 0) - (b.size || 0); return sortBy.endsWith('desc') ? -c : c; }); renderFiles(); }
 
@@ -1301,9 +1563,9 @@ document.getElementById('searchInput').oninput = (e) => {
     document.querySelectorAll('.file-card').forEach(c => c.classList.toggle('hidden', !c.dataset.name.includes(q)));
 };
 
-async function deleteItem(n) { if (confirm(`Delete ${n}?`)) { await fetch('/api/delete', { method: 'POST', body: JSON.stringify({ path: currentPath, name: n }) }); fetchFiles(currentPath); showToast('Deleted'); } }
-async function renameItem(o) { const n = prompt("Rename to:", o); if (n) { await fetch('/api/rename', { method: 'POST', body: JSON.stringify({ path: currentPath, old_name: o, new_name: n }) }); fetchFiles(currentPath); } }
-async function createNewFolder() { const n = prompt("Folder Name:"); if (n) { await fetch('/api/mkdir', { method: 'POST', body: JSON.stringify({ path: currentPath, folder: n }) }); fetchFiles(currentPath); } }
+async function deleteItem(n) { if (confirm(`Delete ${n}?`)) { await fetch('/api/delete', { method: 'POST', body: JSON.stringify({ path: currentPath, name: n }) }); refreshListing(); showToast('Deleted'); } }
+async function renameItem(o) { const n = prompt("Rename to:", o); if (n) { await fetch('/api/rename', { method: 'POST', body: JSON.stringify({ path: currentPath, old_name: o, new_name: n }) }); refreshListing(); } }
+async function createNewFolder() { const n = prompt("Folder Name:"); if (n) { await fetch('/api/mkdir', { method: 'POST', body: JSON.stringify({ path: currentPath, folder: n }) }); refreshListing(); } }
 document.getElementById('fileInput').onchange = (e) => uploadFiles(e.target.files);
 
 // Mobile back button support via History API
@@ -1344,25 +1606,35 @@ function openActivityLog() {
                 list.innerHTML = '<div style="text-align:center; padding:20px; color:var(--text-secondary)">No recent activity</div>';
                 return;
             }
-            logs.forEach(log => {
-                const item = document.createElement('div');
-                item.style.cssText = 'background:var(--bg-secondary); padding:10px; border-radius:8px; border:1px solid var(--border); display:flex; flex-direction:column; gap:4px;';
-                item.innerHTML = `
-                    <div style="display:flex; justify-content:space-between; font-size:0.85rem;">
-                        <span style="font-weight:600; color:var(--primary);">${log.action}</span>
-                        <span style="opacity:0.6;">${log.timestamp}</span>
-                    </div>
-                    <div style="font-size:0.9rem;">${log.filename}</div>
-                    <div style="font-size:0.75rem; opacity:0.5;">User: ${log.user} | IP: ${log.ip}</div>
-                `;
-                list.appendChild(item);
-            });
+            logs.forEach(log => list.appendChild(activityItem(log)));
         })
         .catch(err => {
             list.innerHTML = '<div style="text-align:center; padding:20px; color:#fb7185">Error loading logs</div>';
         });
 }
 
+function activityItem(log) {
+    const item = document.createElement('div');
+    item.style.cssText = 'background:var(--bg-secondary); padding:10px; border-radius:8px; border:1px solid var(--border); display:flex; flex-direction:column; gap:4px;';
+    item.innerHTML = `
+        <div style="display:flex; justify-content:space-between; font-size:0.85rem;">
+            <span style="font-weight:600; color:var(--primary);">${log.action}</span>
+            <span style="opacity:0.6;">${log.timestamp}</span>
+        </div>
+        <div style="font-size:0.9rem;">${log.filename}</div>
+        <div style="font-size:0.75rem; opacity:0.5;">User: ${log.user} | IP: ${log.ip}</div>
+    `;
+    return item;
+}
+
+function prependActivity(entries) {
+    // New entries pushed over /api/events while the log is open (oldest first)
+    const list = document.getElementById('activityList');
+    if (document.getElementById('activityModal').style.display !== 'flex') return;
+    if (!list.querySelector('div > div')) list.innerHTML = '';
+    entries.forEach(log => list.prepend(activityItem(log)));
+}
+
 function closeActivityLog() {
     document.getElementById('activityModal').style.display = 'none';
 }
@@ -1407,6 +1679,7 @@ function postComment(path) {
     fetch('/api/comments', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ path, text })
     }).then(res => {
         if (res.ok) loadComments(path);
     });
@@ -1472,7 +1745,7 @@ async function createNewFile(type) {
     });
 
     showToast('File created!');
-    fetchFiles(currentPath);
+    refreshListing();
 }
 
 function openScratchpad() {
@@ -1524,7 +1797,7 @@ async function saveScratchpad() {
 
     showToast("Saved!");
     document.getElementById('saveFileBtn').setAttribute('onclick', 'saveEditorContent()'); // Reset
-    fetchFiles(currentPath);
+    refreshListing();
     toggleDetails(false); // Close panel
 }
 
@@ -0,0 +1,218 @@
+"""
+Asyncio HTTP Engine
+Alternative to ThreadedHTTPServer: connections are coroutines on one event
+loop, so idle keep-alive clients cost no thread. Once a complete request head
+has arrived, the request is handed to the regular FileServerHandler on a
+bounded thread pool, which keeps every route (and all blocking filesystem
+work) exactly as it is in threaded mode.
+"""
+
+import os
+import sys
+import time
+import asyncio
+import socket
+from concurrent.futures import ThreadPoolExecutor
+
+# Same limit BaseHTTPRequestHandler applies to the request line
+MAX_HEAD_SIZE = 64 * 1024
+SENDFILE_SLICE = 8 * 1024 * 1024
+
+class _StreamBridge:
+    """
+    Blocking rfile/wfile pair over an asyncio connection, for use from pool threads.
+    Bytes read ahead of the current request (pipelining) stay in `buf` for the next one.
+    """
+
+    def __init__(self, loop, reader, writer, timeout):
+        self.loop = loop
+        self.reader = reader
+        self.writer = writer
+        self.timeout = timeout
+        self.buf = bytearray()
+        self.eof = False
+
+    # --- event loop side ---
+
+    async def wait_for_head(self):
+        """Wait (on the loop, without a thread) until a full request head is buffered"""
+        while b"\r\n\r\n" not in self.buf:
+            if self.eof or len(self.buf) > MAX_HEAD_SIZE:
+                return bool(self.buf)
+            chunk = await asyncio.wait_for(self.reader.read(65536), self.timeout)
+            if not chunk:
+                self.eof = True
+            self.buf += chunk
+        return True
+
+    async def _write(self, data):
+        self.writer.write(data)
+        await self.writer.drain()
+
+    # --- pool thread side ---
+
+    def _call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(self.timeout)
+
+    def _fill(self, n=65536):
+        if self.eof:
+            return False
+        chunk = self._call(self.reader.read(n))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf += chunk
+        return True
+
+    def read(self, n=-1):
+        if n is None or n < 0:
+            while self._fill(): pass
+            n = len(self.buf)
+        while len(self.buf) < n and self._fill(max(n - len(self.buf), 65536)): pass
+        data = bytes(self.buf[:n])
+        del self.buf[:n]
+        return data
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def read1(self, n=-1):
+        if not self.buf:
+            self._fill()
+        if n is None or n < 0:
+            n = len(self.buf)
+        data = bytes(self.buf[:n])
+        del self.buf[:n]
+        return data
+
+    def readline(self, limit=-1):
+        while True:
+            idx = self.buf.find(b"\n")
+            if idx >= 0:
+                n = idx + 1
+                break
+            if 0 <= limit <= len(self.buf) or not self._fill():
+                n = len(self.buf)
+                break
+        if limit is not None and limit >= 0:
+            n = min(n, limit)
+        data = bytes(self.buf[:n])
+        del self.buf[:n]
+        return data
+
+    def write(self, data):
+        self._call(self._write(bytes(data)))
+        return len(data)
+
+    def sendfile(self, f, offset, count):
+        """Used by file_transfer: lets the loop sendfile() straight from the page cache"""
+        sent = 0
+        # Sliced so the idle timeout measures a stalled client, not a long download
+        while sent < count:
+            n = min(count - sent, SENDFILE_SLICE)
+            self._call(self.loop.sendfile(self.writer.transport, f, offset + sent, n))
+            sent += n
+        return sent
+
+    def flush(self):
+        pass
+
+class AsyncHTTPServer:
+    def __init__(self, server_address, RequestHandlerClass, workers=32, idle_timeout=60, reuse_port=False):
+        self.server_address = server_address
+        self.reuse_port = reuse_port
+        self.RequestHandlerClass = RequestHandlerClass
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="http-worker")
+        self.idle_timeout = idle_timeout
+        self.server_name = socket.getfqdn(server_address[0])
+        self.server_port = server_address[1]
+        self.workers = workers
+        self.connections = 0
+        self.busy = 0
+        self.completed = 0
+        self.started = time.time()
+        self._server = None
+        self._loop = None
+
+    def _make_handler(self, bridge, client_address):
+        # Built by hand: BaseHTTPRequestHandler.__init__ would immediately run handle()
+        handler = self.RequestHandlerClass.__new__(self.RequestHandlerClass)
+        handler.request = None
+        handler.connection = bridge
+        handler.client_address = client_address
+        handler.server = self
+        handler.directory = os.getcwd()
+        handler.rfile = bridge
+        handler.wfile = bridge
+        handler.close_connection = True
+        return handler
+
+    async def _serve_connection(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        bridge = _StreamBridge(loop, reader, writer, self.idle_timeout)
+        handler = self._make_handler(bridge, writer.get_extra_info("peername")[:2])
+        self.connections += 1
+        detached = False
+        try:
+            while True:
+                if not await bridge.wait_for_head():
+                    break
+                self.busy += 1
+                try:
+                    await loop.run_in_executor(self.executor, handler.handle_one_request)
+                finally:
+                    self.busy -= 1
+                    self.completed += 1
+                # A detached connection (an /api/events stream) is written from elsewhere from now on
+                detached = getattr(handler, "detached", False)
+                if handler.close_connection:
+                    break
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        except Exception as e:
+            print(f"[{time.strftime('%H:%M:%S')}] Connection error from {handler.client_address[0]}: {e}")
+            sys.stdout.flush()
+        finally:
+            self.connections -= 1
+            if not detached:
+                writer.close()
+                try:
+                    await writer.wait_closed()
+                except ConnectionError:
+                    pass
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        host, port = self.server_address
+        self._server = await asyncio.start_server(self._serve_connection, host, port, backlog=1024,
+                                                  reuse_address=True, reuse_port=self.reuse_port or None)
+        async with self._server:
+            await self._server.serve_forever()
+
+    def serve_forever(self):
+        try:
+            asyncio.run(self._serve())
+        except asyncio.CancelledError:
+            pass
+
+    def stats(self):
+        # Counters are only touched on the loop thread, so a plain read is fine
+        return {
+            "mode": "async",
+            "workers": self.workers,
+            "busy": self.busy,
+            "utilisation": round(min(self.busy, self.workers) / self.workers * 100, 1),
+            "queued": max(self.busy - self.workers, 0),
+            "connections": self.connections,
+            "completed": self.completed,
+            "uptime": round(time.time() - self.started)
+        }
+
+    def shutdown(self):
+        if self._loop and self._server:
+            self._loop.call_soon_threadsafe(self._server.close)
+
+    def server_close(self):
+        self.executor.shutdown(wait=False)
@@ -1,55 +1,227 @@
+"""
+Activity Log
+Append-only JSON-lines audit log. log_activity() only queues the entry; one
+background thread appends whatever is queued as a single write and fsyncs once
+per batch. The file rotates by size. Recent entries come from an in-memory
+ring buffer that follows the file, so prefork workers see each other's entries
+(and subscribers are told about them as they are read in).
+Older history is queried through a SQLite index kept in step by the writer.
+"""
+
 import os
 import json
 import time
+import queue
+import threading
+from collections import deque
 from datetime import datetime
+import file_lock
+import activity_index
 
 DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
-LOG_FILE = os.path.join(DATA_DIR, "activity_log.json")
+LOG_FILE = os.path.join(DATA_DIR, "activity_log.jsonl")
+LEGACY_LOG_FILE = os.path.join(DATA_DIR, "activity_log.json")  # old whole-array format, migrated once
+MAX_LOG_BYTES = 16 * 1024 * 1024  # rotate the live file past this size
+KEEP_ROTATED = 20
+RING_SIZE = 1000
+BATCH_WINDOW = 0.05  # seconds the writer waits to gather more entries into one fsync
+TAIL_BYTES = 512 * 1024  # how much of the log is read to fill the ring buffer
+INDEX_FILE = os.path.join(DATA_DIR, "activity.db")
 
-def ensure_log_file():
-    if not os.path.exists(DATA_DIR):
-        os.makedirs(DATA_DIR)
-    if not os.path.exists(LOG_FILE):
-        with open(LOG_FILE, "w") as f:
-            json.dump([], f)
+_queue = queue.Queue()
+_ring = deque(maxlen=RING_SIZE)
+_ring_lock = threading.Lock()
+_follow = {"ino": None, "offset": 0}
+_writer_pid = None
+_start_lock = threading.Lock()
+_subscribers = []
 
-def log_activity(action, filename, ip="Unknown"):
+def subscribe(callback):
+    """callback(entries) with each run of new entries, oldest first, as the ring buffer reads them in"""
+    _subscribers.append(callback)
+
+def _notify(entries):
+    for callback in list(_subscribers):
+        try:
+            callback(entries)
+        except Exception as e:
+            print(f"Activity subscriber failed: {e}")
+
+def _ensure_writer():
+    # Threads don't survive fork(), so each prefork worker starts its own writer
+    global _writer_pid
+    if _writer_pid == os.getpid():
+        return
+    with _start_lock:
+        if _writer_pid == os.getpid():
+            return
+        os.makedirs(DATA_DIR, exist_ok=True)
+        _migrate_legacy()
+        threading.Thread(target=_writer, name="audit-log", daemon=True).start()
+        _writer_pid = os.getpid()
+
+def _migrate_legacy():
+    if not os.path.exists(LEGACY_LOG_FILE):
+        return
+    with file_lock.locked(LOG_FILE):
+        if not os.path.exists(LEGACY_LOG_FILE):
+            return
+        try:
+            with open(LEGACY_LOG_FILE, "r") as f:
+                logs = json.load(f)
+        except (OSError, ValueError):
+            logs = []
+        with open(LOG_FILE, "a", encoding="utf-8") as f:
+            for entry in reversed(logs):  # the old file is newest first
+                f.write(json.dumps(entry) + "\n")
+        os.replace(LEGACY_LOG_FILE, LEGACY_LOG_FILE + ".migrated")
+
+def rotated_files():
+    """Rotated segments, oldest first"""
+    prefix = os.path.basename(LOG_FILE)[:-len(".jsonl")] + "."
+    try:
+        names = os.listdir(DATA_DIR)
+    except OSError:
+        return []
+    live = os.path.basename(LOG_FILE)
+    return sorted(os.path.join(DATA_DIR, n) for n in names if n.startswith(prefix) and n.endswith(".jsonl") and n != live)
+
+def _rotate_if_needed(incoming):
     try:
-        ensure_log_file()
-        
-        entry = {
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "action": action,
-            "filename": filename,
-            "ip": ip,
-            "user": "Admin" # Placeholder for future user accounts
-        }
-        
-        with open(LOG_FILE, "r+") as f:
+        size = os.path.getsize(LOG_FILE)
+    except OSError:
+        return
+    if size + incoming <= MAX_LOG_BYTES:
+        return
+    base = LOG_FILE[:-len(".jsonl")]
+    os.replace(LOG_FILE, f"{base}.{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.jsonl")
+    for old in rotated_files()[:-KEEP_ROTATED]:
+        try: os.remove(old)
+        except OSError: pass
+
+INDEX = activity_index.ActivityIndex(INDEX_FILE, LOG_FILE, rotated_files)
+
+def _writer():
+    while True:
+        batch = [_queue.get()]
+        deadline = time.time() + BATCH_WINDOW
+        while len(batch) < 1000:
             try:
-                logs = json.load(f)
-            except json.JSONDecodeError:
-                logs = []
-                
-            logs.insert(0, entry) # Prepend new log
-            
-            # Keep only last 100 logs
-            if len(logs) > 100:
-                logs = logs[:100]
-                
-            f.seek(0)
-            f.truncate()
-            json.dump(logs, f, indent=2)
-            
-    except Exception as e:
-        print(f"Error logging activity: {e}")
+                batch.append(_queue.get(timeout=max(0, deadline - time.time())))
+            except queue.Empty:
+                break
+        data = "".join(json.dumps(entry) + "\n" for entry in batch).encode("utf-8")
+        try:
+            # Other prefork workers append to (and rotate) the same file
+            with file_lock.locked(LOG_FILE):
+                _rotate_if_needed(len(data))
+                fd = os.open(LOG_FILE, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+                try:
+                    view = memoryview(data)
+                    while view:
+                        view = view[os.write(fd, view):]
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+        except OSError as e:
+            print(f"Error logging activity: {e}")
+        try:
+            INDEX.catch_up()
+        except Exception as e:
+            print(f"Error indexing activity: {e}")  # the next batch or query picks it up
+        finally:
+            for _ in batch:
+                _queue.task_done()
+
+def log_activity(action, filename, ip="Unknown"):
+    now = time.time()
+    entry = {
+        "timestamp": datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S"),
+        "ts": int(now),  # epoch seconds: unlike local time, never goes back at a DST change
+        "action": action,
+        "filename": filename,
+        "ip": ip,
+        "user": "Admin" # Placeholder for future user accounts
+    }
+    _ensure_writer()
+    _queue.put(entry)
+
+def _parse_lines(data):
+    entries = []
+    for line in data.splitlines():
+        try:
+            entries.append(json.loads(line))
+        except ValueError:
+            pass  # torn line at a read boundary
+    return entries
+
+def _read_tail(path, max_bytes):
+    """Entries in the last max_bytes of a file, and the offset just past the last complete line"""
+    with open(path, "rb") as f:
+        start = max(0, os.fstat(f.fileno()).st_size - max_bytes)
+        f.seek(start)
+        data = f.read()
+    end = data.rfind(b"\n") + 1
+    data = data[:end]
+    if start:
+        data = data.split(b"\n", 1)[-1]  # drop the partial first line
+    return _parse_lines(data), start + end
+
+def _catch_up():
+    """Bring the ring buffer up to date with the end of the log file"""
+    try:
+        st = os.stat(LOG_FILE)
+    except OSError:
+        return
+    with _ring_lock:
+        if st.st_ino != _follow["ino"] or st.st_size < _follow["offset"]:
+            # First read or the file was rotated: refill from the newest segments
+            rotated = _follow["ino"] is not None
+            _ring.clear()
+            previous = rotated_files()[-1:]
+            for path in previous:
+                _ring.extend(_read_tail(path, TAIL_BYTES)[0])
+            entries, offset = _read_tail(LOG_FILE, TAIL_BYTES)
+            _ring.extend(entries)
+            _follow.update(ino=st.st_ino, offset=offset)
+            if rotated and entries:
+                _notify(entries)  # everything in a fresh file is new
+            return
+        if st.st_size > _follow["offset"]:
+            with open(LOG_FILE, "rb") as f:
+                f.seek(_follow["offset"])
+                data = f.read(st.st_size - _follow["offset"])
+            complete = data.rfind(b"\n") + 1  # leave a half-written line for next time
+            entries = _parse_lines(data[:complete])
+            _ring.extend(entries)
+            _follow["offset"] += complete
+            if entries:
+                _notify(entries)
+
+def poll():
+    """Read in entries other processes (or this one's writer) appended, notifying subscribers"""
+    try:
+        _catch_up()
+    except OSError:
+        pass
+
+def flush():
+    """Wait until everything logged so far by this process is on disk"""
+    if _writer_pid == os.getpid():
+        _queue.join()
 
 def get_recent_activity(limit=50):
     try:
-        if not os.path.exists(LOG_FILE):
-            return []
-        with open(LOG_FILE, "r") as f:
-            logs = json.load(f)
-            return logs[:limit]
+        _ensure_writer()  # migrates the legacy log on first use
+        _catch_up()  # reads what the writers have appended, without waiting for their queues
+        with _ring_lock:
+            recent = list(_ring)[-limit:]
+        return recent[::-1]  # newest first
     except Exception:
         return []
+
+def query_activity(**filters):
+    """Search the whole history, see activity_index.ActivityIndex.query"""
+    _ensure_writer()
+    INDEX.catch_up()
+    return INDEX.query(**filters)
@@ -0,0 +1,100 @@
+"""
+Byte Range Requests
+RFC 7233 Range / If-Range parsing and multipart/byteranges framing.
+The bodies themselves are streamed by file_transfer, so a range never
+costs more memory than a socket buffer.
+"""
+
+import uuid
+from email.utils import parsedate_to_datetime
+
+import http_cache
+
+# More ranges than this in one request is either a bug or an amplification attempt
+MAX_RANGES = 64
+
+def parse_range_header(header, size):
+    """
+    Parse a Range header against a representation of `size` bytes.
+    Returns:
+        None: header is absent, malformed or not in bytes, so it must be ignored
+        []: syntactically valid but nothing is satisfiable (416)
+        list: sorted, coalesced (start, end) pairs with inclusive ends
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec.strip():
+        return None
+
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part: continue
+        first, sep, last = part.partition("-")
+        first, last = first.strip(), last.strip()
+        if not sep or (first and not first.isdigit()) or (last and not last.isdigit()):
+            return None
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+            if last and end < start:
+                return None
+            if start >= size:
+                continue  # unsatisfiable on its own, others may still match
+            ranges.append((start, min(end, size - 1)))
+        elif last:
+            suffix = int(last)
+            if suffix == 0:
+                continue
+            ranges.append((max(size - suffix, 0), size - 1))
+        else:
+            return None
+
+    if len(ranges) > MAX_RANGES:
+        return None
+    return coalesce(ranges)
+
+def coalesce(ranges):
+    """Merge overlapping or adjacent ranges so no byte is sent twice"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def if_range_allows(headers, etag, mtime):
+    """False when If-Range names an older representation, meaning the full body must be sent"""
+    value = headers.get("If-Range")
+    if not value:
+        return True
+    value = value.strip()
+    if value.startswith('"') or value.startswith("W/"):
+        return http_cache.etag_matches(value, etag, weak=False)
+    try:
+        return int(parsedate_to_datetime(value).timestamp()) == int(mtime)
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return False
+
+class MultipartRanges:
+    """Precomputed multipart/byteranges framing so Content-Length is known up front"""
+
+    def __init__(self, ranges, size, content_type):
+        self.boundary = uuid.uuid4().hex
+        self.parts = []
+        for start, end in ranges:
+            head = (f"\r\n--{self.boundary}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n").encode("latin-1")
+            self.parts.append((head, start, end - start + 1))
+        self.tail = f"\r\n--{self.boundary}--\r\n".encode("latin-1")
+
+    @property
+    def content_type(self):
+        return f"multipart/byteranges; boundary={self.boundary}"
+
+    @property
+    def content_length(self):
+        return sum(len(head) + length for head, _, length in self.parts) + len(self.tail)
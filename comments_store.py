@@ -0,0 +1,166 @@
+"""
+Comments Store
+File metadata in SQLite (data/comments.db, WAL mode, a connection per
+thread). Every file or folder that carries metadata gets a row in `files`
+with a stable id; comments point at that id, not at a path string. Renames,
+moves, deletes (a move into the recycle bin), restores and purges update the
+row in the same request, so comments follow their file. (Inode numbers are
+not used as the id: the filesystem hands a deleted file's inode to the next
+new file, which would pass its comments on to a stranger.)
+
+A file's thread and the comment counts of a whole directory listing are
+single index lookups. The old comments.json is imported once and renamed to
+comments.json.migrated.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+import file_lock
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+DB_FILE = os.path.join(DATA_DIR, "comments.db")
+LEGACY_FILE = os.path.join(DATA_DIR, "comments.json")
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    UNIQUE (dir, name)
+);
+CREATE TABLE IF NOT EXISTS file_comments (
+    id INTEGER PRIMARY KEY,
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    text TEXT, author TEXT, timestamp TEXT
+);
+CREATE INDEX IF NOT EXISTS file_comments_file ON file_comments(file_id);
+"""
+
+def split_path(path):
+    """("folder/sub", "file.jpg") for a client path like "/folder/sub/file.jpg" """
+    path = path.replace("\\", "/").strip("/")
+    folder, _, name = path.rpartition("/")
+    return folder, name
+
+def _subtree(rel):
+    """WHERE clause and args matching `rel` itself and everything below it"""
+    folder, name = split_path(rel)
+    # "/" sorts right before "0", so the range is exactly the paths under rel/
+    return "(dir = ? AND name = ?) OR (dir >= ? AND dir < ?) OR dir = ?", (folder, name, rel + "/", rel + "0", rel)
+
+class CommentStore:
+    def __init__(self, root, db_file=DB_FILE, legacy_file=LEGACY_FILE):
+        self.root = os.path.abspath(root)
+        self.db_file = db_file
+        self.legacy_file = legacy_file
+        self.local = threading.local()
+
+    def _rel(self, abs_path):
+        rel = os.path.relpath(abs_path, self.root).replace("\\", "/")
+        return "" if rel == "." else rel
+
+    def _conn(self):
+        # sqlite3 connections can't be shared between threads: one per thread, opened on first use
+        conn = getattr(self.local, "conn", None)
+        if conn is None or self.local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
+            conn = sqlite3.connect(self.db_file, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            with file_lock.locked(self.db_file):
+                if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                    self._upgrade(conn)
+                self._migrate(conn)
+            self.local.conn, self.local.pid = conn, os.getpid()
+        return conn
+
+    def _upgrade(self, conn):
+        with conn:
+            conn.executescript("BEGIN;" + SCHEMA)
+            columns = [r[1] for r in conn.execute("PRAGMA table_info(comments)")]
+            if "dir" in columns:
+                # Version 1 kept (dir, name) on every comment row
+                conn.execute("INSERT OR IGNORE INTO files (dir, name) SELECT DISTINCT dir, name FROM comments")
+                conn.execute("""INSERT INTO file_comments (file_id, text, author, timestamp)
+                                SELECT f.id, c.text, c.author, c.timestamp FROM comments c
+                                JOIN files f ON f.dir = c.dir AND f.name = c.name ORDER BY c.id""")
+                conn.execute("DROP TABLE comments")
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _migrate(self, conn):
+        if not os.path.exists(self.legacy_file):
+            return
+        with file_lock.locked(self.legacy_file):
+            if not os.path.exists(self.legacy_file):
+                return  # another worker got there first
+            try:
+                with open(self.legacy_file, "r") as f:
+                    legacy = json.load(f)
+            except (OSError, ValueError):
+                legacy = {}
+            count = 0
+            with conn:
+                for path, thread in legacy.items():
+                    file_id = self._file_id(conn, path)
+                    conn.executemany("INSERT INTO file_comments (file_id, text, author, timestamp) VALUES (?, ?, ?, ?)",
+                                     [(file_id, c.get("text"), c.get("author"), c.get("timestamp")) for c in thread])
+                    count += len(thread)
+            os.replace(self.legacy_file, self.legacy_file + ".migrated")
+            print(f"[{time.strftime('%H:%M:%S')}] Migrated {count} comments to {os.path.basename(self.db_file)}")
+
+    def _file_id(self, conn, path):
+        """Id of the row for a client path, creating it if needed"""
+        folder, name = split_path(path)
+        row = conn.execute("SELECT id FROM files WHERE dir = ? AND name = ?", (folder, name)).fetchone()
+        if row:
+            return row[0]
+        return conn.execute("INSERT INTO files (dir, name) VALUES (?, ?)", (folder, name)).lastrowid
+
+    # ===== Comments =====
+
+    def get(self, path):
+        """Comments on one file, oldest first"""
+        rows = self._conn().execute("""SELECT c.text, c.author, c.timestamp FROM files f JOIN file_comments c ON c.file_id = f.id
+                                       WHERE f.dir = ? AND f.name = ? ORDER BY c.id""", split_path(path)).fetchall()
+        return [{"text": t, "author": a, "timestamp": ts} for t, a, ts in rows]
+
+    def add(self, path, text, author):
+        entry = {"text": text, "author": author, "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")}
+        with self._conn() as conn:
+            conn.execute("INSERT INTO file_comments (file_id, text, author, timestamp) VALUES (?, ?, ?, ?)",
+                         (self._file_id(conn, path), text, author, entry["timestamp"]))
+        return entry
+
+    def counts(self, folder):
+        """{name: comment count} for the entries of one folder that have comments"""
+        folder = folder.replace("\\", "/").strip("/")
+        return dict(self._conn().execute("""SELECT f.name, COUNT(*) FROM files f JOIN file_comments c ON c.file_id = f.id
+                                            WHERE f.dir = ? GROUP BY f.id""", (folder,)).fetchall())
+
+    # ===== Keeping rows in step with the filesystem =====
+
+    def move(self, old_abs, new_abs):
+        """A file or folder was moved/renamed: carry its rows (and everything below a folder) along"""
+        old, new = self._rel(old_abs), self._rel(new_abs)
+        if old == new:
+            return
+        conn = self._conn()
+        with file_lock.locked(self.db_file), conn:
+            # Whatever was at the destination has been replaced
+            where, args = _subtree(new)
+            conn.execute(f"DELETE FROM files WHERE {where}", args)
+            conn.execute("UPDATE files SET dir = ?, name = ? WHERE dir = ? AND name = ?", split_path(new) + split_path(old))
+            conn.execute("UPDATE files SET dir = ? || substr(dir, ?) WHERE (dir >= ? AND dir < ?) OR dir = ?",
+                         (new, len(old) + 1, old + "/", old + "0", old))
+
+    def forget(self, abs_path):
+        """A file or folder is gone for good (purged from the recycle bin): drop its rows and comments"""
+        where, args = _subtree(self._rel(abs_path))
+        with self._conn() as conn:
+            conn.execute(f"DELETE FROM files WHERE {where}", args)
@@ -0,0 +1,139 @@
+"""
+Compression Cache
+Content-Encoding negotiation for static files: serves pre-built .gz/.br/.zst
+siblings when present, otherwise compresses once and keeps the result in a
+size-bounded LRU keyed by path + mtime.
+"""
+
+import os
+import gzip
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Files smaller than this don't gain enough to pay for the Content-Encoding dance
+MIN_SIZE = 1024
+# On-the-fly compression is only for UI-sized files; big downloads go out as-is
+MAX_SIZE = 8 * 1024 * 1024
+
+COMPRESSIBLE_TYPES = {
+    "application/javascript", "application/json", "application/xml",
+    "application/xhtml+xml", "application/manifest+json", "application/wasm",
+    "image/svg+xml", "image/x-icon", "image/vnd.microsoft.icon",
+}
+
+# Preference order when the client accepts several encodings equally
+SIBLING_EXT = {"br": ".br", "zstd": ".zst", "gzip": ".gz"}
+
+def _compress_gzip(data):
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+def _compress_br(data):
+    return brotli.compress(data, quality=5)
+
+def _compress_zstd(data):
+    return zstandard.ZstdCompressor(level=10).compress(data)
+
+COMPRESSORS = {"gzip": _compress_gzip}
+if brotli: COMPRESSORS["br"] = _compress_br
+if zstandard: COMPRESSORS["zstd"] = _compress_zstd
+
+def is_compressible(content_type):
+    if not content_type:
+        return False
+    content_type = content_type.split(";")[0].strip().lower()
+    return content_type.startswith("text/") or content_type in COMPRESSIBLE_TYPES
+
+def parse_accept_encoding(header):
+    """Return {coding: qvalue} from an Accept-Encoding header"""
+    accepted = {}
+    for part in (header or "").split(","):
+        part = part.strip()
+        if not part: continue
+        coding, _, params = part.partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try: q = float(params[2:])
+            except ValueError: q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+def negotiate(header, available):
+    """Pick the best coding from `available` (ordered by preference) for an Accept-Encoding header"""
+    accepted = parse_accept_encoding(header)
+    best, best_q = None, 0.0
+    for coding in available:
+        q = accepted.get(coding, accepted.get("*", 0.0))
+        if coding == "gzip" and "x-gzip" in accepted:
+            q = max(q, accepted["x-gzip"])
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+class CompressionCache:
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.total = 0
+        self.entries = OrderedDict()  # (path, coding) -> (mtime_ns, size, data)
+        self.lock = threading.Lock()
+
+    def get(self, path, coding, stat):
+        """Return compressed bytes for `path`, compressing on a miss"""
+        key = (path, coding)
+        with self.lock:
+            hit = self.entries.get(key)
+            if hit and hit[0] == stat.st_mtime_ns and hit[1] == stat.st_size:
+                self.entries.move_to_end(key)
+                return hit[2]
+
+        with open(path, "rb") as f:
+            raw = f.read()
+        data = COMPRESSORS[coding](raw)
+
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old: self.total -= len(old[2])
+            if len(data) <= self.max_bytes:
+                self.entries[key] = (stat.st_mtime_ns, stat.st_size, data)
+                self.total += len(data)
+                while self.total > self.max_bytes:
+                    _, evicted = self.entries.popitem(last=False)
+                    self.total -= len(evicted[2])
+        return data
+
+    def variant(self, path, stat, content_type, accept_encoding):
+        """
+        Choose how to encode a static file for this request.
+        Returns:
+            None to send the file as-is, otherwise (coding, sibling_path) where
+            sibling_path is a pre-built compressed file or None to use get()
+        """
+        if stat.st_size < MIN_SIZE or not is_compressible(content_type):
+            return None
+
+        siblings = {}
+        for coding, ext in SIBLING_EXT.items():
+            try:
+                s = os.stat(path + ext)
+            except OSError:
+                continue
+            if s.st_mtime_ns >= stat.st_mtime_ns:
+                siblings[coding] = path + ext
+        if stat.st_size > MAX_SIZE:
+            available = [c for c in SIBLING_EXT if c in siblings]
+        else:
+            available = [c for c in SIBLING_EXT if c in siblings or c in COMPRESSORS]
+        coding = negotiate(accept_encoding, available)
+        if coding is None:
+            return None
+        return coding, siblings.get(coding)
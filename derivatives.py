@@ -0,0 +1,287 @@
+"""
+Derivative Pre-warming
+Background queue that prepares what the UI will ask for about new files before
+anyone opens their folder: grid thumbnails, image dimensions and EXIF
+orientation, and the duration of MP4/MOV videos (read from the container
+header, no decoding). Jobs come from fs_events (uploads, renames, restores,
+external copies) and from folders being viewed, which are served first.
+
+Work runs on a few low-priority threads that also back off while foreground
+thumbnail requests are in progress. Media info is kept in memory, persisted
+to data/media_info.json and served by /api/media_info.
+"""
+
+import os
+import json
+import time
+import struct
+import threading
+from collections import OrderedDict, deque
+
+import file_lock
+import fs_events
+import thumbnails
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+INFO_FILE = os.path.join(DATA_DIR, "media_info.json")
+SAVE_INTERVAL = 30
+VIEW_WINDOW = 300  # seconds a viewed folder keeps its priority
+WARM_SIZES = ("small", "medium")  # what the list and grid views request
+VIDEO_EXTENSIONS = {"mp4", "m4v", "mov", "3gp"}
+
+def mp4_duration(path):
+    """Duration in seconds from an MP4/MOV moov/mvhd box, or None"""
+    with open(path, "rb") as f:
+        end = os.fstat(f.fileno()).st_size
+        pos, limit = 0, end
+        while pos + 8 <= limit:
+            f.seek(pos)
+            size, kind = struct.unpack(">I4s", f.read(8))
+            header = 8
+            if size == 1:
+                size, header = struct.unpack(">Q", f.read(8))[0], 16
+            elif size == 0:
+                size = limit - pos
+            if size < header:
+                return None
+            if kind == b"moov":
+                pos, limit = pos + header, pos + size  # descend
+                continue
+            if kind == b"mvhd":
+                version = f.read(1)[0]
+                f.read(3)
+                if version == 1:
+                    _, _, timescale, duration = struct.unpack(">QQIQ", f.read(28))
+                else:
+                    _, _, timescale, duration = struct.unpack(">IIII", f.read(16))
+                return round(duration / timescale, 3) if timescale else None
+            pos += size
+    return None
+
+def probe(path):
+    """Cheap metadata for a media file: {"width", "height", "orientation"} or {"duration"}"""
+    ext = thumbnails.extension(path)
+    if ext in VIDEO_EXTENSIONS:
+        duration = mp4_duration(path)
+        return {"duration": duration} if duration is not None else {}
+    if ext in thumbnails.IMAGE_EXTENSIONS and thumbnails.Image is not None:
+        with thumbnails.Image.open(path) as img:  # reads the header only
+            width, height = img.size
+            orientation = img.getexif().get(0x0112, 1)
+        if orientation in (5, 6, 7, 8):
+            width, height = height, width  # report the upright size
+        return {"width": width, "height": height, "orientation": orientation}
+    return {}
+
+class DerivativeQueue:
+    def __init__(self, root, hidden_folders, thumbs, workers=1, info_file=INFO_FILE):
+        self.root = os.path.abspath(root)
+        self.hidden = set(hidden_folders)
+        self.thumbs = thumbs
+        self.workers = workers
+        self.info_file = info_file
+        self.info = {}  # rel_dir -> {name: {"size", "mtime", ...probe fields}}
+        self.pending = OrderedDict()  # abs folder -> deque of file names, oldest folder first
+        self.queued = set()
+        self.scans = deque()  # (abs folder, recursive) still to be listed
+        self.viewed = {}  # abs folder -> last time it was listed
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.dirty = False
+        self.fmt = "webp" if thumbnails.webp_available() else "jpeg"
+        fs_events.subscribe(self.on_change)
+
+    def _rel(self, abs_path):
+        rel = os.path.relpath(abs_path, self.root).replace("\\", "/")
+        return "" if rel == "." else rel
+
+    def _wanted(self, path):
+        if path != self.root and not path.startswith(self.root + os.sep):
+            return False
+        return not any(part in self.hidden for part in self._rel(path).split("/"))
+
+    # ===== Queue =====
+
+    def enqueue(self, path):
+        """Queue a file, or (listed later on a worker) every file directly inside a folder"""
+        if not self.workers or not self._wanted(path):
+            return
+        if os.path.isdir(path):
+            self._queue_scan(path, False)
+        else:
+            self._queue_files(os.path.dirname(path), [os.path.basename(path)])
+
+    def _queue_scan(self, folder, recursive, first=False):
+        with self.lock:
+            if first:
+                self.scans.appendleft((folder, recursive))
+            else:
+                self.scans.append((folder, recursive))
+            self.wakeup.notify_all()
+
+    def _queue_files(self, folder, names):
+        names = [n for n in names if thumbnails.supported(n) or thumbnails.extension(n) in VIDEO_EXTENSIONS]
+        if not names:
+            return
+        with self.lock:
+            jobs = self.pending.setdefault(folder, deque())
+            for name in names:
+                key = os.path.join(folder, name)
+                if key not in self.queued:
+                    self.queued.add(key)
+                    jobs.append(name)
+            self.wakeup.notify_all()
+
+    def _scan(self, folder, recursive):
+        """List a folder, or a whole moved-in subtree, and queue its media files"""
+        if not recursive:
+            try:
+                names = [e.name for e in os.scandir(folder) if e.is_file()]
+            except OSError:
+                return
+            self._queue_files(folder, names)
+            return
+        for root, dirs, files in os.walk(folder):
+            dirs[:] = [d for d in dirs if d not in self.hidden]
+            self._queue_files(root, files)
+
+    def mark_viewed(self, folder):
+        """A client listed this folder: its jobs jump the queue, and anything not yet prepared is queued"""
+        folder = os.path.normpath(folder)
+        with self.lock:
+            first = folder not in self.viewed
+            self.viewed[folder] = time.time()
+            if len(self.viewed) > 1000:
+                cutoff = time.time() - VIEW_WINDOW
+                self.viewed = {f: t for f, t in self.viewed.items() if t > cutoff}
+        if first and self.workers and self._wanted(folder):
+            # The listing is left to a worker: this runs on the request thread
+            self._queue_scan(folder, False, first=True)
+
+    def _next(self):
+        """
+        Pop the next job: folder scans first, then a file of the most recently viewed
+        folder, otherwise of the oldest queued folder.
+        Returns:
+            tuple: ("scan", folder, recursive) or ("file", folder, name)
+        """
+        with self.lock:
+            while not self.pending and not self.scans:
+                self.wakeup.wait()
+            if self.scans:
+                return ("scan",) + self.scans.popleft()
+            now = time.time()
+            hot = [f for f in self.pending if now - self.viewed.get(f, 0) < VIEW_WINDOW]
+            folder = max(hot, key=self.viewed.get) if hot else next(iter(self.pending))
+            jobs = self.pending[folder]
+            name = jobs.popleft()
+            if not jobs:
+                del self.pending[folder]
+            self.queued.discard(os.path.join(folder, name))
+            return "file", folder, name
+
+    def _worker(self):
+        try:
+            # Lowest CPU priority for this thread only (Linux threads are schedulable tasks)
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except (AttributeError, OSError):
+            pass
+        while True:
+            kind, folder, arg = self._next()
+            if kind == "scan":
+                try:
+                    self._scan(folder, arg)
+                except Exception as e:
+                    print(f"[{time.strftime('%H:%M:%S')}] Pre-warm scan failed for {folder}: {e}")
+                continue
+            while self.thumbs.busy():
+                time.sleep(0.2)  # someone is waiting on a thumbnail right now
+            try:
+                self.process(os.path.join(folder, arg))
+            except Exception as e:
+                print(f"[{time.strftime('%H:%M:%S')}] Pre-warm failed for {arg}: {e}")
+
+    def process(self, path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        rel_dir, name = self._rel(os.path.dirname(path)), os.path.basename(path)
+        with self.lock:
+            known = self.info.get(rel_dir, {}).get(name)
+        if not known or known["size"] != st.st_size or known["mtime"] != st.st_mtime_ns:
+            try:
+                info = probe(path)
+            except Exception:
+                info = {}
+            info.update(size=st.st_size, mtime=st.st_mtime_ns)
+            with self.lock:
+                self.info.setdefault(rel_dir, {})[name] = info
+                self.dirty = True
+        if thumbnails.supported(path):
+            for size in WARM_SIZES:
+                self.thumbs.ensure(path, st, thumbnails.SIZES[size], self.fmt)
+
+    def on_change(self, kind, path, is_dir):
+        if kind == fs_events.CREATED or (kind == fs_events.MODIFIED and is_dir is False):
+            if path == self.root:
+                return  # watcher overflow: folders are re-queued as they are viewed
+            if is_dir or os.path.isdir(path):
+                # A moved-in or restored folder: prepare its whole subtree (walked by a worker)
+                if self.workers and self._wanted(path):
+                    self._queue_scan(path, True)
+            else:
+                self.enqueue(path)
+        elif kind == fs_events.DELETED:
+            rel = self._rel(path)
+            rel_dir, _, name = rel.rpartition("/")
+            with self.lock:
+                if self.info.get(rel_dir, {}).pop(name, None) is not None:
+                    self.dirty = True
+                for d in [d for d in self.info if d == rel or d.startswith(rel + "/")]:
+                    del self.info[d]
+                    self.dirty = True
+                self.viewed.pop(path, None)
+
+    # ===== Queries / lifecycle =====
+
+    def folder_info(self, abs_folder):
+        """{name: info} for the prepared media files of a folder"""
+        with self.lock:
+            return dict(self.info.get(self._rel(abs_folder), {}))
+
+    def load(self):
+        try:
+            with file_lock.locked(self.info_file), open(self.info_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("root") == self.root:
+                with self.lock:
+                    self.info = data.get("folders", {})
+        except (OSError, ValueError):
+            pass
+
+    def save(self):
+        with self.lock:
+            data = json.dumps({"root": self.root, "folders": self.info}, separators=(",", ":"))
+            self.dirty = False
+        os.makedirs(os.path.dirname(self.info_file), exist_ok=True)
+        with file_lock.locked(self.info_file):
+            tmp = f"{self.info_file}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp, self.info_file)
+
+    def _saver(self):
+        while True:
+            time.sleep(SAVE_INTERVAL)
+            if self.dirty:
+                try: self.save()
+                except OSError as e: print(f"[{time.strftime('%H:%M:%S')}] Media info save failed: {e}")
+
+    def start(self):
+        if not self.workers:
+            return
+        self.load()
+        for i in range(self.workers):
+            threading.Thread(target=self._worker, name=f"prewarm-{i}", daemon=True).start()
+        threading.Thread(target=self._saver, name="prewarm-saver", daemon=True).start()
@@ -0,0 +1,231 @@
+"""
+Server-Sent Events
+Push channel for the web UI (/api/events), so it doesn't have to poll.
+Each client picks its topics and the folder it is viewing when it connects:
+
+    dir       an entry of the viewed folder was created, deleted or modified
+    sysinfo   every sysinfo_sampler snapshot
+    activity  new activity log entries (also those written by other prefork workers)
+
+The request thread only writes the response head. The connection is then
+detached from the server and all streams are written by one "events" thread
+with non-blocking sends, so an open tab holds no request worker. A client
+that falls too far behind gets one "resync" event instead of the backlog.
+A comment line is sent when nothing else has been for `heartbeat` seconds,
+which keeps proxies from closing the stream and notices dead clients.
+"""
+
+import os
+import json
+import time
+import socket
+import threading
+from collections import deque
+
+import audit_logger
+import fs_events
+
+TOPICS = ("dir", "sysinfo", "activity")
+MAX_PENDING = 256  # events queued for one client before it is told to resync
+MAX_STALL = 60     # seconds a client may leave data unsent before it is dropped
+ACTIVITY_POLL = 1  # seconds between checks for entries written by other processes
+
+def encode(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode()
+
+class SocketSink:
+    """Non-blocking writes to the connection's socket (threaded and pool modes)"""
+    def __init__(self, sock):
+        self.sock = sock
+        sock.setblocking(False)
+
+    def send(self, data):
+        try:
+            return self.sock.send(data)
+        except BlockingIOError:
+            return 0
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+        self.sock.close()
+
+class LoopSink:
+    """Writes through the asyncio transport of async mode's connection bridge"""
+    def __init__(self, bridge):
+        self.loop = bridge.loop
+        self.writer = bridge.writer  # keeps the StreamWriter (which closes on collection) alive
+
+    def send(self, data):
+        transport = self.writer.transport
+        if transport.is_closing():
+            raise ConnectionResetError("stream closed")
+        if transport.get_write_buffer_size() > 64 * 1024:
+            return 0
+        self.loop.call_soon_threadsafe(transport.write, bytes(data))
+        return len(data)
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.writer.close)
+
+class Client:
+    def __init__(self, topics, folder, admin):
+        self.topics = topics
+        self.folder = folder
+        self.admin = admin
+        self.pending = deque()  # encoded events, guarded by the hub lock
+        self.out = b""          # what is left of the event being sent
+        self.sink = None        # set once the response head is out
+        self.last_write = time.monotonic()
+
+    def put(self, payload):
+        if len(self.pending) >= MAX_PENDING:
+            # Too far behind: drop the backlog, the client refetches what it shows
+            self.pending.clear()
+            payload = encode("resync", {})
+        self.pending.append(payload)
+
+class EventHub:
+    def __init__(self, root, hidden_folders=(), sampler=None, max_clients=64, heartbeat=15):
+        self.root = os.path.abspath(root)
+        self.hidden = set(hidden_folders)
+        self.sampler = sampler
+        self.max_clients = max_clients
+        self.heartbeat = heartbeat
+        self.clients = set()
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        fs_events.subscribe(self.on_change)
+        audit_logger.subscribe(self.on_activity)
+        if sampler:
+            sampler.subscribe(self.on_sysinfo)
+
+    def _rel(self, abs_path):
+        rel = os.path.relpath(abs_path, self.root).replace("\\", "/")
+        return "" if rel == "." else rel
+
+    def _publish(self, topic, data, wants=None, event=None):
+        payload = encode(event or topic, data)
+        with self.lock:
+            for client in self.clients:
+                if topic in client.topics and (wants is None or wants(client)):
+                    client.put(payload)
+        self.wake.set()
+
+    def visible(self, folder, admin):
+        """Whether a client may watch `folder`: hidden folders are for admins, as in /api/list"""
+        return admin or not any(part in self.hidden for part in folder.replace("\\", "/").split("/"))
+
+    # ===== Sources =====
+
+    def on_change(self, kind, path, is_dir):
+        if path == self.root:
+            # Watcher overflow: nobody knows what changed, every open folder reloads
+            self._publish("dir", {}, event="resync")
+            return
+        if not path.startswith(self.root + os.sep):
+            return
+        rel = self._rel(path)
+        folder = rel.rpartition("/")[0]
+        hidden = not self.visible(rel, False)
+        data = {"path": folder, "name": os.path.basename(path), "kind": kind, "is_dir": is_dir}
+        # Clients viewing the parent folder, or the changed folder itself (or something inside it)
+        self._publish("dir", data, lambda c: (c.admin or not hidden) and
+                      (c.folder == folder or c.folder == rel or c.folder.startswith(rel + "/")))
+
+    def on_sysinfo(self, snapshot):
+        self._publish("sysinfo", snapshot)
+
+    def on_activity(self, entries):
+        self._publish("activity", entries)
+
+    def _poll_activity(self):
+        while True:
+            time.sleep(ACTIVITY_POLL)
+            with self.lock:
+                wanted = any("activity" in c.topics for c in self.clients)
+            if wanted:
+                audit_logger.poll()
+
+    # ===== Writer =====
+
+    def _flush(self, client, now):
+        """Send what the client has queued. False if its socket is full."""
+        while True:
+            if not client.out:
+                with self.lock:
+                    if client.pending:
+                        client.out = client.pending.popleft()
+                if not client.out:
+                    if now - client.last_write < self.heartbeat:
+                        return True
+                    client.out = b": ping\n\n"
+            sent = client.sink.send(client.out)
+            if not sent:
+                return False
+            client.out = client.out[sent:]
+            client.last_write = now
+
+    def _write_loop(self):
+        wait = 1
+        while True:
+            self.wake.wait(wait)
+            self.wake.clear()
+            now = time.monotonic()
+            with self.lock:
+                clients = [c for c in self.clients if c.sink]
+            stalled = False
+            for client in clients:
+                try:
+                    if self._flush(client, now):
+                        continue
+                    if now - client.last_write < MAX_STALL:
+                        stalled = True
+                        continue
+                except OSError:
+                    pass  # client went away
+                self.disconnect(client)
+            # A full socket has no wake-up of its own: retry it soon
+            wait = 0.05 if stalled else 1
+
+    def start(self):
+        threading.Thread(target=self._write_loop, name="events", daemon=True).start()
+        threading.Thread(target=self._poll_activity, name="events-activity", daemon=True).start()
+
+    # ===== Clients =====
+
+    def connect(self, topics, folder, admin=False):
+        """A new Client, or None when max_clients streams are already open"""
+        with self.lock:
+            if len(self.clients) >= self.max_clients:
+                return None
+            client = Client(topics, folder.replace("\\", "/").strip("/"), admin)
+            self.clients.add(client)
+        if "activity" in topics:
+            audit_logger.poll()  # start following the log from here
+        return client
+
+    def hello(self, client):
+        hello = {"topics": sorted(client.topics), "path": client.folder, "heartbeat": self.heartbeat}
+        return b"retry: 3000\n" + encode("hello", hello)
+
+    def attach(self, handler, client):
+        """Take over the handler's connection (its response head already sent) and stream to it from now on"""
+        conn = handler.connection
+        sink = SocketSink(conn) if isinstance(conn, socket.socket) else LoopSink(conn)
+        # Tells the server not to close the connection when the handler returns
+        handler.detached = True
+        snapshot = self.sampler.latest() if "sysinfo" in client.topics and self.sampler else None
+        if snapshot is not None:
+            with self.lock:
+                client.pending.appendleft(encode("sysinfo", snapshot))
+        client.sink = sink
+        self.wake.set()
+
+    def disconnect(self, client):
+        with self.lock:
+            self.clients.discard(client)
+        if client.sink:
+            client.sink.close()
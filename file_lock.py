@@ -0,0 +1,72 @@
+"""
+File Locks
+Exclusive lock around read-modify-write of shared data files. Serialises
+threads inside one process and, through an OS lock on a sidecar .lock file,
+the worker processes of prefork mode. Shared holders (shared=True) run
+side by side but keep exclusive ones out.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+class _SharedLock:
+    """Readers-writer lock between the threads of one process"""
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.readers = 0
+        self.writer = False
+
+    @contextmanager
+    def hold(self, shared):
+        with self.cond:
+            self.cond.wait_for(lambda: not self.writer and (shared or not self.readers))
+            if shared: self.readers += 1
+            else: self.writer = True
+        try:
+            yield
+        finally:
+            with self.cond:
+                if shared: self.readers -= 1
+                else: self.writer = False
+                self.cond.notify_all()
+
+def _thread_lock(path):
+    with _thread_locks_guard:
+        if path not in _thread_locks:
+            _thread_locks[path] = _SharedLock()
+        return _thread_locks[path]
+
+@contextmanager
+def locked(path, shared=False):
+    """Hold a lock for `path` (the data file itself is never locked directly)"""
+    lock_path = os.path.abspath(path) + ".lock"
+    with _thread_lock(lock_path).hold(shared):
+        if shared and not fcntl:
+            yield  # msvcrt has no shared mode; Windows has no prefork workers to keep out either
+            return
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        with open(lock_path, "a+b") as f:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                # LK_LOCK retries for ~10s before raising, plenty for a JSON rewrite
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
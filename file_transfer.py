@@ -0,0 +1,96 @@
+"""
+File Transfer Helpers
+Moves file bytes onto the client socket without staging them in Python memory
+"""
+
+import os
+import socket
+
+# Read size for the fallback path (wrapped sockets, platforms without sendfile)
+CHUNK_SIZE = 256 * 1024
+
+def _raw_socket(handler):
+    """Return the handler's plain TCP socket, or None when sendfile can't be used on it"""
+    sock = getattr(handler, "connection", None)
+    if not hasattr(os, "sendfile") or type(sock) is not socket.socket:
+        # SSL-wrapped or adapted connections must go through wfile
+        return None
+    return sock
+
+def copy_range(f, out, offset, length, chunk_size=CHUNK_SIZE):
+    """Copy `length` bytes of `f` starting at `offset` into a writable stream using one reusable buffer"""
+    f.seek(offset)
+    buf = bytearray(min(chunk_size, max(length, 1)))
+    view = memoryview(buf)
+    remaining = length
+    while remaining > 0:
+        n = f.readinto(view[:min(remaining, len(buf))])
+        if not n: break
+        out.write(view[:n])
+        remaining -= n
+    return length - remaining
+
+def send_file_range(handler, f, offset, length):
+    """
+    Send `length` bytes of an open binary file starting at `offset` to the client.
+    Uses the kernel's sendfile when the connection is a plain socket, otherwise
+    falls back to a bounded chunked copy into handler.wfile.
+    Returns:
+        int: Number of bytes sent
+    """
+    if length <= 0:
+        return 0
+    handler.wfile.flush()  # headers must hit the socket before the body does
+    if hasattr(handler.wfile, "sendfile"):
+        # Asyncio engine: the event loop owns the socket and does its own sendfile
+        return handler.wfile.sendfile(f, offset, length)
+    sock = _raw_socket(handler)
+    if sock is not None:
+        # socket.sendfile() already degrades to send() when the kernel refuses sendfile
+        return sock.sendfile(f, offset, length)
+    return copy_range(f, handler.wfile, offset, length)
+
+class ChunkedWriter:
+    """
+    File-like wrapper that frames writes with HTTP/1.1 chunked transfer encoding,
+    for bodies whose length isn't known up front. Small writes are coalesced into
+    CHUNK_SIZE chunks; close() sends the terminating chunk.
+    """
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+        self.buf = bytearray()
+
+    def _emit(self):
+        if self.buf:
+            self.wfile.write(b"%x\r\n" % len(self.buf) + self.buf + b"\r\n")
+            self.buf.clear()
+
+    def write(self, data):
+        self.buf += data
+        if len(self.buf) >= CHUNK_SIZE:
+            self._emit()
+        return len(data)
+
+    def flush(self):
+        self._emit()
+        self.wfile.flush()
+
+    def close(self):
+        self._emit()
+        self.wfile.write(b"0\r\n\r\n")
+
+def start_streaming(handler):
+    """
+    Finish the headers of a response of unknown length and return a writer for the body.
+    HTTP/1.1 clients get chunked encoding and keep their connection; HTTP/1.0
+    clients get the raw stream and a closed connection to mark the end.
+    """
+    if handler.request_version == "HTTP/1.1" and handler.protocol_version == "HTTP/1.1":
+        handler.send_header("Transfer-Encoding", "chunked")
+        handler.end_headers()
+        return ChunkedWriter(handler.wfile)
+    handler.send_header("Connection", "close")
+    handler.close_connection = True
+    handler.end_headers()
+    return None
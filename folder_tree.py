@@ -0,0 +1,134 @@
+"""
+Folder Tree
+In-memory tree of every (non-hidden) folder under UPLOAD_ROOT for the move
+dialog's /api/all_folders. Built once in the background at startup, then
+patched from fs_events (changes that arrive while a build walks the tree
+are queued and replayed onto its result); the full flat list is kept
+pre-serialized.
+"""
+
+import os
+import json
+import time
+import threading
+
+import fs_events
+
+class FolderTree:
+    def __init__(self, root, hidden_folders):
+        self.root = os.path.abspath(root)
+        self.hidden = set(hidden_folders)
+        self.children = {"": set()}  # rel_path -> set of child folder names
+        self.lock = threading.RLock()
+        self.ready = False
+        self.pending = None  # fs events queued while a build runs (None when none is running)
+        self.again = False   # a watcher overflow hit the running build: walk again
+        self._json = None
+        fs_events.subscribe(self.on_change)
+
+    def _rel(self, abs_path):
+        rel = os.path.relpath(abs_path, self.root).replace("\\", "/")
+        return "" if rel == "." else rel
+
+    def _scan(self, rel_path):
+        """Walk a subtree from disk into a fresh {rel_path: children} map"""
+        base = os.path.join(self.root, rel_path) if rel_path else self.root
+        found = {}
+        for root, dirs, _ in os.walk(base):
+            dirs[:] = [d for d in dirs if d not in self.hidden]
+            found[self._rel(root)] = set(dirs)
+        return found
+
+    def build(self):
+        with self.lock:
+            if self.pending is not None:
+                self.again = True  # one is already running: it goes round once more
+                return
+            self.pending = []
+        started = time.time()
+        while True:
+            found = self._scan("")
+            with self.lock:
+                if self.again:
+                    self.again, self.pending = False, []
+                    continue
+                self.children = found
+                self.children.setdefault("", set())
+                self._json = None
+                self.ready = True
+                events, self.pending = self.pending, None
+                for event in events:
+                    self._apply(*event)
+            break
+        print(f"[{time.strftime('%H:%M:%S')}] Folder tree ready: {len(found)} folders in {time.time() - started:.1f}s")
+
+    def start(self):
+        threading.Thread(target=self.build, name="folder-tree", daemon=True).start()
+
+    def _drop(self, rel_path):
+        for name in self.children.pop(rel_path, ()):
+            self._drop(f"{rel_path}/{name}" if rel_path else name)
+
+    def on_change(self, kind, path, is_dir):
+        if is_dir is False or (kind == fs_events.MODIFIED and path != self.root):
+            return
+        if not (path == self.root or path.startswith(self.root + os.sep)):
+            return
+        if path == self.root:
+            # Watcher overflow: start over
+            threading.Thread(target=self.build, name="folder-tree", daemon=True).start()
+            return
+        with self.lock:
+            if self.pending is not None:
+                # The build in progress replaces self.children, so replay this onto its result
+                self.pending.append((kind, path, is_dir))
+        self._apply(kind, path, is_dir)
+
+    def _apply(self, kind, path, is_dir):
+        rel = self._rel(path)
+        parent, _, name = rel.rpartition("/")
+        if name in self.hidden or parent not in self.children:
+            return  # inside a hidden folder (or a folder we don't track)
+        if kind == fs_events.CREATED:
+            if not os.path.isdir(path):
+                return
+            found = self._scan(rel)
+            with self.lock:
+                if parent in self.children:
+                    self.children[parent].add(name)
+                    self.children.update(found)
+                    self._json = None
+        elif kind == fs_events.DELETED:
+            with self.lock:
+                if name in self.children.get(parent, ()):
+                    self.children[parent].discard(name)
+                    self._drop(rel)
+                    self._json = None
+
+    def all_json(self):
+        """Every folder as a sorted flat JSON list, serialized once per change"""
+        with self.lock:
+            if self._json is None:
+                self._json = json.dumps(sorted(self.children)).encode()
+            return self._json
+
+    def subtree(self, rel_path="", depth=None):
+        """
+        Folders under rel_path (inclusive), at most `depth` levels below it.
+        Returns:
+            list: [{"path", "has_children"}] sorted by path, or None if rel_path isn't a known folder
+        """
+        rel_path = rel_path.strip("/")
+        with self.lock:
+            if rel_path not in self.children:
+                return None
+            result = []
+            stack = [(rel_path, 0)]
+            while stack:
+                path, level = stack.pop()
+                kids = self.children.get(path, ())
+                result.append({"path": path, "has_children": bool(kids)})
+                if depth is None or level < depth:
+                    stack.extend((f"{path}/{k}" if path else k, level + 1) for k in kids)
+        result.sort(key=lambda x: x["path"])
+        return result
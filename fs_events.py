@@ -0,0 +1,179 @@
+"""
+Filesystem Change Events
+Single place that announces "something under UPLOAD_ROOT changed". The
+server's own mutation handlers publish here directly, and on Linux an
+inotify watcher publishes changes made by anything else (SMB shares, cp,
+other programs). Caches subscribe and invalidate or patch themselves.
+
+Callbacks receive (kind, abs_path, is_dir) where kind is one of
+"created", "deleted" or "modified" and is_dir may be None when unknown.
+A move is published as "deleted" for the old path plus "created" for the new one.
+
+With the watcher running, a handler's own change is seen twice (published by
+the handler, then reported by inotify, or the other way round). Whichever
+copy arrives second within ECHO_WINDOW seconds is dropped, so subscribers
+hear of every change once.
+"""
+
+import os
+import sys
+import time
+import errno
+import ctypes
+import struct
+import threading
+
+CREATED, DELETED, MODIFIED = "created", "deleted", "modified"
+
+ECHO_WINDOW = 5  # seconds a handler's publish and the watcher's report of it are paired
+
+_subscribers = []
+_watcher = None
+_unpaired = {}  # (kind, path) -> (time, from_watcher), oldest first
+_unpaired_lock = threading.Lock()
+
+def subscribe(callback):
+    _subscribers.append(callback)
+
+def _is_echo(kind, path, from_watcher):
+    """True if this is the second report of a change already published by the other side"""
+    now = time.monotonic()
+    with _unpaired_lock:
+        while _unpaired:
+            key = next(iter(_unpaired))
+            if now - _unpaired[key][0] < ECHO_WINDOW:
+                break
+            del _unpaired[key]
+        first = _unpaired.pop((kind, path), None)
+        if first and first[1] != from_watcher:
+            return True
+        _unpaired[(kind, path)] = (now, from_watcher)
+        return False
+
+def publish(kind, path, is_dir=None, from_watcher=False):
+    path = os.path.normpath(path)
+    if watching() and _is_echo(kind, path, from_watcher):
+        return
+    for callback in list(_subscribers):
+        try:
+            callback(kind, path, is_dir)
+        except Exception as e:
+            print(f"[{time.strftime('%H:%M:%S')}] fs_events subscriber failed: {e}")
+
+def publish_move(old_path, new_path, is_dir=None):
+    publish(DELETED, old_path, is_dir)
+    publish(CREATED, new_path, is_dir)
+
+def watching():
+    """True while a healthy watcher reports every change, so caches may skip revalidation"""
+    return _watcher is not None and _watcher.healthy
+
+def start_watcher(root, exclude=()):
+    """Start the background watcher for `root` if the platform supports it"""
+    global _watcher
+    if _watcher is not None or not sys.platform.startswith("linux"):
+        return _watcher
+    try:
+        _watcher = InotifyWatcher(root, exclude)
+        _watcher.start()
+    except OSError as e:
+        print(f"[{time.strftime('%H:%M:%S')}] File watcher unavailable, caches will revalidate by mtime: {e}")
+        _watcher = None
+    return _watcher
+
+# ===== inotify (Linux) =====
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_CLOSE_WRITE | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+EVENT_HEADER = struct.Struct("iIII")
+
+class InotifyWatcher(threading.Thread):
+    def __init__(self, root, exclude=()):
+        super().__init__(name="fs-watcher", daemon=True)
+        self.root = os.path.abspath(root)
+        self.exclude = set(exclude)
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.wds = {}  # wd -> directory path
+        self.healthy = True
+        self.add_tree(self.root)
+
+    def add_watch(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                # Out of watches (fs.inotify.max_user_watches): we can no longer see everything
+                if self.healthy:
+                    print(f"[{time.strftime('%H:%M:%S')}] inotify watch limit reached, falling back to mtime checks")
+                self.healthy = False
+            return
+        self.wds[wd] = path
+
+    def add_tree(self, path):
+        self.add_watch(path)
+        for root, dirs, _ in os.walk(path):
+            dirs[:] = [d for d in dirs if d not in self.exclude]
+            for d in dirs:
+                self.add_watch(os.path.join(root, d))
+
+    def run(self):
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except InterruptedError:
+                continue
+            except OSError as e:
+                print(f"[{time.strftime('%H:%M:%S')}] File watcher stopped: {e}")
+                self.healthy = False
+                return
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+                self.dispatch(wd, mask, os.fsdecode(name))
+
+    def dispatch(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            # Events were dropped: tell everyone the whole tree may have changed
+            publish(MODIFIED, self.root, True)
+            return
+        directory = self.wds.get(wd)
+        if directory is None:
+            return
+        if mask & IN_IGNORED:
+            self.wds.pop(wd, None)
+            return
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            return  # reported by the parent directory's watch
+        if name in self.exclude:
+            return
+        path = os.path.join(directory, name)
+        is_dir = bool(mask & IN_ISDIR)
+        if mask & (IN_CREATE | IN_MOVED_TO):
+            if is_dir:
+                self.add_tree(path)
+            publish(CREATED, path, is_dir, True)
+        elif mask & (IN_DELETE | IN_MOVED_FROM):
+            publish(DELETED, path, is_dir, True)
+        else:
+            publish(MODIFIED, path, is_dir, True)
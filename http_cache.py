@@ -0,0 +1,68 @@
+"""
+HTTP Cache Validators
+ETag / Last-Modified generation and conditional request evaluation (RFC 7232)
+"""
+
+import time
+from email.utils import formatdate, parsedate_to_datetime
+
+def make_etag(stat, suffix=""):
+    """
+    Build an ETag from (inode, size, mtime).
+    Files touched within the last second are tagged weak, since a second write
+    inside the same mtime tick would otherwise keep the same strong tag.
+    """
+    tag = f'"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}{suffix}"'
+    if time.time() - stat.st_mtime < 1:
+        return "W/" + tag
+    return tag
+
+def http_date(timestamp):
+    return formatdate(timestamp, usegmt=True)
+
+def _opaque(tag):
+    return tag[2:] if tag.startswith("W/") else tag
+
+def etag_matches(header, etag, weak=True):
+    """Check an If-None-Match / If-Match style header against an ETag"""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if weak:
+            if _opaque(candidate) == _opaque(etag): return True
+        elif not candidate.startswith("W/") and not etag.startswith("W/") and candidate == etag:
+            return True
+    return False
+
+def not_modified_since(header, mtime):
+    """True when the file has not changed since the If-Modified-Since date"""
+    if not header:
+        return False
+    try:
+        since = parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return False
+    return int(mtime) <= int(since)
+
+def is_not_modified(headers, etag, mtime):
+    """Evaluate If-None-Match (preferred) then If-Modified-Since for a GET/HEAD"""
+    inm = headers.get("If-None-Match")
+    if inm is not None:
+        return etag_matches(inm, etag)
+    return not_modified_since(headers.get("If-Modified-Since"), mtime)
+
+def send_validators(handler, etag, mtime, cache_control=None, vary=None):
+    handler.send_header("ETag", etag)
+    if vary:
+        handler.send_header("Vary", vary)
+    handler.send_header("Last-Modified", http_date(mtime))
+    if cache_control:
+        handler.send_header("Cache-Control", cache_control)
+
+def send_not_modified(handler, etag, mtime, cache_control=None, vary=None):
+    handler.send_response(304)
+    send_validators(handler, etag, mtime, cache_control, vary)
+    handler.end_headers()
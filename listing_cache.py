@@ -0,0 +1,126 @@
+"""
+Directory Listing Cache
+Keeps scanned directory listings (their serialized JSON and sorted views) in
+memory so /api/list doesn't scandir + stat every entry on each navigation.
+Entries are dropped by fs_events notifications; when no watcher is running
+each hit is revalidated against the directory's mtime instead.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import fs_events
+
+SORT_KEYS = {
+    "name": lambda i: (i["name"].lower(), i["name"]),
+    "size": lambda i: (i["size"], i["name"].lower(), i["name"]),
+    "mtime": lambda i: (i["mtime"], i["name"].lower(), i["name"]),
+    "type": lambda i: (os.path.splitext(i["name"])[1].lower(), i["name"].lower(), i["name"]),
+}
+
+class ListingCache:
+    def __init__(self, max_items=500000):
+        self.max_items = max_items  # total directory entries held across all listings
+        self.total = 0
+        self.dirs = OrderedDict()  # abs_path -> {"mtime": ns, "items": [...], "json": {key: bytes}}
+        self.lock = threading.Lock()
+        self.generation = 0  # bumped on every invalidation, guards against caching a racing scan
+        fs_events.subscribe(self.on_change)
+
+    def scan(self, abs_path):
+        """Read a directory, sorted folders first then by name"""
+        items = []
+        with os.scandir(abs_path) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                    st = entry.stat()
+                    s_size = st.st_size if entry.is_file() else 0
+                    mtime = int(st.st_mtime)
+                except OSError:
+                    is_dir, s_size, mtime = False, 0, 0
+                items.append({
+                    "name": entry.name,
+                    "is_dir": is_dir,
+                    "size": s_size,
+                    "mtime": mtime
+                })
+        items.sort(key=lambda x: (not x["is_dir"], x["name"].lower()))
+        return items
+
+    def get(self, abs_path):
+        """
+        Return the cached record for a directory, scanning on a miss.
+        Returns:
+            dict: {"items": [...], "json": {}, "views": {}} - callers may memoize
+            serialized bodies in "json"; sorted views live in "views" (see sorted_view)
+        Raises:
+            OSError: The directory can't be read
+        """
+        abs_path = os.path.normpath(abs_path)
+        mtime = None
+        if not fs_events.watching():
+            mtime = os.stat(abs_path).st_mtime_ns
+        with self.lock:
+            record = self.dirs.get(abs_path)
+            if record and (mtime is None or record["mtime"] == mtime):
+                self.dirs.move_to_end(abs_path)
+                return record
+            generation = self.generation
+
+        if mtime is None:
+            mtime = os.stat(abs_path).st_mtime_ns
+        record = {"mtime": mtime, "items": self.scan(abs_path), "json": {}, "views": {}}
+        with self.lock:
+            if generation != self.generation:
+                return record  # something changed mid-scan; serve it but don't keep it
+            old = self.dirs.pop(abs_path, None)
+            if old: self.total -= len(old["items"])
+            self.dirs[abs_path] = record
+            self.total += len(record["items"])
+            while self.total > self.max_items and len(self.dirs) > 1:
+                _, evicted = self.dirs.popitem(last=False)
+                self.total -= len(evicted["items"])
+        return record
+
+    def invalidate(self, abs_path, recursive=False):
+        abs_path = os.path.normpath(abs_path)
+        prefix = abs_path + os.sep
+        with self.lock:
+            self.generation += 1
+            stale = [p for p in self.dirs if p == abs_path or (recursive and p.startswith(prefix))]
+            for p in stale:
+                self.total -= len(self.dirs.pop(p)["items"])
+
+    def on_change(self, kind, path, is_dir):
+        # The parent's listing changed; a vanished/moved directory takes its cached subtree with it
+        self.invalidate(os.path.dirname(path))
+        if is_dir is not False:
+            self.invalidate(path, recursive=True)
+
+def sorted_view(record, sort="name", descending=False):
+    """
+    Items of a cached listing in display order (folders always first), with
+    their position keys for page_after(). Memoized on the record.
+    """
+    view = record["views"].get((sort, descending))
+    if view is None:
+        key = SORT_KEYS[sort]
+        ordered = sorted(record["items"], key=key, reverse=descending)
+        items = [i for i in ordered if i["is_dir"]] + [i for i in ordered if not i["is_dir"]]
+        keys = [(0 if i["is_dir"] else 1, key(i)) for i in items]
+        view = record["views"][(sort, descending)] = (items, keys)
+    return view
+
+def page_after(keys, last, descending=False):
+    """Index of the first item that comes strictly after position key `last` in display order"""
+    lo, hi = 0, len(keys)
+    group, inner = last
+    while lo < hi:
+        mid = (lo + hi) // 2
+        g, k = keys[mid]
+        after = g > group or (g == group and (k < inner if descending else k > inner))
+        if after: hi = mid
+        else: lo = mid + 1
+    return lo
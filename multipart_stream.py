@@ -0,0 +1,131 @@
+"""
+Streaming multipart/form-data Parser
+Replaces cgi.FieldStorage for uploads: each part is handed to a caller-provided
+sink as it arrives, so file bodies go straight to their destination instead of
+being spooled to a temp file and copied again. Memory use is one read buffer.
+"""
+
+import re
+
+BUFFER_SIZE = 1024 * 1024
+MAX_HEADER_SIZE = 16 * 1024
+MAX_FIELD_SIZE = 1024 * 1024  # plain (non-file) form fields are kept in memory
+
+class MultipartError(ValueError):
+    pass
+
+class UploadTooLarge(MultipartError):
+    pass
+
+def parse_boundary(content_type):
+    match = re.search(r'boundary=(?:"([^"]+)"|([^;\s]+))', content_type or "")
+    if not content_type or not content_type.lower().startswith("multipart/form-data") or not match:
+        raise MultipartError("Expected multipart/form-data with a boundary")
+    return (match.group(1) or match.group(2)).encode("latin-1")
+
+def parse_disposition(value):
+    """Return (name, filename) from a Content-Disposition header value"""
+    params = {}
+    for key, quoted, bare in re.findall(r';\s*([\w*]+)=(?:"((?:[^"\\]|\\.)*)"|([^;]*))', value):
+        params[key.lower()] = quoted.replace('\\"', '"') if quoted or not bare else bare.strip()
+    return params.get("name"), params.get("filename")
+
+class MultipartParser:
+    def __init__(self, rfile, content_length, boundary, buffer_size=BUFFER_SIZE):
+        self.rfile = rfile
+        self.remaining = content_length
+        self.delimiter = b"\r\n--" + boundary
+        self.buffer_size = buffer_size
+        # Leading CRLF lets the first boundary be found like every other one
+        self.buf = bytearray(b"\r\n")
+
+    def _fill(self):
+        if self.remaining <= 0:
+            raise MultipartError("Upload ended before the closing boundary")
+        data = self.rfile.read(min(self.buffer_size, self.remaining))
+        if not data:
+            raise MultipartError("Connection closed mid-upload")
+        self.remaining -= len(data)
+        self.buf += data
+
+    def _skip_to_delimiter(self, sink=None):
+        """Pass bytes to `sink` (or drop them) until the next delimiter, then consume it"""
+        keep = len(self.delimiter) - 1
+        while True:
+            idx = self.buf.find(self.delimiter)
+            if idx >= 0:
+                if sink is not None and idx: self._emit(sink, idx)
+                del self.buf[:idx + len(self.delimiter)]
+                return
+            if len(self.buf) > keep:
+                # Everything except a possible partial delimiter at the end is body
+                if sink is not None: self._emit(sink, len(self.buf) - keep)
+                del self.buf[:-keep]
+            self._fill()
+
+    def _emit(self, sink, n):
+        # A view instead of a slice: no copy of up to BUFFER_SIZE bytes per chunk
+        with memoryview(self.buf) as view:
+            chunk = view[:n]
+            try:
+                sink(chunk)
+            finally:
+                chunk.release()
+
+    def _read_exact(self, n):
+        while len(self.buf) < n:
+            self._fill()
+        data = bytes(self.buf[:n])
+        del self.buf[:n]
+        return data
+
+    def _read_headers(self):
+        while True:
+            idx = self.buf.find(b"\r\n\r\n")
+            if idx >= 0: break
+            if len(self.buf) > MAX_HEADER_SIZE:
+                raise MultipartError("Part headers too large")
+            self._fill()
+        raw = bytes(self.buf[:idx]).decode("utf-8", "replace")
+        del self.buf[:idx + 4]
+        headers = {}
+        for line in raw.split("\r\n"):
+            key, _, value = line.partition(":")
+            if key: headers[key.strip().lower()] = value.strip()
+        return headers
+
+    def parse(self, on_file):
+        """
+        Stream every part of the body.
+        Args:
+            on_file: Called as on_file(name, filename, headers) for each file part;
+                returns a callable that receives body chunks (memoryview/bytearray)
+                and is called with None once the part is complete
+        Returns:
+            dict: Non-file fields {name: [str, ...]}
+        """
+        fields = {}
+        self._skip_to_delimiter()  # preamble
+        while True:
+            if self._read_exact(2) == b"--":
+                break  # closing delimiter
+            headers = self._read_headers()
+            name, filename = parse_disposition(headers.get("content-disposition", ""))
+            if filename is not None:
+                sink = on_file(name, filename, headers)
+                self._skip_to_delimiter(sink)
+                sink(None)
+            else:
+                value = bytearray()
+                def collect(chunk):
+                    value.extend(chunk)
+                    if len(value) > MAX_FIELD_SIZE:
+                        raise UploadTooLarge(f"Form field {name!r} too large")
+                self._skip_to_delimiter(collect)
+                fields.setdefault(name, []).append(value.decode("utf-8", "replace"))
+        # Drain the epilogue so a keep-alive connection stays in sync
+        while self.remaining > 0:
+            data = self.rfile.read(min(self.buffer_size, self.remaining))
+            if not data: break
+            self.remaining -= len(data)
+        return fields
@@ -0,0 +1,123 @@
+"""
+Prefork Supervisor
+Runs N copies of the HTTP server in separate processes that all bind the
+same port with SO_REUSEPORT, so the kernel spreads connections across them
+and zip/JSON/directory work is no longer confined to one GIL.
+The supervisor restarts workers that die and takes them all down on exit.
+POSIX only (needs fork and SO_REUSEPORT).
+"""
+
+import os
+import sys
+import time
+import signal
+import socket
+
+# A worker that dies sooner than this after starting is considered crash-looping
+MIN_UPTIME = 2.0
+
+def supported():
+    return hasattr(os, "fork") and hasattr(socket, "SO_REUSEPORT")
+
+class ReusePortMixIn:
+    """socketserver mix-in: bind with SO_REUSEPORT so sibling workers can share the port"""
+
+    def server_bind(self):
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+def reuse_port(server_class):
+    return type(f"ReusePort{server_class.__name__}", (ReusePortMixIn, server_class), {})
+
+class Supervisor:
+    def __init__(self, make_server, workers, on_worker_start=None):
+        """
+        Args:
+            make_server: Callable building a bound server in the worker process
+            workers: Number of worker processes
+            on_worker_start: Optional callable run in each worker after fork
+                (start background threads here, never before forking)
+        """
+        self.make_server = make_server
+        self.workers = workers
+        self.on_worker_start = on_worker_start
+        self.children = {}  # pid -> start time
+        self.stopping = False
+
+    def log(self, msg):
+        print(f"[{time.strftime('%H:%M:%S')}] [prefork] {msg}")
+        sys.stdout.flush()
+
+    def spawn(self):
+        sys.stdout.flush()  # or the child inherits and re-prints our buffered output
+        pid = os.fork()
+        if pid:
+            self.children[pid] = time.time()
+            return
+        # --- worker process ---
+        code = 0
+        try:
+            signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+            signal.signal(signal.SIGINT, signal.SIG_IGN)  # the supervisor decides when we stop
+            if self.on_worker_start:
+                self.on_worker_start()
+            server = self.make_server()
+            try:
+                server.serve_forever()
+            finally:
+                server.server_close()
+        except SystemExit:
+            pass
+        except BaseException as e:
+            print(f"[{time.strftime('%H:%M:%S')}] [prefork] Worker {os.getpid()} failed: {e}")
+            code = 1
+        finally:
+            sys.stdout.flush()
+            os._exit(code)
+
+    def stop(self, *_):
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        for _ in range(self.workers):
+            self.spawn()
+        self.log(f"Started {self.workers} workers: {', '.join(map(str, self.children))}")
+
+        try:
+            while self.children:
+                try:
+                    pid, status = os.wait()
+                except ChildProcessError:
+                    break
+                except InterruptedError:
+                    continue
+                started = self.children.pop(pid, time.time())
+                if self.stopping:
+                    continue
+                self.log(f"Worker {pid} exited with status {status}, restarting")
+                if time.time() - started < MIN_UPTIME:
+                    time.sleep(MIN_UPTIME)
+                self.spawn()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+            deadline = time.time() + 10
+            while self.children and time.time() < deadline:
+                try:
+                    pid, _ = os.waitpid(-1, os.WNOHANG)
+                except ChildProcessError:
+                    break
+                if pid: self.children.pop(pid, None)
+                else: time.sleep(0.1)
+            for pid in self.children:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
@@ -0,0 +1,243 @@
+"""
+Resumable Uploads
+Chunked upload sessions for large files: the client creates a session, PUTs
+chunks at any offset (in any order, over several connections), asks which
+ranges arrived after a disconnect, and finalizes. Chunks are written in place
+into a preallocated file in the hidden .uploads folder, and the finished file
+is renamed into the target folder.
+
+Session state lives next to the data as <id>.json, so it survives restarts
+and is shared by prefork workers.
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import errno
+import shutil
+import hashlib
+
+import file_lock
+
+BUFFER_SIZE = 1024 * 1024
+SESSION_ID = re.compile(r"^[0-9a-f]{32}$")
+
+class UploadError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def merge_range(ranges, start, end):
+    """Add [start, end) to a sorted list of disjoint [start, end) pairs"""
+    merged = []
+    for s, e in ranges:
+        if e < start or s > end:
+            merged.append([s, e])
+        else:
+            start, end = min(s, start), max(e, end)
+    merged.append([start, end])
+    merged.sort()
+    return merged
+
+def _preallocate(fd, size):
+    # Reserve the blocks up front: no fragmentation from out-of-order chunks, and ENOSPC shows up now
+    if size and hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError as e:
+            if e.errno not in (errno.EOPNOTSUPP, errno.EINVAL):  # filesystem can't: fall back to a sparse file
+                raise
+    os.ftruncate(fd, size)
+
+def _pwrite(fd, data, offset):
+    if hasattr(os, "pwrite"):
+        while data:
+            n = os.pwrite(fd, data, offset)
+            data, offset = data[n:], offset + n
+    else:
+        os.lseek(fd, offset, os.SEEK_SET)
+        while data:
+            data = data[os.write(fd, data):]
+
+class UploadSessions:
+    def __init__(self, staging_dir, chunk_size=8 * 1024 * 1024, max_file=0, ttl=24 * 3600):
+        self.staging = staging_dir
+        self.chunk_size = chunk_size
+        self.max_chunk = max(chunk_size * 4, 64 * 1024 * 1024)
+        self.max_file = max_file
+        self.ttl = ttl
+
+    def _paths(self, session_id):
+        if not SESSION_ID.match(session_id or ""):
+            raise UploadError(404, "Unknown upload session")
+        base = os.path.join(self.staging, session_id)
+        return base + ".json", base + ".part"
+
+    def _load(self, meta_path):
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            raise UploadError(404, "Unknown or expired upload session")
+
+    def _save(self, meta_path, session):
+        session["updated"] = time.time()
+        tmp = meta_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(session, f)
+        os.replace(tmp, meta_path)
+
+    def status(self, session):
+        received = sum(e - s for s, e in session["received"])
+        return {"id": session["id"], "name": session["name"], "path": session["path"], "size": session["size"],
+                "received": session["received"], "received_bytes": received,
+                "complete": received == session["size"], "chunk_size": self.chunk_size}
+
+    def create(self, target_dir, rel_path, name, size, sha256=None):
+        """Start a session and preallocate its data file. Returns the session status."""
+        name = os.path.basename((name or "").replace("\\", "/"))
+        if not name:
+            raise UploadError(400, "File name required")
+        if not isinstance(size, int) or size < 0:
+            raise UploadError(400, "File size required")
+        if self.max_file and size > self.max_file:
+            raise UploadError(413, f"{name} exceeds {self.max_file // (1024 * 1024)} MB")
+        if sha256 and not re.match(r"^[0-9a-fA-F]{64}$", sha256):
+            raise UploadError(400, "sha256 must be 64 hex digits")
+        os.makedirs(self.staging, exist_ok=True)
+        self.sweep()
+        if shutil.disk_usage(self.staging).free < size:
+            raise UploadError(507, "Not enough free disk space")
+
+        session = {"id": uuid.uuid4().hex, "target": target_dir, "path": rel_path, "name": name,
+                   "size": size, "sha256": (sha256 or "").lower() or None, "received": [], "created": time.time()}
+        meta_path, part_path = self._paths(session["id"])
+        fd = os.open(part_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o644)
+        try:
+            _preallocate(fd, size)
+        except OSError as e:
+            os.close(fd)
+            os.remove(part_path)
+            raise UploadError(507, f"Can't reserve {size} bytes: {e.strerror}")
+        os.close(fd)
+        self._save(meta_path, session)
+        return self.status(session)
+
+    def get(self, session_id):
+        meta_path, _ = self._paths(session_id)
+        return self.status(self._load(meta_path))
+
+    def write_chunk(self, session_id, offset, rfile, length):
+        """
+        Copy `length` bytes from rfile into the session at `offset`.
+        The range only counts as received once all of it is on disk, so an
+        interrupted chunk is simply sent again.
+        Returns:
+            dict: The session status after this chunk
+        """
+        meta_path, part_path = self._paths(session_id)
+        # Shared lock on the data file: parallel chunks go ahead together, while finalize() and
+        # abort() wait until no write is in flight before they move or delete it
+        with file_lock.locked(part_path, shared=True):
+            size = self._load(meta_path)["size"]
+            if offset < 0 or offset + length > size:
+                raise UploadError(416, f"Chunk {offset}+{length} is outside the {size} byte file")
+            if length > self.max_chunk:
+                raise UploadError(413, f"Chunks are limited to {self.max_chunk // (1024 * 1024)} MB")
+
+            # Each request has its own descriptor and positional writes, so parallel chunks don't interfere
+            try:
+                fd = os.open(part_path, os.O_WRONLY | getattr(os, "O_BINARY", 0))
+            except FileNotFoundError:
+                raise UploadError(404, "Upload session already finished or aborted")
+            try:
+                done = 0
+                while done < length:
+                    data = rfile.read(min(BUFFER_SIZE, length - done))
+                    if not data:
+                        raise UploadError(400, "Connection closed mid-chunk")
+                    _pwrite(fd, data, offset + done)
+                    done += len(data)
+            finally:
+                os.close(fd)
+
+            with file_lock.locked(meta_path):
+                session = self._load(meta_path)
+                if length:
+                    session["received"] = merge_range(session["received"], offset, offset + length)
+                self._save(meta_path, session)
+        return self.status(session)
+
+    def _digest(self, part_path):
+        h = hashlib.sha256()
+        with open(part_path, "rb") as f:
+            while True:
+                data = f.read(BUFFER_SIZE)
+                if not data: break
+                h.update(data)
+        return h.hexdigest()
+
+    def finalize(self, session_id, sha256=None):
+        """
+        Verify a complete session and move its file into place.
+        Returns:
+            tuple: (session, destination path)
+        """
+        meta_path, part_path = self._paths(session_id)
+        with file_lock.locked(part_path), file_lock.locked(meta_path):
+            session = self._load(meta_path)
+            status = self.status(session)
+            if not status["complete"]:
+                raise UploadError(409, f"Upload incomplete: {status['received_bytes']} of {session['size']} bytes received")
+            expected = (sha256 or session.get("sha256") or "").lower()
+            if expected and self._digest(part_path) != expected:
+                # We can't tell which chunk was damaged: start the transfer over
+                session["received"] = []
+                self._save(meta_path, session)
+                raise UploadError(422, "Checksum mismatch, upload restarted")
+
+            target_dir = session["target"]
+            os.makedirs(target_dir, exist_ok=True)
+            dest = os.path.join(target_dir, session["name"])
+            if os.path.exists(dest):
+                stem, ext = os.path.splitext(dest)
+                dest = f"{stem}_{time.strftime('%Y%m%d_%H%M%S')}{ext}"
+            try:
+                os.replace(part_path, dest)
+            except OSError:
+                shutil.move(part_path, dest)  # target is on another filesystem
+            os.remove(meta_path)
+        self._discard_locks(meta_path, part_path)
+        return session, dest
+
+    def abort(self, session_id):
+        meta_path, part_path = self._paths(session_id)
+        with file_lock.locked(part_path), file_lock.locked(meta_path):
+            self._load(meta_path)
+            for p in (part_path, meta_path):
+                try: os.remove(p)
+                except OSError: pass
+        self._discard_locks(meta_path, part_path)
+
+    def _discard_locks(self, *paths):
+        for path in paths:
+            try: os.remove(path + ".lock")
+            except OSError: pass
+
+    def sweep(self):
+        """Remove sessions (and stray .part files from interrupted form uploads) idle longer than the TTL"""
+        cutoff = time.time() - self.ttl
+        try:
+            names = os.listdir(self.staging)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.staging, name)
+            try:
+                if os.stat(path).st_mtime < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,295 @@
+"""
+Search Index
+In-memory filename index over UPLOAD_ROOT for /api/search, so queries don't
+os.walk the whole tree. Names are indexed by trigram (array postings, ids
+in insertion order) and by extension. The index is persisted to
+data/search_index.json, loaded at startup, reconciled by a background
+rescan and then kept current from fs_events. Changes that arrive while a
+rescan walks the tree are queued and replayed onto its result. Prefork
+workers take turns: the first one rescans and saves, the others load that.
+"""
+
+import os
+import json
+import time
+import threading
+from array import array
+
+import file_lock
+import fs_events
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+INDEX_FILE = os.path.join(DATA_DIR, "search_index.json")
+SAVE_INTERVAL = 30  # seconds between persisting a changed index
+
+def trigrams(name):
+    return {name[i:i + 3] for i in range(len(name) - 2)}
+
+def extension(name):
+    return os.path.splitext(name)[1][1:].lower()
+
+class SearchIndex:
+    def __init__(self, root, hidden_folders, index_file=INDEX_FILE):
+        self.root = os.path.abspath(root)
+        self.hidden = set(hidden_folders)
+        self.index_file = index_file
+        self.lock = threading.RLock()
+        self.ready = False
+        self.dirty = False
+        self.pending = None     # fs events queued while a rebuild runs (None when none is running)
+        self.again = False      # a watcher overflow hit the running rebuild: walk again
+        self.built = 0          # when the rebuild this index descends from was swapped in
+        self._reset()
+        fs_events.subscribe(self.on_change)
+
+    def _reset(self):
+        self.entries = []       # id -> (rel_dir, name, is_dir) or None once removed
+        self.lower = []         # id -> name.lower() (None once removed)
+        self.by_path = {}       # rel_path -> id
+        self.children = {}      # rel_dir -> set of ids
+        self.grams = {}         # trigram -> array of ids
+        self.exts = {}          # extension -> array of ids
+        self.removed = 0
+
+    # ===== Maintenance =====
+
+    def _rel(self, abs_path):
+        rel = os.path.relpath(abs_path, self.root).replace("\\", "/")
+        return "" if rel == "." else rel
+
+    def _is_hidden(self, rel_path):
+        return any(part in self.hidden for part in rel_path.split("/")[:-1])
+
+    def _add(self, rel_dir, name, is_dir):
+        rel_path = f"{rel_dir}/{name}" if rel_dir else name
+        if rel_path in self.by_path:
+            return
+        i = len(self.entries)
+        self.entries.append((rel_dir, name, is_dir))
+        low = name.lower()
+        self.lower.append(low)
+        self.by_path[rel_path] = i
+        self.children.setdefault(rel_dir, set()).add(i)
+        for g in trigrams(low):
+            self.grams.setdefault(g, array("I")).append(i)
+        if not is_dir:
+            self.exts.setdefault(extension(name), array("I")).append(i)
+        self.dirty = True
+
+    def _remove(self, rel_path):
+        i = self.by_path.pop(rel_path, None)
+        if i is None:
+            return
+        rel_dir, name, is_dir = self.entries[i]
+        self.entries[i] = None
+        self.lower[i] = None
+        self.children.get(rel_dir, set()).discard(i)
+        self.removed += 1
+        self.dirty = True
+        if is_dir:
+            for child in list(self.children.pop(rel_path, ())):
+                entry = self.entries[child]
+                if entry: self._remove(f"{rel_path}/{entry[1]}")
+
+    def _add_tree(self, rel_dir):
+        """Index everything below rel_dir (which is itself already indexed or the root)"""
+        base = os.path.join(self.root, rel_dir) if rel_dir else self.root
+        for root, dirs, files in os.walk(base):
+            dirs[:] = [d for d in dirs if d not in self.hidden]
+            r = self._rel(root)
+            with self.lock:
+                for d in dirs: self._add(r, d, True)
+                for f in files: self._add(r, f, False)
+
+    def _compact(self):
+        # Tombstones only cost memory and scan time; rebuild once they dominate
+        live = [e for e in self.entries if e]
+        self._reset()
+        for rel_dir, name, is_dir in live:
+            self._add(rel_dir, name, is_dir)
+
+    def on_change(self, kind, path, is_dir):
+        if not (path == self.root or path.startswith(self.root + os.sep)):
+            return
+        if path == self.root:
+            # Watcher overflow: the whole tree may have changed
+            self.rebuild(background=True)
+            return
+        with self.lock:
+            if self.pending is not None:
+                # The rebuild in progress swaps in its own maps, so replay this onto them afterwards
+                self.pending.append((kind, path, is_dir))
+            if not self.ready:
+                return
+        self._apply(kind, path, is_dir)
+
+    def _apply(self, kind, path, is_dir):
+        rel = self._rel(path)
+        if self._is_hidden(rel) or os.path.basename(path) in self.hidden:
+            return
+        rel_dir, name = rel.rpartition("/")[0], rel.rpartition("/")[2]
+        with self.lock:
+            if kind == fs_events.DELETED:
+                self._remove(rel)
+                if self.removed > 10000 and self.removed > len(self.by_path):
+                    self._compact()
+            elif kind == fs_events.CREATED:
+                if is_dir is None: is_dir = os.path.isdir(path)
+                self._add(rel_dir, name, is_dir)
+        if kind == fs_events.CREATED and is_dir:
+            self._add_tree(rel)
+
+    # ===== Lifecycle =====
+
+    def _blank(self):
+        fresh = SearchIndex.__new__(SearchIndex)
+        fresh.root, fresh.hidden, fresh.lock = self.root, self.hidden, threading.RLock()
+        fresh._reset()
+        fresh.built = 0
+        return fresh
+
+    def _read(self):
+        """A fresh index from the saved file, or None if there is no usable one"""
+        try:
+            with file_lock.locked(self.index_file), open(self.index_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("root") != self.root:
+            return None
+        fresh = self._blank()
+        fresh.built = data.get("built", 0)
+        for rel_dir, name, is_dir in data.get("entries", []):
+            fresh._add(rel_dir, name, is_dir)
+        return fresh
+
+    def _swap(self, fresh):
+        for attr in ("entries", "lower", "by_path", "children", "grams", "exts", "removed"):
+            setattr(self, attr, getattr(fresh, attr))
+        self.built = fresh.built
+        self.ready = True
+
+    def load(self):
+        fresh = self._read()
+        if fresh is None:
+            return False
+        with self.lock:
+            self._swap(fresh)
+            self.dirty = False
+        return True
+
+    def save(self):
+        with self.lock:
+            data = {"root": self.root, "saved": time.time(), "built": self.built, "entries": [e for e in self.entries if e]}
+            self.dirty = False
+        os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+        with file_lock.locked(self.index_file):
+            tmp = f"{self.index_file}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp, self.index_file)
+
+    def rebuild(self, background=False):
+        """Full rescan; the previous index keeps answering until the new one is swapped in"""
+        with self.lock:
+            if self.pending is not None:
+                self.again = True  # one is already running: it goes round once more
+                return
+            self.pending = []
+        if background:
+            threading.Thread(target=self._rebuild, name="search-index", daemon=True).start()
+        else:
+            self._rebuild()
+
+    def _rebuild(self):
+        """Rescan (or load another worker's fresh rescan) while self.pending collects changes. Returns True if this process walked the tree."""
+        while True:
+            requested = time.time()
+            # Prefork workers start together and all see a watcher overflow: one walks the tree
+            # and saves, the rest wait here and load its result
+            with file_lock.locked(self.index_file + ".build"):
+                try:
+                    fresh = self._read() if os.path.getmtime(self.index_file) >= requested else None
+                except OSError:
+                    fresh = None
+                if fresh and fresh.built < requested:
+                    fresh = None  # only a periodic save of an older rebuild
+                built = fresh is None
+                if built:
+                    fresh = self._blank()
+                    fresh._add_tree("")
+                with self.lock:
+                    if self.again:
+                        self.again, self.pending = False, []
+                        continue
+                    self._swap(fresh)
+                    self.dirty = built
+                    events, self.pending = self.pending, None
+                    for event in events:
+                        self._apply(*event)
+                    if built:
+                        self.built = time.time()
+                if built:
+                    self.save()
+                return built
+
+    def _saver(self):
+        while True:
+            time.sleep(SAVE_INTERVAL)
+            if self.dirty:
+                try: self.save()
+                except OSError as e: print(f"[{time.strftime('%H:%M:%S')}] Search index save failed: {e}")
+
+    def start(self):
+        """Load the persisted index, then reconcile and keep saving in the background"""
+        with self.lock:
+            self.pending = []
+        self.load()
+        def build():
+            started = time.time()
+            built = self._rebuild()
+            print(f"[{time.strftime('%H:%M:%S')}] Search index {'ready' if built else 'loaded'}: {len(self.by_path)} entries in {time.time() - started:.1f}s")
+        threading.Thread(target=build, name="search-index", daemon=True).start()
+        threading.Thread(target=self._saver, name="search-index-saver", daemon=True).start()
+
+    # ===== Queries =====
+
+    def search(self, q, mode="substring", exts=None, kind=None, limit=500):
+        """
+        Args:
+            q: Text to match against file/folder names (case-insensitive)
+            mode: "substring" or "prefix"
+            exts: Optional set of extensions (without dot) files must have
+            kind: Optional "file" or "dir"
+            limit: Maximum number of results
+        Returns:
+            list: [{"name", "path", "is_dir"}] best matches first
+        """
+        q = q.lower()
+        with self.lock:
+            if len(q) >= 3:
+                # Every match contains all of q's trigrams; scanning the rarest one's postings is enough
+                postings = [self.grams.get(g, ()) for g in trigrams(q)]
+                candidates = min(postings, key=len)
+            elif exts:
+                candidates = [i for e in exts for i in self.exts.get(e, ())]
+            else:
+                candidates = range(len(self.entries))
+
+            scored = []
+            for i in candidates:
+                low = self.lower[i]
+                if low is None: continue
+                pos = low.find(q)
+                if pos < 0 or (mode == "prefix" and pos != 0): continue
+                rel_dir, name, is_dir = self.entries[i]
+                if kind and (kind == "dir") != is_dir: continue
+                if exts and (is_dir or extension(name) not in exts): continue
+                if low == q: rank = 0
+                elif pos == 0: rank = 1
+                elif not low[pos - 1].isalnum(): rank = 2
+                else: rank = 3
+                scored.append((rank, len(name), rel_dir.count("/") if rel_dir else -1, rel_dir, name, is_dir))
+
+        scored.sort()
+        return [{"name": name, "path": rel_dir, "is_dir": is_dir} for _, _, _, rel_dir, name, is_dir in scored[:limit]]
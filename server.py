@@ -1,15 +1,13 @@
 from http.server import HTTPServer, SimpleHTTPRequestHandler
 from socketserver import ThreadingMixIn
-import cgi
+from concurrent.futures import ThreadPoolExecutor
 import os
 import json
 import time
 from urllib.parse import urlparse, parse_qs, unquote
-import shutil
 import mimetypes
 import socket
 import qrcode
-import re
 import zipfile
 import threading
 import platform
@@ -17,6 +15,24 @@ import sys
 
 import api_handlers
 import api_handlers
+import file_transfer
+import http_cache
+import compression_cache
+import byte_ranges
+import async_server
+import worker_pool
+import prefork
+import fs_events
+import listing_cache
+import search_index
+import folder_tree
+import resumable_upload
+import zip_cache
+import thumbnails
+import derivatives
+import comments_store
+import sysinfo_sampler
+import event_stream
 from collaborative_manager import CollaborativeManager
 try:
     from dns_service import DNSService
@@ -33,7 +49,35 @@ def load_config():
         "upload_root": "Home",
         "upload_root": "Home",
         "hidden_folders": [".recycle_bin", "server-icons","useful-info"],
-        "aliases": []
+        "aliases": [],
+        "asset_cache_control": "no-cache",
+        "file_cache_control": "private, max-age=60, must-revalidate",
+        "compression_cache_mb": 32,
+        "max_upload_file_mb": 0,
+        "max_upload_request_mb": 0,
+        "upload_chunk_mb": 8,
+        "upload_session_hours": 24,
+        "zip_level": 6,
+        "zip_threads": 0,
+        "zip_cache_mb": 2048,
+        "thumbnail_cache_mb": 512,
+        "thumbnail_workers": 2,
+        "prewarm_workers": 1,
+        "sysinfo_interval": 5,
+        "sysinfo_history": 720,
+        "events_max_clients": 64,
+        "events_heartbeat": 15,
+        "server_mode": "threaded",
+        "async_workers": 32,
+        "idle_timeout": 60,
+        "max_keepalive_requests": 1000,
+        "pool_workers": 16,
+        "pool_queue": 64,
+        "per_ip_limit": 32,
+        "heavy_limit": 4,
+        "retry_after": 2,
+        "prefork_workers": 0,
+        "prefork_engine": "pool"
     }
     if os.path.exists(CONFIG_FILE):
         try:
@@ -46,8 +90,14 @@ def load_config():
 CONFIG = load_config()
 ADMIN_KEY = CONFIG["admin_key"]
 ADMIN_KEY = CONFIG["admin_key"]
-HIDDEN_FOLDERS = CONFIG["hidden_folders"]
+# Server-managed folders inside UPLOAD_ROOT are hidden even if config.json overrides hidden_folders
+INTERNAL_FOLDERS = [".uploads", ".zip_cache", ".thumbnails"]
+HIDDEN_FOLDERS = CONFIG["hidden_folders"] + [f for f in INTERNAL_FOLDERS if f not in CONFIG["hidden_folders"]]
 ALIASES = CONFIG.get("aliases", [])
+ASSET_CACHE_CONTROL = CONFIG["asset_cache_control"]
+FILE_CACHE_CONTROL = CONFIG["file_cache_control"]
+MAX_UPLOAD_FILE = CONFIG["max_upload_file_mb"] * 1024 * 1024
+MAX_UPLOAD_REQUEST = CONFIG["max_upload_request_mb"] * 1024 * 1024
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 UPLOAD_ROOT = os.path.join(BASE_DIR, CONFIG["upload_root"])
@@ -57,6 +107,24 @@ RECYCLE_BIN = os.path.join(UPLOAD_ROOT, ".recycle_bin")
 os.makedirs(RECYCLE_BIN, exist_ok=True)
 os.makedirs(UPLOAD_ROOT, exist_ok=True)
 
+UPLOAD_SESSIONS = resumable_upload.UploadSessions(os.path.join(UPLOAD_ROOT, ".uploads"), CONFIG["upload_chunk_mb"] * 1024 * 1024,
+                                                 MAX_UPLOAD_FILE, CONFIG["upload_session_hours"] * 3600)
+# Shared by all zip downloads, so concurrent archives don't multiply the CPU threads
+ZIP_THREADS = CONFIG["zip_threads"] or os.cpu_count() or 1
+ZIP_POOL = ThreadPoolExecutor(ZIP_THREADS, thread_name_prefix="zip") if ZIP_THREADS > 1 else None
+ZIP_CACHE = zip_cache.ZipCache(os.path.join(UPLOAD_ROOT, ".zip_cache"), CONFIG["zip_cache_mb"] * 1024 * 1024)
+THUMBNAILS = thumbnails.ThumbnailCache(os.path.join(UPLOAD_ROOT, ".thumbnails"), CONFIG["thumbnail_cache_mb"] * 1024 * 1024,
+                                       CONFIG["thumbnail_workers"])
+DERIVATIVES = derivatives.DerivativeQueue(UPLOAD_ROOT, HIDDEN_FOLDERS, THUMBNAILS, CONFIG["prewarm_workers"])
+COMPRESSION_CACHE = compression_cache.CompressionCache(CONFIG["compression_cache_mb"] * 1024 * 1024)
+
+LISTING_CACHE = listing_cache.ListingCache()
+SEARCH_INDEX = search_index.SearchIndex(UPLOAD_ROOT, HIDDEN_FOLDERS)
+FOLDER_TREE = folder_tree.FolderTree(UPLOAD_ROOT, HIDDEN_FOLDERS)
+COMMENTS = comments_store.CommentStore(UPLOAD_ROOT)
+SYSINFO = sysinfo_sampler.SystemSampler(UPLOAD_ROOT, CONFIG["sysinfo_interval"], CONFIG["sysinfo_history"])
+EVENTS = event_stream.EventHub(UPLOAD_ROOT, HIDDEN_FOLDERS, SYSINFO, CONFIG["events_max_clients"], CONFIG["events_heartbeat"])
+
 # Initialize Collaborative Manager
 COLLAB_MANAGER = CollaborativeManager(UPLOAD_ROOT)
 
@@ -91,6 +159,23 @@ def safe_join(base, *paths):
     return final_path
 
 class FileServerHandler(SimpleHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; with Nagle on, keep-alive responses stall on delayed ACKs
+    disable_nagle_algorithm = True
+    # Socket timeout: closes keep-alive connections that sit idle this long
+    timeout = CONFIG["idle_timeout"]
+    requests_served = 0
+
+    def handle_one_request(self):
+        self.requests_served += 1
+        super().handle_one_request()
+
+    def end_headers(self):
+        max_requests = CONFIG["max_keepalive_requests"]
+        if max_requests and self.requests_served >= max_requests and not self.close_connection:
+            self.send_header("Connection", "close")
+        super().end_headers()
+
     def log_message(self, format, *args):
         print(f"[{time.strftime('%H:%M:%S')}] {format % args}")
         sys.stdout.flush()
@@ -101,15 +186,24 @@ class FileServerHandler(SimpleHTTPRequestHandler):
         self.log_message("GET: %s", path)
 
         if path.startswith("/api/"):
-            if path == "/api/list": api_handlers.handle_list(self, parsed, UPLOAD_ROOT, ADMIN_KEY, HIDDEN_FOLDERS, safe_join)
-            elif path == "/api/zip": api_handlers.handle_zip(self, parsed, UPLOAD_ROOT, safe_join)
-            elif path == "/api/search": api_handlers.handle_search(self, parsed, UPLOAD_ROOT, HIDDEN_FOLDERS)
-            elif path == "/api/sysinfo": api_handlers.handle_sysinfo(self, UPLOAD_ROOT)
-            elif path == "/api/all_folders": api_handlers.handle_all_folders(self, UPLOAD_ROOT, HIDDEN_FOLDERS)
+            if path == "/api/list": api_handlers.handle_list(self, parsed, UPLOAD_ROOT, ADMIN_KEY, HIDDEN_FOLDERS, safe_join, LISTING_CACHE, DERIVATIVES.mark_viewed, COMMENTS)
+            elif path == "/api/zip": self.run_heavy(api_handlers.handle_zip, self, parsed, UPLOAD_ROOT, safe_join, CONFIG["zip_level"], ZIP_POOL, ZIP_CACHE, INTERNAL_FOLDERS)
+            elif path == "/api/search": self.run_heavy(api_handlers.handle_search, self, parsed, UPLOAD_ROOT, HIDDEN_FOLDERS, SEARCH_INDEX)
+            elif path == "/api/thumb": api_handlers.handle_thumb(self, parsed, UPLOAD_ROOT, safe_join, THUMBNAILS)
+            elif path == "/api/media_info": api_handlers.handle_media_info(self, parsed, UPLOAD_ROOT, safe_join, DERIVATIVES)
+            elif path == "/api/sysinfo": api_handlers.handle_sysinfo(self, SYSINFO)
+            elif path == "/api/sysinfo/history": api_handlers.handle_sysinfo_history(self, parsed, SYSINFO)
+            elif path == "/api/events": api_handlers.handle_events(self, parsed, EVENTS, ADMIN_KEY)
+            elif path == "/api/all_folders":
+                # Once the tree is built this is a cached read; only the cold-start walk is heavy
+                if FOLDER_TREE.ready: api_handlers.handle_all_folders(self, parsed, UPLOAD_ROOT, HIDDEN_FOLDERS, FOLDER_TREE)
+                else: self.run_heavy(api_handlers.handle_all_folders, self, parsed, UPLOAD_ROOT, HIDDEN_FOLDERS, FOLDER_TREE)
             elif path == "/api/recycle_bin": api_handlers.handle_recycle_bin_list(self, RECYCLE_BIN)
-            elif path == "/api/activity": api_handlers.handle_activity_list(self)
-            elif path == "/api/comments": api_handlers.handle_comments(self, parsed)
+            elif path == "/api/activity": api_handlers.handle_activity_list(self, parsed)
+            elif path == "/api/comments": api_handlers.handle_comments(self, parsed, COMMENTS)
             elif path == "/api/collaborative/sessions": api_handlers.handle_collaborative_sessions(self, COLLAB_MANAGER)
+            elif path == "/api/server_stats": api_handlers.handle_server_stats(self)
+            elif path == "/api/upload/session": api_handlers.handle_upload_session(self, parsed, UPLOAD_ROOT, safe_join, UPLOAD_SESSIONS)
             else: self.send_error(404, "API not found")
             return
 
@@ -118,75 +212,206 @@ class FileServerHandler(SimpleHTTPRequestHandler):
 
         target_root = os.path.join(BASE_DIR, rel_path)
         if os.path.exists(target_root) and os.path.isfile(target_root):
-            self.serve_static_file(target_root)
+            self.serve_static_file(target_root, ASSET_CACHE_CONTROL)
             return
 
         try:
             target_home = os.path.join(UPLOAD_ROOT, rel_path)
             if os.path.exists(target_home) and os.path.isfile(target_home):
-                self.serve_static_file(target_home)
+                self.serve_static_file(target_home, FILE_CACHE_CONTROL)
                 return
         except Exception: pass
 
         self.send_error(404, "File not found")
 
-    def serve_static_file(self, file_to_serve):
+    def run_heavy(self, func, *args):
+        """Run an expensive endpoint only if the worker pool has a slot for it"""
+        if not hasattr(self.server, "try_heavy"):
+            return func(*args)
+        if not self.server.try_heavy():
+            self.send_response(503)
+            self.send_header("Retry-After", str(self.server.retry_after))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        try:
+            return func(*args)
+        finally:
+            self.server.release_heavy()
+
+    def serve_static_file(self, file_to_serve, cache_control=None):
         stat = os.stat(file_to_serve)
         size = stat.st_size
-        content_type, _ = mimetypes.guess_type(file_to_serve)
+        content_type, content_encoding = mimetypes.guess_type(file_to_serve)
         content_type = content_type or "application/octet-stream"
 
-        range_header = self.headers.get('Range')
-        if range_header:
-            match = re.search(r'bytes=(\d+)-(\d*)', range_header)
-            if match:
-                start = int(match.group(1))
-                end = int(match.group(2)) if match.group(2) else size - 1
-                if start < size:
-                    length = end - start + 1
-                    self.send_response(206)
-                    self.send_header("Content-Type", content_type)
-                    self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
-                    self.send_header("Content-Length", str(length))
-                    self.send_header("Accept-Ranges", "bytes")
-                    self.end_headers()
-                    with open(file_to_serve, 'rb') as f:
-                        f.seek(start)
-                        self.wfile.write(f.read(length))
-                    return
+        # Ranges always address the identity bytes, so only whole-body GETs get compressed
+        variant = None
+        vary = None
+        if not content_encoding and compression_cache.is_compressible(content_type):
+            vary = "Accept-Encoding"
+            if not self.headers.get('Range'):
+                variant = COMPRESSION_CACHE.variant(file_to_serve, stat, content_type, self.headers.get('Accept-Encoding'))
+
+        etag = http_cache.make_etag(stat, f"-{variant[0]}" if variant else "")
+        if http_cache.is_not_modified(self.headers, etag, stat.st_mtime):
+            http_cache.send_not_modified(self, etag, stat.st_mtime, cache_control, vary)
+            return
+
+        if variant:
+            self.serve_compressed(file_to_serve, stat, content_type, variant, etag, cache_control)
+            return
+
+        ranges = byte_ranges.parse_range_header(self.headers.get('Range'), size)
+        if ranges is not None and byte_ranges.if_range_allows(self.headers, etag, stat.st_mtime):
+            self.serve_ranges(file_to_serve, stat, content_type, ranges, etag, cache_control, vary)
+            return
 
         self.send_response(200)
         self.send_header("Content-Type", content_type)
         self.send_header("Content-Length", str(size))
         self.send_header("Accept-Ranges", "bytes")
+        http_cache.send_validators(self, etag, stat.st_mtime, cache_control, vary)
+        self.end_headers()
+        self.send_file_body(file_to_serve, 0, size)
+
+    def serve_ranges(self, file_to_serve, stat, content_type, ranges, etag, cache_control, vary):
+        size = stat.st_size
+        if not ranges:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            self.send_response(206)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            self.send_header("Content-Length", str(end - start + 1))
+            self.send_header("Accept-Ranges", "bytes")
+            http_cache.send_validators(self, etag, stat.st_mtime, cache_control, vary)
+            self.end_headers()
+            self.send_file_body(file_to_serve, start, end - start + 1)
+            return
+
+        multipart = byte_ranges.MultipartRanges(ranges, size, content_type)
+        self.send_response(206)
+        self.send_header("Content-Type", multipart.content_type)
+        self.send_header("Content-Length", str(multipart.content_length))
+        self.send_header("Accept-Ranges", "bytes")
+        http_cache.send_validators(self, etag, stat.st_mtime, cache_control, vary)
+        self.end_headers()
+        try:
+            with open(file_to_serve, 'rb') as f:
+                for head, offset, length in multipart.parts:
+                    self.wfile.write(head)
+                    file_transfer.send_file_range(self, f, offset, length)
+                self.wfile.write(multipart.tail)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def serve_compressed(self, file_to_serve, stat, content_type, variant, etag, cache_control):
+        coding, sibling = variant
+        data = None if sibling else COMPRESSION_CACHE.get(file_to_serve, coding, stat)
+        length = os.path.getsize(sibling) if sibling else len(data)
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Encoding", coding)
+        self.send_header("Content-Length", str(length))
+        http_cache.send_validators(self, etag, stat.st_mtime, cache_control, "Accept-Encoding")
         self.end_headers()
-        with open(file_to_serve, 'rb') as f:
-            shutil.copyfileobj(f, self.wfile)
+        if sibling:
+            self.send_file_body(sibling, 0, length)
+        else:
+            self.wfile.write(data)
+
+    def send_file_body(self, file_to_serve, offset, length):
+        try:
+            with open(file_to_serve, 'rb') as f:
+                file_transfer.send_file_range(self, f, offset, length)
+        except (BrokenPipeError, ConnectionResetError):
+            # Players abort range requests all the time when seeking
+            self.close_connection = True
 
     def do_POST(self):
         try:
             parsed = urlparse(self.path)
-            if parsed.path == "/api/upload": api_handlers.handle_upload(self, parsed, UPLOAD_ROOT, safe_join)
+            if parsed.path == "/api/upload": api_handlers.handle_upload(self, parsed, UPLOAD_ROOT, safe_join, MAX_UPLOAD_FILE, MAX_UPLOAD_REQUEST)
+            elif parsed.path == "/api/upload/session": api_handlers.handle_upload_session(self, parsed, UPLOAD_ROOT, safe_join, UPLOAD_SESSIONS)
+            elif parsed.path == "/api/upload/finalize": api_handlers.handle_upload_finalize(self, UPLOAD_SESSIONS)
+            elif parsed.path == "/api/upload/abort": api_handlers.handle_upload_abort(self, UPLOAD_SESSIONS)
             elif parsed.path == "/api/mkdir": api_handlers.handle_mkdir(self, UPLOAD_ROOT, safe_join)
-            elif parsed.path == "/api/delete": api_handlers.handle_delete(self, UPLOAD_ROOT, RECYCLE_BIN, safe_join)
-            elif parsed.path == "/api/rename": api_handlers.handle_rename(self, UPLOAD_ROOT, safe_join)
+            elif parsed.path == "/api/delete": api_handlers.handle_delete(self, UPLOAD_ROOT, RECYCLE_BIN, safe_join, COMMENTS)
+            elif parsed.path == "/api/rename": api_handlers.handle_rename(self, UPLOAD_ROOT, safe_join, COMMENTS)
             elif parsed.path == "/api/save_json": api_handlers.handle_save_json(self, UPLOAD_ROOT, safe_join)
-            elif parsed.path == "/api/batch_delete": api_handlers.handle_batch_delete(self, UPLOAD_ROOT, RECYCLE_BIN, safe_join)
-            elif parsed.path == "/api/zip": api_handlers.handle_zip(self, parsed, UPLOAD_ROOT, safe_join)
-            elif parsed.path == "/api/restore": api_handlers.handle_restore(self, UPLOAD_ROOT, RECYCLE_BIN, safe_join)
-            elif parsed.path == "/api/purge": api_handlers.handle_purge(self, RECYCLE_BIN)
-            elif parsed.path == "/api/comments": api_handlers.handle_comments(self, parsed)
+            elif parsed.path == "/api/batch_delete": api_handlers.handle_batch_delete(self, UPLOAD_ROOT, RECYCLE_BIN, safe_join, COMMENTS)
+            elif parsed.path == "/api/zip": self.run_heavy(api_handlers.handle_zip, self, parsed, UPLOAD_ROOT, safe_join, CONFIG["zip_level"], ZIP_POOL, ZIP_CACHE, INTERNAL_FOLDERS)
+            elif parsed.path == "/api/restore": api_handlers.handle_restore(self, UPLOAD_ROOT, RECYCLE_BIN, safe_join, COMMENTS)
+            elif parsed.path == "/api/purge": api_handlers.handle_purge(self, RECYCLE_BIN, COMMENTS)
+            elif parsed.path == "/api/comments": api_handlers.handle_comments(self, parsed, COMMENTS)
             elif parsed.path == "/api/collaborative/save": api_handlers.handle_collaborative_save(self, COLLAB_MANAGER)
-            else: self.send_error(404)
+            else:
+                # The body was never read, so this connection can't carry another request
+                self.close_connection = True
+                self.send_error(404)
         except Exception as e:
             print(f"[{time.strftime('%H:%M:%S')}] POST Error: {e}")
+            self.close_connection = True
             self.send_error(500, f"Internal Server Error: {e}")
 
-class ThreadedHTTPServer(ThreadingMixIn, HTTPServer): pass
+    def do_PUT(self):
+        try:
+            parsed = urlparse(self.path)
+            if parsed.path == "/api/upload/chunk": api_handlers.handle_upload_chunk(self, parsed, UPLOAD_SESSIONS)
+            else:
+                self.close_connection = True
+                self.send_error(404)
+        except Exception as e:
+            print(f"[{time.strftime('%H:%M:%S')}] PUT Error: {e}")
+            self.close_connection = True
+            self.send_error(500, f"Internal Server Error: {e}")
+
+class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
+    def process_request_thread(self, request, client_address):
+        handler = None
+        try:
+            handler = self.RequestHandlerClass(request, client_address, self)
+        except Exception:
+            self.handle_error(request, client_address)
+        # A detached connection (an /api/events stream) now belongs to the event hub
+        if not getattr(handler, "detached", False):
+            self.shutdown_request(request)
+
+def start_background_services():
+    """Threads every serving process needs (started after the fork in prefork mode)"""
+    fs_events.start_watcher(UPLOAD_ROOT, exclude=INTERNAL_FOLDERS)
+    SEARCH_INDEX.start()
+    FOLDER_TREE.start()
+    DERIVATIVES.start()
+    SYSINFO.start()
+    EVENTS.start()
+
+def create_server(mode, address, reuse_port=False):
+    if mode == "async":
+        return async_server.AsyncHTTPServer(address, FileServerHandler, CONFIG["async_workers"], CONFIG["idle_timeout"], reuse_port)
+    if mode == "pool":
+        server_class = prefork.reuse_port(worker_pool.PooledHTTPServer) if reuse_port else worker_pool.PooledHTTPServer
+        return server_class(address, FileServerHandler, CONFIG["pool_workers"], CONFIG["pool_queue"],
+                            CONFIG["per_ip_limit"], CONFIG["heavy_limit"], CONFIG["retry_after"])
+    server_class = prefork.reuse_port(ThreadedHTTPServer) if reuse_port else ThreadedHTTPServer
+    return server_class(address, FileServerHandler)
 
 if __name__ == "__main__":
     HOST, PORT = "0.0.0.0", CONFIG["port"]
-    server = ThreadedHTTPServer((HOST, PORT), FileServerHandler)
+    mode = CONFIG["server_mode"]
+    use_prefork = mode == "prefork" and prefork.supported()
+    if mode == "prefork" and not use_prefork:
+        print(f"[{time.strftime('%H:%M:%S')}] Prefork needs fork() and SO_REUSEPORT, falling back to {CONFIG['prefork_engine']} mode")
+        mode = CONFIG["prefork_engine"]
+    # In prefork mode each worker binds its own socket after the fork
+    server = None if use_prefork else create_server(mode, (HOST, PORT))
     url = f"http://{get_local_ip()}:{PORT}"
     generate_qr_file(url, os.path.join(UPLOAD_ROOT, "qr.png"))
     print(f"[{time.strftime('%H:%M:%S')}] Server started at {url}")
@@ -204,7 +429,13 @@ if __name__ == "__main__":
 
     sys.stdout.flush()
     try:
-        server.serve_forever()
+        if use_prefork:
+            workers = CONFIG["prefork_workers"] or os.cpu_count() or 1
+            prefork.Supervisor(lambda: create_server(CONFIG["prefork_engine"], (HOST, PORT), reuse_port=True), workers,
+                               on_worker_start=start_background_services).run()
+        else:
+            start_background_services()
+            server.serve_forever()
     except KeyboardInterrupt:
         pass
     finally:
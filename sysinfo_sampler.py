@@ -0,0 +1,133 @@
+"""
+System Metrics Sampler
+One background thread samples CPU, RAM, disk, network throughput and this
+server process's own usage every few seconds into a ring buffer. /api/sysinfo
+serves the latest snapshot (no psutil or disk calls per request, however many
+tabs are polling) and /api/sysinfo/history the buffer, for sparklines.
+CPU percentages are measured over the fixed sampling interval, so they mean
+the same thing on every read.
+"""
+
+import time
+import shutil
+import platform
+import threading
+from collections import deque
+
+import psutil
+
+FIRST_WINDOW = 0.2  # seconds the first snapshot's CPU figures are measured over
+
+class SystemSampler:
+    def __init__(self, root, interval=5, history=720):
+        self.root = root
+        self.interval = max(1, interval)
+        self.samples = deque(maxlen=max(1, history))
+        self.lock = threading.Lock()
+        self.subscribers = []
+        self.process = psutil.Process()
+        self.last_net = None
+        self.started = False
+
+    def subscribe(self, callback):
+        """callback(snapshot) after every background sample, on the sampler thread"""
+        self.subscribers.append(callback)
+
+    def sample(self):
+        now = time.time()
+        total, used, free = shutil.disk_usage(self.root)
+        ram = psutil.virtual_memory()
+        net = psutil.net_io_counters()
+        sent = recv = 0
+        if self.last_net and net:
+            elapsed = max(now - self.last_net[0], 1e-3)
+            sent = max(0, net.bytes_sent - self.last_net[1]) / elapsed
+            recv = max(0, net.bytes_recv - self.last_net[2]) / elapsed
+        if net:
+            self.last_net = (now, net.bytes_sent, net.bytes_recv)
+        with self.process.oneshot():
+            proc = {
+                "pid": self.process.pid,
+                "cpu": round(self.process.cpu_percent(None), 1),
+                "rss": self.process.memory_info().rss,
+                "threads": self.process.num_threads(),
+            }
+            if hasattr(self.process, "num_fds"):
+                proc["fds"] = self.process.num_fds()
+        return {
+            "ts": round(now, 3),
+            "time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now)),
+            "os": platform.system(),
+            "cpu": psutil.cpu_percent(None),
+            "ram": ram.percent,
+            "ram_used": ram.used,
+            "ram_total": ram.total,
+            "disk": {"total": total, "used": used, "free": free, "percent": round((used / total) * 100, 1)},
+            "net": {"sent_per_s": round(sent), "recv_per_s": round(recv)},
+            "process": proc,
+        }
+
+    def _record(self):
+        snapshot = self.sample()
+        with self.lock:
+            self.samples.append(snapshot)
+
+    def _run(self):
+        next_at = time.time()
+        while True:
+            next_at += self.interval
+            time.sleep(max(0, next_at - time.time()))
+            try:
+                self._record()
+            except Exception as e:
+                print(f"[{time.strftime('%H:%M:%S')}] System sample failed: {e}")
+                continue
+            snapshot = self.samples[-1]
+            for callback in list(self.subscribers):
+                try:
+                    callback(snapshot)
+                except Exception as e:
+                    print(f"[{time.strftime('%H:%M:%S')}] sysinfo subscriber failed: {e}")
+
+    def latest(self):
+        """The most recent snapshot (None if the sampler is running but no sample has succeeded yet)"""
+        with self.lock:
+            # Once started, only the sampler thread samples: another caller would reset the CPU baseline
+            if self.started:
+                return self.samples[-1] if self.samples else None
+            if self.samples and time.time() - self.samples[-1]["ts"] < self.interval:
+                return self.samples[-1]
+        self._record()  # sampler not running (tools, tests): sample on demand, at most once per interval
+        with self.lock:
+            return self.samples[-1]
+
+    def history(self, since=0):
+        """Samples newer than `since` (epoch seconds) as {"interval", field: [values]}"""
+        with self.lock:
+            rows = [s for s in self.samples if s["ts"] > since]
+        return {
+            "interval": self.interval,
+            "ts": [s["ts"] for s in rows],
+            "cpu": [s["cpu"] for s in rows],
+            "ram": [s["ram"] for s in rows],
+            "disk": [s["disk"]["percent"] for s in rows],
+            "net_sent": [s["net"]["sent_per_s"] for s in rows],
+            "net_recv": [s["net"]["recv_per_s"] for s in rows],
+            "proc_cpu": [s["process"]["cpu"] for s in rows],
+            "proc_rss": [s["process"]["rss"] for s in rows],
+        }
+
+    def start(self):
+        if self.started:
+            return
+        # The first cpu_percent(None) call only sets the baseline: measure a short window for the
+        # first snapshot, so the buffer is never empty once requests are served
+        psutil.cpu_percent(None)
+        self.process.cpu_percent(None)
+        time.sleep(FIRST_WINDOW)
+        try:
+            self._record()
+        except Exception as e:
+            print(f"[{time.strftime('%H:%M:%S')}] System sample failed: {e}")
+        self.started = True
+        threading.Thread(target=self._run, name="sysinfo", daemon=True).start()
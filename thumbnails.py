@@ -0,0 +1,224 @@
+"""
+Thumbnails
+Small WebP/JPEG previews for the file grid, so it doesn't pull 20 MB originals
+just to draw a tile. Thumbnails are made with Pillow at a few standard sizes
+on a small background pool (concurrent requests for the same one share a
+single job) and kept in a hidden cache folder keyed by path, mtime and size.
+The cache is bounded by total size, least recently used first.
+
+PDFs get a first-page thumbnail when pypdfium2 is installed, HEIC photos when
+pillow-heif is.
+"""
+
+import os
+import time
+import uuid
+import hashlib
+import threading
+from concurrent import futures
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:
+    Image = None
+
+try:
+    import pillow_heif
+    pillow_heif.register_heif_opener()
+except ImportError:
+    pillow_heif = None
+
+try:
+    import pypdfium2
+except ImportError:
+    pypdfium2 = None
+
+SIZES = {"small": 128, "medium": 256, "large": 512}  # pixels on the long edge
+IMAGE_EXTENSIONS = {"jpg", "jpeg", "png", "gif", "webp", "bmp", "tif", "tiff"}
+if pillow_heif:
+    IMAGE_EXTENSIONS |= {"heic", "heif"}
+
+def extension(path):
+    return os.path.splitext(path)[1][1:].lower()
+
+def supported(path):
+    if Image is None:
+        return False
+    ext = extension(path)
+    return ext in IMAGE_EXTENSIONS or (ext == "pdf" and pypdfium2 is not None)
+
+def webp_available():
+    return Image is not None and features.check("webp")
+
+def _load(src, px):
+    """Decode `src` as an upright image no larger than px x px"""
+    if extension(src) == "pdf":
+        pdf = pypdfium2.PdfDocument(src)
+        try:
+            page = pdf[0]
+            img = page.render(scale=px / max(page.get_size())).to_pil()
+        finally:
+            pdf.close()
+    else:
+        with Image.open(src) as original:
+            # JPEG can decode at 1/2, 1/4 or 1/8 scale directly: far less work for big photos
+            original.draft("RGB", (px * 2, px * 2))
+            img = ImageOps.exif_transpose(original)
+            img.thumbnail((px, px))
+    img.thumbnail((px, px))
+    return img
+
+def render(src, dest, px, fmt):
+    """Write a thumbnail of `src` no larger than px x px to `dest`"""
+    img = _load(src, px)
+    if fmt == "jpeg" and img.mode not in ("RGB", "L"):
+        img = img.convert("RGBA") if img.mode != "RGBA" else img
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        img = background
+    elif fmt == "webp" and img.mode not in ("RGB", "RGBA", "L"):
+        img = img.convert("RGBA")
+    tmp = f"{dest}.{uuid.uuid4().hex}.tmp"
+    if fmt == "webp":
+        img.save(tmp, "WEBP", quality=80, method=4)
+    else:
+        img.save(tmp, "JPEG", quality=82, optimize=True, progressive=True)
+    os.replace(tmp, dest)
+
+class ThumbnailCache:
+    def __init__(self, cache_dir, max_bytes, workers=2):
+        self.dir = cache_dir
+        self.max_bytes = max_bytes
+        self.pool = futures.ThreadPoolExecutor(workers, thread_name_prefix="thumb")
+        self.lock = threading.Lock()
+        self.inflight = {}  # cache path -> Future, so one job serves every concurrent request
+        self.failed = set()  # cache paths whose source couldn't be decoded
+        self.total = None  # bytes on disk, scanned lazily
+        self.foreground = 0  # pool jobs started for visitors (not pre-warming)
+
+    def path_for(self, abs_path, st, px, fmt):
+        key = hashlib.sha1(f"{abs_path}\0{st.st_mtime_ns}\0{st.st_size}\0{px}".encode("utf-8", "surrogateescape")).hexdigest()
+        return os.path.join(self.dir, key[:2], f"{key}.{'webp' if fmt == 'webp' else 'jpg'}")
+
+    def lookup(self, abs_path, st, px, fmt):
+        """Path of an existing thumbnail (marking it recently used), or None"""
+        path = self.path_for(abs_path, st, px, fmt)
+        try:
+            os.utime(path)
+            return path
+        except OSError:
+            return None
+
+    def submit(self, abs_path, st, px, fmt):
+        """
+        Queue generation unless it's cached, running or known to fail.
+        Returns:
+            Future or None: resolves to the thumbnail path (or None on failure)
+        """
+        dest = self.path_for(abs_path, st, px, fmt)
+        with self.lock:
+            if dest in self.failed or os.path.exists(dest):
+                return None
+            future = self.inflight.get(dest)
+            if future is not None:
+                return future
+            future = self.inflight[dest] = self.pool.submit(self._generate, abs_path, dest, px, fmt)
+            self.foreground += 1
+        # Outside the lock: the callback runs right here if the job is already done
+        future.add_done_callback(self._foreground_done)
+        return future
+
+    def _foreground_done(self, future):
+        with self.lock:
+            self.foreground -= 1
+
+    def get(self, abs_path, st, px, fmt, timeout=30):
+        """
+        Thumbnail path for a source file, generating it if needed.
+        Returns:
+            str or None: None when the file can't be thumbnailed
+        Raises:
+            TimeoutError: Generation is still queued/running
+        """
+        path = self.lookup(abs_path, st, px, fmt)
+        if path:
+            return path
+        future = self.submit(abs_path, st, px, fmt)
+        if future is None:
+            return self.lookup(abs_path, st, px, fmt)
+        try:
+            return future.result(timeout)
+        except futures.TimeoutError:
+            raise TimeoutError("Thumbnail still being generated")
+
+    def ensure(self, abs_path, st, px, fmt):
+        """
+        Generate a thumbnail in the calling thread (background pre-warming).
+        Requests that arrive meanwhile wait on this job instead of starting their own.
+        """
+        dest = self.path_for(abs_path, st, px, fmt)
+        with self.lock:
+            if dest in self.failed or dest in self.inflight or os.path.exists(dest):
+                return
+            future = self.inflight[dest] = futures.Future()
+        future.set_result(self._generate(abs_path, dest, px, fmt))
+
+    def busy(self):
+        """True while thumbnails are being generated for visitors (pre-warming jobs don't count)"""
+        return self.foreground > 0
+
+    def _generate(self, src, dest, px, fmt):
+        try:
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            render(src, dest, px, fmt)
+            size = os.path.getsize(dest)
+        except Exception as e:
+            print(f"[{time.strftime('%H:%M:%S')}] Thumbnail failed for {os.path.basename(src)}: {e}")
+            with self.lock:
+                if len(self.failed) > 10000: self.failed.clear()
+                self.failed.add(dest)
+            return None
+        finally:
+            with self.lock:
+                self.inflight.pop(dest, None)
+        # Pool threads and pre-warming finish concurrently: the running total is shared
+        with self.lock:
+            fits = self.total is not None and self.total + size <= self.max_bytes
+            if fits:
+                self.total += size
+        if not fits:
+            self.evict(keep=dest)
+        return dest
+
+    def evict(self, keep=None):
+        """Drop least recently used thumbnails (other than `keep`) until the cache fits max_bytes"""
+        files, total = [], 0
+        for root, _, names in os.walk(self.dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if name.endswith(".tmp"):
+                    if st.st_mtime < time.time() - 3600:
+                        try: os.remove(path)
+                        except OSError: pass
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        if total > self.max_bytes:
+            # Evict down to 90% so we don't rescan on every new thumbnail
+            files.sort()
+            for _, size, path in files:
+                if total <= self.max_bytes * 0.9:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+        with self.lock:
+            self.total = total
@@ -0,0 +1,230 @@
+"""
+Worker Pool HTTP Server
+Fixed-size thread pool with a bounded accept queue and per-client limits,
+used instead of ThreadingMixIn's unbounded thread-per-connection.
+When the pool is saturated new connections get an immediate 503 with
+Retry-After rather than queueing without bound.
+Workers hold a connection only while a request is being served: between
+requests an idle keep-alive connection is parked on a selector and goes
+back into the queue when its next request arrives, so open browser tabs
+don't pin workers.
+"""
+
+import os
+import time
+import queue
+import socket
+import selectors
+import threading
+from collections import defaultdict
+from http.server import HTTPServer
+
+class PooledHTTPServer(HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, server_address, RequestHandlerClass, workers=16, queue_size=64,
+                 per_ip_limit=32, heavy_limit=4, retry_after=2):
+        super().__init__(server_address, RequestHandlerClass)
+        self.workers = workers
+        self.per_ip_limit = per_ip_limit
+        self.retry_after = retry_after
+        self.queue = queue.Queue(maxsize=queue_size)
+        # Slots for expensive endpoints (zip, search, ...) so they can't take every worker
+        self.heavy_limit = heavy_limit
+        self.heavy_slots = threading.BoundedSemaphore(heavy_limit)
+
+        self.lock = threading.Lock()
+        self.per_ip = defaultdict(int)  # ip -> connections queued or in service
+        self.busy = 0
+        self.counters = {"accepted": 0, "rejected_full": 0, "rejected_ip": 0, "rejected_heavy": 0, "completed": 0}
+        self.started = time.time()
+
+        # Idle keep-alive connections wait here, without a worker, for their next request
+        self.idle_timeout = getattr(RequestHandlerClass, "timeout", None) or 60
+        self.selector = selectors.DefaultSelector()
+        self.to_park = []
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self.selector.register(self._wake_r, selectors.EVENT_READ)
+        threading.Thread(target=self._idle_loop, name="http-idle", daemon=True).start()
+
+        self.threads = []
+        for i in range(workers):
+            t = threading.Thread(target=self._worker, name=f"http-worker-{i}", daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    def process_request(self, request, client_address):
+        """Runs on the accept thread: admit into the queue or reject straight away"""
+        ip = client_address[0]
+        with self.lock:
+            if self.per_ip[ip] >= self.per_ip_limit:
+                self.counters["rejected_ip"] += 1
+                reject = True
+            else:
+                self.per_ip[ip] += 1
+                reject = False
+        if reject:
+            self._reject(request)
+            return
+
+        try:
+            self.queue.put_nowait((request, client_address, None))
+        except queue.Full:
+            with self.lock:
+                self._release_ip(ip)
+                self.counters["rejected_full"] += 1
+            self._reject(request)
+            return
+        with self.lock:
+            self.counters["accepted"] += 1
+
+    def _reject(self, request):
+        response = (
+            "HTTP/1.1 503 Service Unavailable\r\n"
+            f"Retry-After: {self.retry_after}\r\n"
+            "Content-Type: text/plain\r\n"
+            "Content-Length: 12\r\n"
+            "Connection: close\r\n\r\n"
+            "Server busy\n"
+        ).encode()
+        try:
+            request.settimeout(1)
+            request.sendall(response)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def _release_ip(self, ip):
+        self.per_ip[ip] -= 1
+        if self.per_ip[ip] <= 0:
+            del self.per_ip[ip]
+
+    def _make_handler(self, request, client_address):
+        # Built by hand: BaseRequestHandler.__init__ would serve the whole connection in one go
+        handler = self.RequestHandlerClass.__new__(self.RequestHandlerClass)
+        handler.request = request
+        handler.client_address = client_address
+        handler.server = self
+        handler.directory = os.getcwd()
+        handler.setup()
+        handler.close_connection = True
+        return handler
+
+    def _buffered(self, handler):
+        """True if the next request has already arrived (pipelined, or read ahead into rfile)"""
+        handler.connection.settimeout(0)
+        try:
+            return bool(handler.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            handler.connection.settimeout(handler.timeout)
+
+    def _close(self, request, client_address, handler):
+        try:
+            if handler:
+                handler.finish()
+        except OSError:
+            pass
+        self.shutdown_request(request)
+        with self.lock:
+            self._release_ip(client_address[0])
+
+    def _worker(self):
+        while True:
+            request, client_address, handler = self.queue.get()
+            keep = False
+            with self.lock:
+                self.busy += 1
+            try:
+                if handler is None:
+                    handler = self._make_handler(request, client_address)
+                while True:
+                    handler.handle_one_request()
+                    keep = not handler.close_connection
+                    if not keep or not self._buffered(handler):
+                        break
+            except Exception:
+                keep = False
+                self.handle_error(request, client_address)
+            finally:
+                with self.lock:
+                    self.busy -= 1
+                    self.counters["completed"] += 1
+            if getattr(handler, "detached", False):
+                # The connection was handed on (an /api/events stream): just stop counting it
+                with self.lock:
+                    self._release_ip(client_address[0])
+            elif keep:
+                self._park(request, client_address, handler)
+            else:
+                self._close(request, client_address, handler)
+
+    # ===== Idle keep-alive connections =====
+
+    def _park(self, request, client_address, handler):
+        with self.lock:
+            self.to_park.append((request, client_address, handler))
+        self._wake_w.send(b"x")
+
+    def _idle_loop(self):
+        while True:
+            for key, _ in self.selector.select(timeout=1):
+                if key.fileobj is self._wake_r:
+                    try:
+                        while self._wake_r.recv(4096): pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                # Readable: the next request (or EOF) is here, a worker takes it from the head
+                self.selector.unregister(key.fileobj)
+                request, client_address, handler, _ = key.data
+                try:
+                    self.queue.put_nowait((request, client_address, handler))
+                except queue.Full:
+                    with self.lock:
+                        self.counters["rejected_full"] += 1
+                        self._release_ip(client_address[0])
+                    self._reject(request)
+
+            with self.lock:
+                parking, self.to_park = self.to_park, []
+            now = time.monotonic()
+            for request, client_address, handler in parking:
+                try:
+                    self.selector.register(request, selectors.EVENT_READ, (request, client_address, handler, now))
+                except (OSError, ValueError):
+                    self._close(request, client_address, handler)
+            # Close connections that stayed silent for idle_timeout
+            for key in list(self.selector.get_map().values()):
+                if key.data and now - key.data[3] > self.idle_timeout:
+                    self.selector.unregister(key.fileobj)
+                    self._close(*key.data[:3])
+
+    def try_heavy(self):
+        """Claim a slot for an expensive endpoint; False means answer 503"""
+        if self.heavy_slots.acquire(blocking=False):
+            return True
+        with self.lock:
+            self.counters["rejected_heavy"] += 1
+        return False
+
+    def release_heavy(self):
+        self.heavy_slots.release()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "mode": "pool",
+                "workers": self.workers,
+                "busy": self.busy,
+                "utilisation": round(self.busy / self.workers * 100, 1),
+                "queued": self.queue.qsize(),
+                "queue_size": self.queue.maxsize,
+                "idle_connections": len(self.selector.get_map()) - 1,
+                "clients": len(self.per_ip),
+                "heavy_limit": self.heavy_limit,
+                "uptime": round(time.time() - self.started),
+                **self.counters
+            }
@@ -0,0 +1,113 @@
+"""
+Zip Archive Cache
+Finished /api/zip archives kept on disk, keyed by the manifest ETag of the
+files they contain and how they are compressed (see zip_stream.manifest_etag), so a repeat download of an
+unchanged folder is a plain sendfile with Range support instead of a rebuild.
+Archives are written to the cache while they stream to the first client.
+The folder is bounded in size; the least recently served archives go first
+(each hit touches the file's mtime, so this works across prefork workers).
+"""
+
+import os
+import time
+import uuid
+import threading
+
+class ZipCache:
+    def __init__(self, cache_dir, max_bytes):
+        self.dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+    def path_for(self, etag):
+        return os.path.join(self.dir, etag.strip('"').replace("zip-", "") + ".zip")
+
+    def lookup(self, etag):
+        """Path of the cached archive for this manifest, or None"""
+        if not self.max_bytes:
+            return None
+        path = self.path_for(etag)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def writer(self, etag, out):
+        """A Tee that sends to `out` and records into the cache, or None when caching is off"""
+        if not self.max_bytes:
+            return None
+        os.makedirs(self.dir, exist_ok=True)
+        return Tee(self, etag, out)
+
+    def commit(self, tmp, etag):
+        os.replace(tmp, self.path_for(etag))
+        self.evict()
+
+    def evict(self):
+        """Drop least recently used archives (and abandoned temp files) until under the size limit"""
+        with self.lock:
+            files, total = [], 0
+            for entry in os.scandir(self.dir):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                if entry.name.endswith(".tmp"):
+                    if st.st_mtime < time.time() - 3600:
+                        try: os.remove(entry.path)
+                        except OSError: pass
+                    continue
+                files.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+            files.sort()
+            for _, size, path in files:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+
+class Tee:
+    """
+    Writes an archive to the client and to a cache temp file. If the client
+    goes away the archive is still finished into the cache, so the retry (or
+    Range resume) is served from disk; it is dropped once it outgrows the cache.
+    """
+
+    def __init__(self, cache, etag, out):
+        self.cache, self.etag, self.out = cache, etag, out
+        self.tmp = os.path.join(cache.dir, f"{uuid.uuid4().hex}.tmp")
+        self.file = open(self.tmp, "wb")
+        self.size = 0
+        self.client_gone = False
+
+    def write(self, data):
+        if self.file:
+            self.size += len(data)
+            if self.size > self.cache.max_bytes:
+                self.discard()
+            else:
+                self.file.write(data)
+        if not self.client_gone:
+            try:
+                self.out.write(data)
+            except OSError:
+                self.client_gone = True
+        if self.client_gone and not self.file:
+            raise ConnectionResetError("Client disconnected")
+
+    def commit(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+            self.cache.commit(self.tmp, self.etag)
+
+    def discard(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+            try: os.remove(self.tmp)
+            except OSError: pass
@@ -0,0 +1,262 @@
+"""
+Streaming ZIP Writer
+Writes archives straight to a non-seekable response: every entry carries a
+data descriptor, so nothing has to be rewound. Already-compressed media is
+STORED, everything else is deflated at a configurable level, and ZIP64
+records are used once an entry or the archive passes 4 GB. When every entry
+is stored the exact archive size is known before the first byte is read, so
+the download gets a Content-Length and can be resumed with a Range request.
+"""
+
+import os
+import time
+import zlib
+import struct
+import hashlib
+from collections import deque
+
+BUFFER_SIZE = 1024 * 1024
+ZIP64_LIMIT = 0xFFFFFFFF
+STORED, DEFLATED = 0, 8
+
+# Formats that are already compressed: deflating them burns CPU for ~0% gain
+STORED_EXTENSIONS = {
+    "jpg", "jpeg", "png", "gif", "webp", "avif", "heic", "heif",
+    "mp4", "m4v", "mkv", "mov", "avi", "webm", "wmv", "flv", "3gp",
+    "mp3", "m4a", "aac", "ogg", "opus", "flac", "wma",
+    "zip", "gz", "tgz", "bz2", "xz", "7z", "rar", "zst", "br", "lz4",
+    "docx", "xlsx", "pptx", "odt", "ods", "odp", "epub", "apk", "jar", "woff", "woff2",
+}
+
+LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+DESCRIPTOR = struct.Struct("<IIII")
+DESCRIPTOR64 = struct.Struct("<IIQQ")
+END_RECORD = struct.Struct("<IHHHHIIH")
+END_RECORD64 = struct.Struct("<IQHHIIQQQQ")
+END_LOCATOR64 = struct.Struct("<IIQI")
+
+FLAGS = 0x08 | 0x800  # sizes/CRC follow the data, names are UTF-8
+MADE_BY = (3 << 8) | 45  # Unix attributes, spec 4.5 (ZIP64)
+
+def dos_time(mtime):
+    t = time.localtime(min(max(mtime, 315532800), 4354819199))  # 1980..2107
+    return (t.tm_hour << 11 | t.tm_min << 5 | t.tm_sec // 2,
+            (t.tm_year - 1980) << 9 | t.tm_mon << 5 | t.tm_mday)
+
+def collect(roots, exclude=()):
+    """
+    Files to archive, in archive order.
+    Args:
+        roots: [(abs_path, base_dir)] - a file or folder, and the folder arcnames are relative to
+        exclude: Folder names never descended into
+    Returns:
+        list: [(abs_path, arcname, stat)]
+    """
+    entries = []
+    for abs_path, base in roots:
+        if os.path.isfile(abs_path):
+            paths = [abs_path]
+        elif os.path.isdir(abs_path):
+            paths = []
+            for root, dirs, files in os.walk(abs_path):
+                dirs[:] = [d for d in dirs if d not in exclude]
+                paths.extend(os.path.join(root, f) for f in files)
+        else:
+            continue
+        for full in paths:
+            try:
+                st = os.stat(full)
+            except OSError:
+                continue
+            entries.append((full, os.path.relpath(full, base).replace(os.sep, "/"), st))
+    return entries
+
+def manifest_etag(entries, level, pooled=False):
+    """
+    Strong validator for the archive these entries produce: changes when any
+    file is added, removed or touched. Also the archive's zip_cache key.
+    `pooled` is whether add_files() gets a pool: block-wise deflate produces
+    different bytes than one compressor per file (the block size is fixed,
+    so the number of threads doesn't matter).
+    """
+    h = hashlib.sha1(f"{level}{'/pool' if pooled else ''}".encode())
+    for abs_path, arcname, st in entries:
+        h.update(f"{abs_path}\0{arcname}\0{st.st_size}\0{st.st_mtime_ns}\n".encode("utf-8", "surrogateescape"))
+    return f'"zip-{h.hexdigest()}"'
+
+def method_for(arcname, size, level):
+    ext = os.path.splitext(arcname)[1][1:].lower()
+    return STORED if level == 0 or size == 0 or ext in STORED_EXTENSIONS else DEFLATED
+
+def stored_size(entries, level):
+    """Exact archive size when every entry will be stored, else None"""
+    if any(method_for(arcname, st.st_size, level) != STORED for _, arcname, st in entries):
+        return None
+    counter = _Counter()
+    zs = ZipStream(counter, level)
+    for abs_path, arcname, st in entries:
+        zs.add_file(abs_path, arcname, st, read=False)
+    return zs.close()
+
+def read_blocks(abs_path, size, entry):
+    """Yield a file's data in BUFFER_SIZE blocks, updating entry's crc/usize. Never reads past `size`."""
+    with open(abs_path, "rb") as f:
+        # Even if the file is growing, stop at the size the archive was planned with
+        while entry["usize"] < size:
+            data = f.read(min(BUFFER_SIZE, size - entry["usize"]))
+            if not data: break
+            entry["usize"] += len(data)
+            entry["crc"] = zlib.crc32(data, entry["crc"])
+            yield data
+
+def deflate_block(data, dictionary, level, last):
+    """One independently compressed piece of a raw deflate stream (zlib releases the GIL while it works)"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=dictionary) if dictionary else zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+class _Counter:
+    def write(self, data):
+        pass
+
+class RangeWriter:
+    """Passes on only bytes [start, end] of what is written, and stops the archive once past end"""
+    class Done(Exception):
+        pass
+
+    def __init__(self, out, start, end):
+        self.out, self.start, self.end, self.pos = out, start, end, 0
+
+    def write(self, data):
+        n = len(data)
+        lo, hi = max(self.start - self.pos, 0), min(self.end + 1 - self.pos, n)
+        self.pos += n
+        if lo < hi:
+            self.out.write(data[lo:hi] if (lo, hi) != (0, n) else data)
+        if self.pos > self.end:
+            raise RangeWriter.Done()
+
+class ZipStream:
+    def __init__(self, out, level=6):
+        self.out = out
+        self.level = level
+        self.offset = 0
+        self.central = []
+
+    def _write(self, data):
+        if data:
+            self.out.write(data)
+            self.offset += len(data)
+
+    def _begin(self, entry, arcname, st, method):
+        """Write a local header, recording what the central directory needs in `entry`"""
+        name = arcname.encode("utf-8", "surrogateescape")
+        mod_time, mod_date = dos_time(st.st_mtime)
+        # Deflate can expand incompressible input slightly, so leave headroom before the limit
+        size = st.st_size
+        zip64 = size >= ZIP64_LIMIT if method == STORED else size * 1.05 + 1024 >= ZIP64_LIMIT
+        entry.update(name=name, method=method, time=(mod_time, mod_date), zip64=zip64, mode=st.st_mode, offset=self.offset)
+        extra = struct.pack("<HHQQ", 1, 16, 0, 0) if zip64 else b""
+        self._write(LOCAL_HEADER.pack(0x04034b50, 45 if zip64 else 20, FLAGS, method, mod_time, mod_date,
+                                      0, ZIP64_LIMIT if zip64 else 0, ZIP64_LIMIT if zip64 else 0,
+                                      len(name), len(extra)) + name + extra)
+
+    def _end(self, entry):
+        descriptor = DESCRIPTOR64 if entry["zip64"] else DESCRIPTOR
+        self._write(descriptor.pack(0x08074b50, entry["crc"], entry["csize"], entry["usize"]))
+        self.central.append(entry)
+
+    def add_file(self, abs_path, arcname, st, method=None, read=True):
+        """Write one entry. With read=False the data is only accounted for (size planning)."""
+        if method is None:
+            method = method_for(arcname, st.st_size, self.level)
+        entry = {"crc": 0, "csize": 0, "usize": 0}
+        self._begin(entry, arcname, st, method)
+        if read:
+            self._copy(abs_path, st.st_size, entry)
+        else:
+            entry["csize"] = entry["usize"] = st.st_size
+            self.offset += st.st_size
+        self._end(entry)
+
+    def _copy(self, abs_path, size, entry):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15) if entry["method"] == DEFLATED else None
+        for data in read_blocks(abs_path, size, entry):
+            if compressor:
+                data = compressor.compress(data)
+            entry["csize"] += len(data)
+            self._write(data)
+        if compressor:
+            data = compressor.flush()
+            entry["csize"] += len(data)
+            self._write(data)
+
+    def add_files(self, entries, pool=None, max_pending=16):
+        """
+        Write all entries, deflating on `pool` (a concurrent.futures executor) when given.
+        Files are cut into BUFFER_SIZE blocks that are compressed independently, pigz
+        style: each block is primed with the previous 32 KB as its dictionary and
+        ends on a byte-aligned sync flush, so the pieces concatenate into one
+        deflate stream. Blocks of later files are compressed while earlier ones
+        are written, and output stays in order. At most `max_pending` blocks
+        (raw plus compressed) are held in memory.
+        """
+        if pool is None:
+            for abs_path, arcname, st in entries:
+                self.add_file(abs_path, arcname, st)
+            return
+        pending = deque()  # (entry, future or None) in output order; None marks an entry's end
+
+        def flush(limit):
+            while len(pending) > limit:
+                entry, future = pending.popleft()
+                if "offset" not in entry:
+                    self._begin(entry, entry["arcname"], entry["st"], DEFLATED)
+                if future is None:
+                    self._end(entry)
+                    continue
+                data = future.result()
+                entry["csize"] += len(data)
+                self._write(data)
+
+        for abs_path, arcname, st in entries:
+            method = method_for(arcname, st.st_size, self.level)
+            if method == STORED:
+                # Nothing to compress: write everything queued so far, then copy straight through
+                flush(0)
+                self.add_file(abs_path, arcname, st, method)
+                continue
+            # Header fields are filled in by _begin() when the writer reaches this entry
+            entry = {"arcname": arcname, "st": st, "crc": 0, "csize": 0, "usize": 0}
+            previous = b""
+            blocks = read_blocks(abs_path, st.st_size, entry)
+            data = next(blocks, b"")
+            while True:
+                following = next(blocks, None)
+                pending.append((entry, pool.submit(deflate_block, data, previous, self.level, following is None)))
+                flush(max_pending)
+                if following is None: break
+                previous, data = data[-32768:], following
+            pending.append((entry, None))
+        flush(0)
+
+    def close(self):
+        """Write the central directory. Returns the total archive size."""
+        cd_offset = self.offset
+        for entry in self.central:
+            name, method, (mod_time, mod_date) = entry["name"], entry["method"], entry["time"]
+            crc, csize, usize, header_offset, mode = entry["crc"], entry["csize"], entry["usize"], entry["offset"], entry["mode"]
+            fields = [v for v in (usize, csize, header_offset) if v >= ZIP64_LIMIT]
+            extra = struct.pack(f"<HH{len(fields)}Q", 1, 8 * len(fields), *fields) if fields else b""
+            self._write(CENTRAL_HEADER.pack(0x02014b50, MADE_BY, 45 if fields else 20, FLAGS, method, mod_time, mod_date,
+                                            crc, min(csize, ZIP64_LIMIT), min(usize, ZIP64_LIMIT), len(name), len(extra),
+                                            0, 0, 0, (mode & 0xFFFF) << 16, min(header_offset, ZIP64_LIMIT)) + name + extra)
+        cd_size = self.offset - cd_offset
+        count = len(self.central)
+        if count >= 0xFFFF or cd_size >= ZIP64_LIMIT or cd_offset >= ZIP64_LIMIT:
+            end64_offset = self.offset
+            self._write(END_RECORD64.pack(0x06064b50, 44, MADE_BY, 45, 0, 0, count, count, cd_size, cd_offset))
+            self._write(END_LOCATOR64.pack(0x07064b50, 0, end64_offset, 1))
+        self._write(END_RECORD.pack(0x06054b50, 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+                                    min(cd_size, ZIP64_LIMIT), min(cd_offset, ZIP64_LIMIT), 0))
+        return self.offset